@@ -1,35 +1,105 @@
-﻿import os
+﻿import asyncio
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from typing import Optional
 
 import httpx
-from fastapi import APIRouter, Depends
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 
 from app.schemas.chat import (
     ChatMessageRequest,
     ChatMessageResponse,
     ChatHistoryResponse,
-    ChatMessage,
+    ChatReplyStatus,
 )
+from app.core.admission import CapacityExceeded
+from app.core.metrics import LLM_FALLBACKS, ML_FALLBACKS
+from app.core.rate_limit import check_rate, too_many_requests
+from app.core.responses import FastJSONResponse
 from app.core.mongo import db
 from app.core.security import get_current_user
+from app.core.tracing import span
 from app.schemas.auth import User
 from app.schemas.profile import UserProfile
+from app.services.archive import load_archived_messages
+from app.services.context_builder import build_llm_messages, update_summary
+from app.services.crisis_screener import crisis_resources, screen
+from app.services.engagement import record_activity
+from app.services.event_publisher import record_events
+from app.services.fallback_classifier import get_fallback_classifier
 from app.services.llm_client import generate_llm_reply
+from app.services.ml_engine import analyze_text
+from app.services.ml_replicas import is_replica_failure
+from app.services.task_queue import enqueue
 
 load_dotenv()
-ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://127.0.0.1:8002")
+# Total time a chat turn may take; the LLM gets whatever is left of it.
+CHAT_BUDGET_SECONDS = float(os.getenv("CHAT_BUDGET_SECONDS", "15"))
+# Kept back from the LLM so the reply can still be stored and returned.
+CHAT_REPLY_RESERVE_SECONDS = float(os.getenv("CHAT_REPLY_RESERVE_SECONDS", "0.5"))
+# Past this the local fallback classifier answers instead of the ML engine.
+ML_TIMEOUT_SECONDS = float(os.getenv("ML_TIMEOUT_SECONDS", "3"))
+# After a failed call, skip ml_service for this long before trying it again.
+ML_UNHEALTHY_COOLDOWN_SECONDS = float(os.getenv("ML_UNHEALTHY_COOLDOWN_SECONDS", "10"))
+
+# Sent at once when the crisis screener matches; the LLM reply follows via /chat/reply/{id}.
+CRISIS_REPLY = (
+    "I'm really glad you told me. What you're going through sounds very painful, and you "
+    "don't have to face it alone. If you might act on these thoughts or are in danger, please "
+    "contact one of the crisis lines below or your local emergency number right now. "
+    "I'm here with you and will reply in a moment."
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# monotonic() timestamp until which ml_service is considered down
+_ml_unhealthy_until = 0.0
+# Crisis follow-ups in flight; held so the tasks are not garbage collected.
+_crisis_tasks: set[asyncio.Task] = set()
+
+
+def local_analysis(text: str, reason: str) -> dict:
+    ML_FALLBACKS.labels(reason).inc()
+    with span("ml.fallback"):
+        result = get_fallback_classifier().analyze(text)
+    result["analysis_source"] = "fallback"
+    return result
 
 
 async def call_ml_service(text: str):
-    url = f"{ML_SERVICE_URL}/analyze"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, json={"text": text})
-        resp.raise_for_status()
-        return resp.json()
+    """
+    Analyze text with the configured ML engine (remote ml_service or the
+    embedded worker), or with the local fallback classifier when the engine
+    is marked unhealthy or misses ML_TIMEOUT_SECONDS.
+    """
+    global _ml_unhealthy_until
+    if time.monotonic() < _ml_unhealthy_until:
+        return local_analysis(text, "unhealthy")
+
+    try:
+        result = await analyze_text(text, ML_TIMEOUT_SECONDS)
+    except CapacityExceeded:
+        # Busy, not broken: shed this call without marking the engine unhealthy.
+        return local_analysis(text, "overloaded")
+    except Exception as e:
+        # Only outages (transport errors, timeouts, 5xx) bench the engine for
+        # everyone; a 4xx caused by this request falls back for this call alone.
+        if is_replica_failure(e) or isinstance(e, BrokenProcessPool):
+            _ml_unhealthy_until = time.monotonic() + ML_UNHEALTHY_COOLDOWN_SECONDS
+        logger.warning("ML service error, using fallback classifier: %r", e)
+        timed_out = isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError))
+        return local_analysis(text, "timeout" if timed_out else "error")
+    result["analysis_source"] = "ml_service"
+    return result
 
 
 async def get_profile_for_user(user_id: str) -> Optional[UserProfile]:
@@ -48,29 +118,24 @@ async def get_profile_for_user(user_id: str) -> Optional[UserProfile]:
     )
 
 
-@router.post("/message", response_model=ChatMessageResponse)
-async def send_message(
-    payload: ChatMessageRequest,
-    current_user: User = Depends(get_current_user),
-):
-    user_id = current_user.id
-    user_msg = payload.message
-    now = datetime.utcnow()
-
-    await db.chat_messages.insert_one(
-        {
-            "user_id": user_id,
-            "sender": "user",
-            "text": user_msg,
-            "created_at": now,
-        }
-    )
+async def persist_reply(doc: dict):
+    """Background job: store the assistant message, then refresh the rolling summary."""
+    try:
+        await db.chat_messages.insert_one(doc)
+    except DuplicateKeyError:
+        pass  # already stored by an earlier attempt
+    await record_events("chat_messages", [doc])
+    await update_summary(doc["user_id"])
 
-    ml_result = await call_ml_service(user_msg)
 
-    profile = await get_profile_for_user(user_id)
-    messages_count = await db.chat_messages.count_documents({"user_id": user_id})
+async def load_chat_context(user_id: str) -> tuple[Optional[UserProfile], int]:
+    with span("chat.load_profile"):
+        profile = await get_profile_for_user(user_id)
+        messages_count = await db.chat_messages.count_documents({"user_id": user_id})
+    return profile, messages_count
+
 
+def build_system_prompt(profile: Optional[UserProfile], messages_count: int, ml_result: dict) -> str:
     # Build system prompt with personalization and stress context
     display_name = profile.display_name if profile else None
     user_goal = profile.goal if profile else None
@@ -103,65 +168,173 @@ async def send_message(
     else:
         initial_personalization += "User is calm. Encourage progress toward their goal."
 
-    system_prompt = system_prompt + "\n" + initial_personalization
+    return system_prompt + "\n" + initial_personalization
 
-    # Load short history (last 4 messages)
-    cursor = (
-        db.chat_messages.find({"user_id": user_id})
-        .sort("created_at", -1)
-        .limit(4)
-    )
-    last_msgs = list(reversed(await cursor.to_list(length=4)))
-    history_messages = []
-    for m in last_msgs:
-        history_messages.append(
-            {
-                "role": "assistant" if m.get("sender") == "assistant" else "user",
-                "content": m.get("text", ""),
-            }
+
+def simple_reply(ml_result: dict) -> str:
+    # Fallback, mirrors earlier rule-based replies.
+    if ml_result["risk_flag"]:
+        return (
+            "I'm really sorry that things feel so intense right now. "
+            "You're not alone. Would you like to try a short grounding exercise?"
+        )
+    if ml_result["stress_label"] == "stressed":
+        return (
+            "It sounds like you're dealing with a lot. "
+            "Thank you for sharing this with me. "
+            "Can you tell me a bit more about what's making today difficult?"
         )
+    return "Thanks for sharing. How are you feeling about this situation right now?"
 
-    llm_messages = [
-        {"role": "system", "content": system_prompt},
-        *history_messages,
-        {"role": "user", "content": user_msg},
-    ]
 
-    def simple_reply() -> str:
-        # Fallback, mirrors earlier rule-based replies.
-        if ml_result["risk_flag"]:
-            return (
-                "I'm really sorry that things feel so intense right now. "
-                "You're not alone. Would you like to try a short grounding exercise?"
-            )
-        if ml_result["stress_label"] == "stressed":
-            return (
-                "It sounds like you're dealing with a lot. "
-                "Thank you for sharing this with me. "
-                "Can you tell me a bit more about what's making today difficult?"
-            )
-        return "Thanks for sharing. How are you feeling about this situation right now?"
+async def generate_reply(
+    user_id: str,
+    user_msg: str,
+    now: datetime,
+    ml_result: dict,
+    profile: Optional[UserProfile],
+    messages_count: int,
+    deadline: float,
+    recent: Optional[list[dict]] = None,
+) -> str:
+    """LLM reply for a user message, or simple_reply() if the LLM fails or runs out of time."""
+    system_prompt = build_system_prompt(profile, messages_count, ml_result)
+
+    # Summary of older turns + as many recent turns as fit the token budget
+    llm_messages, _prompt_tokens = await build_llm_messages(
+        user_id, system_prompt, user_msg, before=now, recent=recent
+    )
 
     try:
-        ai_reply = await generate_llm_reply(llm_messages)
+        with span("llm.generate"):
+            return await generate_llm_reply(llm_messages, deadline=deadline)
     except Exception as e:
         # Log and fall back to a safe, local response
-        print("Groq error:", e)
-        ai_reply = simple_reply()
-
-    await db.chat_messages.insert_one(
-        {
-            "user_id": user_id,
-            "sender": "assistant",
-            "text": ai_reply,
-            "created_at": datetime.utcnow(),
-            "sentiment_label": ml_result["sentiment_label"],
-            "stress_label": ml_result["stress_label"],
-            "stress_score": ml_result["stress_score"],
-            "risk_flag": ml_result["risk_flag"],
-        }
+        logger.warning("Groq error: %s", e)
+        LLM_FALLBACKS.labels(getattr(e, "reason", type(e).__name__)).inc()
+        return simple_reply(ml_result)
+
+
+def assistant_message(reply_id: ObjectId, user_id: str, text: str, ml_result: dict) -> dict:
+    return {
+        "_id": reply_id,
+        "user_id": user_id,
+        "sender": "assistant",
+        "text": text,
+        "created_at": datetime.utcnow(),
+        "sentiment_label": ml_result["sentiment_label"],
+        "stress_label": ml_result["stress_label"],
+        "stress_score": ml_result["stress_score"],
+        "risk_flag": ml_result["risk_flag"],
+        "analysis_source": ml_result["analysis_source"],
+    }
+
+
+async def persist_user_message(user_id: str, text: str) -> dict:
+    doc = {
+        "user_id": user_id,
+        "sender": "user",
+        "text": text,
+        "created_at": datetime.utcnow(),
+    }
+    with span("chat.persist_user_message"):
+        await db.chat_messages.insert_one(doc)
+    await enqueue(record_activity, user_id, "chat_messages", [doc["created_at"]])
+    return doc
+
+
+async def crisis_reply(
+    user_id: str,
+    user_msg: str,
+    now: datetime,
+    profile: Optional[UserProfile],
+    messages_count: int,
+    recent: Optional[list[dict]] = None,
+) -> tuple[str, dict]:
+    """Full analysis and LLM reply for a message the crisis screener flagged."""
+    ml_result = await call_ml_service(user_msg)
+    ml_result["risk_flag"] = True
+    ai_reply = await generate_reply(
+        user_id, user_msg, now, ml_result, profile, messages_count,
+        deadline=time.monotonic() + CHAT_BUDGET_SECONDS, recent=recent,
     )
+    return ai_reply, ml_result
 
+
+async def crisis_followup(user_id: str, user_msg: str, now: datetime, reply_id: ObjectId):
+    """
+    Runs after a crisis fast-path response: analyze the message and store
+    the full LLM reply under the reply_id the client is polling.
+
+    It is a task of its own rather than a background-queue job, so a slow
+    LLM call neither holds a queue worker nor delays the immediate response
+    when the queue is full, and a failed write does not generate the reply
+    again; only the write goes through the queue.
+    """
+    try:
+        profile, messages_count = await load_chat_context(user_id)
+        ai_reply, ml_result = await crisis_reply(user_id, user_msg, now, profile, messages_count)
+    except Exception as e:
+        logger.error("Crisis follow-up for %s failed: %r", user_id, e)
+        return
+    await enqueue(persist_reply, assistant_message(reply_id, user_id, ai_reply, ml_result))
+
+
+def start_crisis_followup(user_id: str, user_msg: str, now: datetime, reply_id: ObjectId):
+    task = asyncio.create_task(crisis_followup(user_id, user_msg, now, reply_id))
+    _crisis_tasks.add(task)
+    task.add_done_callback(_crisis_tasks.discard)
+
+
+@router.post("/message", response_model=ChatMessageResponse)
+async def send_message(
+    payload: ChatMessageRequest,
+    current_user: User = Depends(get_current_user),
+):
+    user_id = current_user.id
+    user_msg = payload.message
+    deadline = time.monotonic() + CHAT_BUDGET_SECONDS - CHAT_REPLY_RESERVE_SECONDS
+
+    # A message in crisis is never answered with a 429, but its ML and LLM
+    # follow-up spends "chat" tokens like any other turn.
+    with span("chat.crisis_screen"):
+        screened = screen(user_msg)
+    retry_after = await check_rate("chat", user_id)
+    if retry_after and not screened.crisis:
+        raise too_many_requests(retry_after)
+    now = (await persist_user_message(user_id, user_msg))["created_at"]
+
+    # Explicit self-harm language: answer with crisis resources right away
+    # and let the empathetic LLM reply follow in the background. Over the
+    # limit, the static reply and resources are all the user gets.
+    if screened.crisis:
+        reply_id = None
+        if not retry_after:
+            reply_id = ObjectId()
+            start_crisis_followup(user_id, user_msg, now, reply_id)
+        return ChatMessageResponse(
+            reply=CRISIS_REPLY,
+            sentiment_label="very_negative",
+            stress_label="stressed",
+            stress_score=1.0,
+            risk_flag=True,
+            analysis_source="crisis_screener",
+            crisis=True,
+            crisis_resources=crisis_resources(screened.language),
+            reply_pending=reply_id is not None,
+            reply_id=str(reply_id) if reply_id else None,
+        )
+
+    ml_result = await call_ml_service(user_msg)
+    profile, messages_count = await load_chat_context(user_id)
+    ai_reply = await generate_reply(
+        user_id, user_msg, now, ml_result, profile, messages_count, deadline
+    )
+
+    # Stored after the response goes out; the fixed _id makes retries safe.
+    await enqueue(persist_reply, assistant_message(ObjectId(), user_id, ai_reply, ml_result))
+
+    crisis = bool(ml_result["risk_flag"])
     return ChatMessageResponse(
         reply=ai_reply,
         ai_reply=ai_reply,
@@ -169,24 +342,55 @@ async def send_message(
         stress_label=ml_result["stress_label"],
         stress_score=ml_result["stress_score"],
         risk_flag=ml_result["risk_flag"],
+        analysis_source=ml_result["analysis_source"],
+        crisis=crisis,
+        crisis_resources=crisis_resources(profile.language if profile else None) if crisis else None,
     )
 
 
+@router.get("/reply/{reply_id}", response_model=ChatReplyStatus)
+async def get_reply(reply_id: str, current_user: User = Depends(get_current_user)):
+    """Poll for an assistant reply that is still being generated (see `reply_pending`)."""
+    try:
+        oid = ObjectId(reply_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Unknown reply")
+    doc = await db.chat_messages.find_one({"_id": oid, "user_id": current_user.id}, {"text": 1})
+    if not doc:
+        return ChatReplyStatus(reply_id=reply_id, ready=False)
+    return ChatReplyStatus(reply_id=reply_id, ready=True, reply=doc.get("text", ""))
+
+
 @router.get("/history/{user_id}", response_model=ChatHistoryResponse)
 @router.get("/history/me", response_model=ChatHistoryResponse)
-async def get_my_history(current_user: User = Depends(get_current_user)):
+async def get_my_history(
+    current_user: User = Depends(get_current_user),
+    before: Optional[datetime] = Query(
+        None, description="Page backwards from this time, into archived messages if needed"
+    ),
+    limit: int = Query(500, ge=1, le=1000),
+):
     user_id = current_user.id
-    cursor = db.chat_messages.find({"user_id": user_id}).sort("created_at", 1)
-    docs = await cursor.to_list(length=500)
-
-    messages: list[ChatMessage] = []
-    for d in docs:
-        messages.append(
-            ChatMessage(
-                sender=d.get("sender", "user"),
-                text=d.get("text", ""),
-                timestamp=d.get("created_at"),
-            )
-        )
+    next_before = None
+    projection = {"_id": 0, "sender": 1, "text": 1, "created_at": 1}
+    # Newest page first (optionally before a cursor), then returned oldest-first.
+    query: dict = {"user_id": user_id}
+    if before is not None:
+        query["created_at"] = {"$lt": before}
+    cursor = db.chat_messages.find(query, projection).sort("created_at", -1).limit(limit)
+    docs = await cursor.to_list(length=limit)
+    if len(docs) < limit:
+        oldest = docs[-1]["created_at"] if docs else (before or datetime.utcnow())
+        docs += await load_archived_messages(user_id, oldest, limit - len(docs))
+    docs.reverse()
+    if len(docs) == limit:
+        next_before = docs[0].get("created_at")
 
-    return ChatHistoryResponse(user_id=user_id, messages=messages)
+    # Plain dicts in the ChatHistoryResponse shape; no per-message pydantic objects.
+    messages = [
+        {"sender": d.get("sender", "user"), "text": d.get("text", ""), "timestamp": d.get("created_at")}
+        for d in docs
+    ]
+    return FastJSONResponse(
+        {"user_id": user_id, "messages": messages, "next_before": next_before}
+    )
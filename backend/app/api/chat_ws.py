@@ -0,0 +1,215 @@
+"""
+WebSocket chat transport: `/api/chat/ws?token=<access token>`.
+
+The token is checked once when the socket opens. The connection then keeps
+the user's profile, message count and latest turns, so a chat turn needs no
+JWT decoding, no user lookup and no history query. Results are pushed as
+JSON events instead of being polled:
+
+    client -> server   {"type": "message", "message": "..."}  |  {"type": "ping"}
+
+    server -> client   ready         {"user_id"}
+                       analysis      sentiment / stress of the user message
+                       crisis        {"crisis_resources"}
+                       reply         {"reply", "reply_id", "pending"}
+                       suggestions   {"game", "exercises"}
+                       rate_limited  {"retry_after"}
+                       error         {"detail"}
+                       pong
+
+Each connection may send WS_MESSAGES_PER_MINUTE messages, with bursts of
+up to WS_MESSAGE_BURST; messages also count against the user's "chat"
+rate-limit policy shared with POST /chat/message. Messages the crisis
+screener flags always get the crisis resources and the static reply; over
+the limits they just get no follow-up analysis or LLM reply.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+
+from app.api.chat import (
+    CRISIS_REPLY,
+    CHAT_BUDGET_SECONDS,
+    CHAT_REPLY_RESERVE_SECONDS,
+    assistant_message,
+    call_ml_service,
+    crisis_reply,
+    generate_reply,
+    load_chat_context,
+    persist_reply,
+    persist_user_message,
+)
+from app.api.exercises import exercise_dict, exercise_types_for
+from app.api.games import choose_game_from_stress
+from app.core.metrics import WS_CONNECTIONS, WS_MESSAGES
+from app.core.mongo import db
+from app.core.rate_limit import TokenBucket, check_rate
+from app.core.security import get_current_user
+from app.core.tracing import start_trace
+from app.services.context_builder import CHAT_RECENT_TURNS
+from app.services.crisis_screener import crisis_resources, screen
+from app.services.task_queue import enqueue
+
+WS_MESSAGES_PER_MINUTE = float(os.getenv("WS_MESSAGES_PER_MINUTE", "20"))
+WS_MESSAGE_BURST = int(os.getenv("WS_MESSAGE_BURST", "5"))
+WS_MAX_MESSAGE_CHARS = int(os.getenv("WS_MAX_MESSAGE_CHARS", "4000"))
+
+# Close codes in the 4000-4999 range are application-defined.
+WS_CLOSE_UNAUTHORIZED = 4401
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class ChatConnection:
+    def __init__(self, websocket: WebSocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.profile = None
+        self.messages_count = 0
+        self.recent: deque = deque(maxlen=CHAT_RECENT_TURNS)
+        self.rate = TokenBucket(WS_MESSAGES_PER_MINUTE, WS_MESSAGE_BURST)
+        self._send_lock = asyncio.Lock()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self):
+        self.profile, self.messages_count = await load_chat_context(self.user_id)
+        cursor = (
+            db.chat_messages.find({"user_id": self.user_id}, {"sender": 1, "text": 1, "created_at": 1})
+            .sort("created_at", -1)
+            .limit(CHAT_RECENT_TURNS)
+        )
+        self.recent.extend(reversed(await cursor.to_list(length=CHAT_RECENT_TURNS)))
+
+    async def send(self, event_type: str, **data):
+        async with self._send_lock:
+            await self.websocket.send_json(jsonable_encoder({"type": event_type, **data}))
+
+    async def send_suggestions(self, ml_result: dict):
+        game, reason = choose_game_from_stress(ml_result["stress_score"], ml_result["risk_flag"])
+        types = exercise_types_for(
+            ml_result["stress_score"], ml_result["stress_label"], ml_result["risk_flag"]
+        )
+        docs = await db.exercises.find({"type": {"$in": types}}).limit(3).to_list(length=3)
+        await self.send(
+            "suggestions",
+            game={"suggested_game": game, "reason": reason},
+            exercises=[exercise_dict(d) for d in docs],
+        )
+
+    def _remember(self, *docs: dict):
+        self.recent.extend(docs)
+        self.messages_count += len(docs)
+
+    async def handle_message(self, text: str):
+        text = (text or "").strip()
+        if not text or len(text) > WS_MAX_MESSAGE_CHARS:
+            WS_MESSAGES.labels("invalid").inc()
+            await self.send("error", detail=f"Message must be 1-{WS_MAX_MESSAGE_CHARS} characters")
+            return
+        # The rate limits never hold back a message in crisis, only its follow-up.
+        screened = screen(text)
+        retry_after = self.rate.take()[0] or await check_rate("chat", self.user_id)
+        if retry_after and not screened.crisis:
+            WS_MESSAGES.labels("rate_limited").inc()
+            await self.send("rate_limited", retry_after=round(retry_after, 1))
+            return
+        WS_MESSAGES.labels("accepted").inc()
+        start_trace()
+
+        deadline = time.monotonic() + CHAT_BUDGET_SECONDS - CHAT_REPLY_RESERVE_SECONDS
+        user_doc = await persist_user_message(self.user_id, text)
+        now = user_doc["created_at"]
+        recent = list(self.recent)
+        self._remember(user_doc)
+
+        if screened.crisis:
+            await self.send("crisis", crisis_resources=crisis_resources(screened.language))
+            await self.send("reply", reply=CRISIS_REPLY, reply_id=None, pending=not retry_after)
+            if retry_after:
+                return  # over the limit: no ML or LLM work for this message
+            reply_id = ObjectId()
+            task = asyncio.create_task(self._crisis_followup(text, now, reply_id, recent))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+
+        ml_result = await call_ml_service(text)
+        await self.send(
+            "analysis",
+            sentiment_label=ml_result["sentiment_label"],
+            stress_label=ml_result["stress_label"],
+            stress_score=ml_result["stress_score"],
+            risk_flag=ml_result["risk_flag"],
+            analysis_source=ml_result["analysis_source"],
+        )
+        if ml_result["risk_flag"]:
+            language = self.profile.language if self.profile else None
+            await self.send("crisis", crisis_resources=crisis_resources(language))
+
+        ai_reply = await generate_reply(
+            self.user_id, text, now, ml_result, self.profile, self.messages_count, deadline,
+            recent=recent,
+        )
+        await self._deliver(ObjectId(), ai_reply, ml_result)
+
+    async def _crisis_followup(self, text: str, now, reply_id: ObjectId, recent: list[dict]):
+        try:
+            ai_reply, ml_result = await crisis_reply(
+                self.user_id, text, now, self.profile, self.messages_count, recent=recent
+            )
+            await self._deliver(reply_id, ai_reply, ml_result)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # client went away; the reply is still stored if it was generated
+
+    async def _deliver(self, reply_id: ObjectId, ai_reply: str, ml_result: dict):
+        doc = assistant_message(reply_id, self.user_id, ai_reply, ml_result)
+        # Stored by the background queue; the fixed _id makes retries safe.
+        await enqueue(persist_reply, doc)
+        self._remember(doc)
+        await self.send("reply", reply=ai_reply, reply_id=str(reply_id), pending=False)
+        await self.send_suggestions(ml_result)
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket, token: Optional[str] = Query(None)):
+    try:
+        user = await get_current_user(token or "")
+    except HTTPException as e:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    conn = ChatConnection(websocket, user.id)
+    WS_CONNECTIONS.inc()
+    try:
+        await conn.load()
+        await conn.send("ready", user_id=user.id)
+        while True:
+            try:
+                event = json.loads(await websocket.receive_text())
+            except ValueError:
+                await conn.send("error", detail="Events must be JSON")
+                continue
+            kind = event.get("type") if isinstance(event, dict) else None
+            if kind == "message":
+                await conn.handle_message(event.get("message", ""))
+            elif kind == "ping":
+                await conn.send("pong")
+            else:
+                await conn.send("error", detail=f"Unknown event type {kind!r}")
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning("Chat WebSocket for %s closed on error: %r", user.id, e)
+    finally:
+        # Crisis follow-ups keep running so their replies are still stored.
+        WS_CONNECTIONS.dec()
@@ -1,10 +1,17 @@
-from datetime import datetime
+import os
+from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pymongo.errors import BulkWriteError
 
 from app.core.mongo import db
+from app.core.responses import FastJSONResponse
 from app.core.security import get_current_user
 from app.schemas.auth import User
+from app.schemas.checkin import CheckinBatchRequest, CheckinBatchResponse
+from app.services.checkin_rollups import apply_checkins, rollup_state
+from app.services.engagement import record_activity
+from app.services.event_publisher import record_events
 
 router = APIRouter()
 
@@ -15,6 +22,12 @@ VALID_MOODS = [
     "positive",
     "very_positive",
 ]
+_VALID_MOODS = frozenset(VALID_MOODS)
+
+CHECKIN_BATCH_MAX = int(os.getenv("CHECKIN_BATCH_MAX", "5000"))
+# Client clocks may run slightly ahead of ours.
+CHECKIN_MAX_CLOCK_SKEW = timedelta(minutes=5)
+DUPLICATE_KEY = 11000
 
 
 @router.post("/checkin", status_code=status.HTTP_201_CREATED)
@@ -28,12 +41,107 @@ async def create_checkin(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid mood value"
         )
 
-    await db.mood_checkins.insert_one(
+    doc = {
+        "user_id": current_user.id,
+        "mood": mood,
+        "created_at": datetime.utcnow(),
+    }
+    rollups = await rollup_state(current_user.id)  # before the insert, see checkin_rollups
+    await db.mood_checkins.insert_one(doc)
+    await apply_checkins(current_user.id, [doc], rollups)
+    await record_activity(current_user.id, "checkins", [doc["created_at"]])
+    await record_events("mood_checkins", [doc])
+
+    return {"message": "Check-in saved", "mood": mood}
+
+
+def _to_utc(created_at: datetime) -> datetime:
+    """Naive UTC, like every other stored timestamp."""
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+
+@router.post("/checkins/batch", response_model=CheckinBatchResponse)
+async def create_checkins_batch(
+    payload: CheckinBatchRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """Sync check-ins recorded offline.
+
+    Each item carries a client-generated idempotency key that becomes part of
+    the document `_id`, so a retried sync reports the already stored items as
+    duplicates instead of writing them twice. Valid items are written with a
+    single unordered insert_many; the result lists a status per item, in
+    request order.
+    """
+    if len(payload.items) > CHECKIN_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {CHECKIN_BATCH_MAX} check-ins per batch",
+        )
+
+    user_id = current_user.id
+    now = datetime.utcnow()
+    latest = now + CHECKIN_MAX_CLOCK_SKEW
+    results: list[dict] = []
+    docs: list[dict] = []
+    doc_results: list[dict] = []  # results entry of each doc, for bulk write errors
+    seen: set[str] = set()
+
+    for item in payload.items:
+        key = item.idempotency_key
+        result = {"idempotency_key": key, "status": "created", "detail": None}
+        results.append(result)
+        if key in seen:
+            result["status"] = "duplicate"
+            continue
+        seen.add(key)
+        if item.mood not in _VALID_MOODS:
+            result["status"], result["detail"] = "invalid", "Invalid mood value"
+            continue
+        created_at = _to_utc(item.created_at) if item.created_at else now
+        if created_at > latest:
+            result["status"], result["detail"] = "invalid", "Timestamp is in the future"
+            continue
+        docs.append(
+            {
+                "_id": f"{user_id}:{key}",
+                "user_id": user_id,
+                "mood": item.mood,
+                "created_at": created_at,
+                "idempotency_key": key,
+            }
+        )
+        doc_results.append(result)
+
+    failed: set[int] = set()
+    if docs:
+        rollups = await rollup_state(user_id)  # before the insert, see checkin_rollups
+        try:
+            await db.mood_checkins.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                index = err["index"]
+                failed.add(index)
+                if err.get("code") == DUPLICATE_KEY:
+                    doc_results[index]["status"] = "duplicate"
+                else:
+                    doc_results[index]["status"] = "invalid"
+                    doc_results[index]["detail"] = err.get("errmsg")
+        inserted = [d for i, d in enumerate(docs) if i not in failed]
+        await apply_checkins(user_id, inserted, rollups)
+        await record_activity(user_id, "checkins", [d["created_at"] for d in inserted])
+        await record_events("mood_checkins", inserted)
+
+    counts = {"created": 0, "duplicate": 0, "invalid": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return FastJSONResponse(
         {
-            "user_id": current_user.id,
-            "mood": mood,
-            "created_at": datetime.utcnow(),
+            "created": counts["created"],
+            "duplicates": counts["duplicate"],
+            "invalid": counts["invalid"],
+            "results": results,
         }
     )
-
-    return {"message": "Check-in saved", "mood": mood}
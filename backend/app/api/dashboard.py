@@ -3,10 +3,15 @@ from collections import defaultdict
 
 from fastapi import APIRouter, Depends
 
-from app.schemas.dashboard import DashboardSummary, DaySummary
+from app.schemas.dashboard import DashboardSummary
 from app.core.mongo import db
+from app.core.responses import FastJSONResponse
 from app.core.security import get_current_user
 from app.schemas.auth import User
+from app.services.archive import archived_daily_aggregates
+from app.services.checkin_rollups import daily_mood_counts
+from app.services.engagement import engagement_view
+from app.services.face_aggregates import day_view, face_daily_aggregates, fuse_stress
 
 router = APIRouter()
 
@@ -21,16 +26,21 @@ def sentiment_to_score(label: str) -> float:
     return mapping.get(label, 0.0)
 
 
-async def _aggregate_for_user(user_id: str) -> DashboardSummary:
+async def _aggregate_for_user(user_id: str) -> dict:
+    """DashboardSummary as a plain dict (see app.core.responses)."""
     cursor = db.chat_messages.find(
-        {"user_id": user_id, "sender": "assistant"}
+        {"user_id": user_id, "sender": "assistant"},
+        {"_id": 0, "created_at": 1, "sentiment_label": 1, "stress_score": 1},
     ).sort("created_at", 1)
     docs = await cursor.to_list(length=2000)
 
-    checkins = await db.mood_checkins.find({"user_id": user_id}).to_list(1000)
+    # [sum, count] per day, so archived day aggregates can be merged in
+    per_day_sentiment = defaultdict(lambda: [0.0, 0])
+    per_day_stress = defaultdict(lambda: [0.0, 0])
 
-    per_day_sentiment = defaultdict(list)
-    per_day_stress = defaultdict(list)
+    def add(bucket, day_key, value, n=1):
+        bucket[day_key][0] += value
+        bucket[day_key][1] += n
 
     for d in docs:
         created_at = d.get("created_at")
@@ -45,8 +55,15 @@ async def _aggregate_for_user(user_id: str) -> DashboardSummary:
         sentiment_label = d.get("sentiment_label", "neutral")
         stress_score = float(d.get("stress_score", 0.0))
 
-        per_day_sentiment[day_key].append(sentiment_to_score(sentiment_label))
-        per_day_stress[day_key].append(stress_score)
+        add(per_day_sentiment, day_key, sentiment_to_score(sentiment_label))
+        add(per_day_stress, day_key, stress_score)
+
+    # messages moved to chat_archive keep contributing through their day aggregates
+    for day_key, agg in (await archived_daily_aggregates(user_id)).items():
+        for label, n in agg["sentiment_counts"].items():
+            add(per_day_sentiment, day_key, sentiment_to_score(label) * n, n)
+        if agg["stress_count"]:
+            add(per_day_stress, day_key, agg["stress_sum"], agg["stress_count"])
 
     # incorporate manual mood check-ins into sentiment aggregates
     mood_map = {
@@ -56,46 +73,57 @@ async def _aggregate_for_user(user_id: str) -> DashboardSummary:
         "positive": 0.5,
         "very_positive": 1.0,
     }
-    for c in checkins:
-        created_at = c.get("created_at")
-        if not created_at:
-            continue
-        if isinstance(created_at, str):
-            created_at = datetime.fromisoformat(created_at)
-        day_key = created_at.date().isoformat()
-        per_day_sentiment[day_key].append(mood_map.get(c.get("mood"), 0.0))
+    for day_key, counts in (await daily_mood_counts(user_id)).items():
+        for mood, n in counts.items():
+            if n:
+                add(per_day_sentiment, day_key, mood_map.get(mood, 0.0) * n, n)
 
-    days: list[DaySummary] = []
+    face_days = await face_daily_aggregates(user_id)
+
+    days: list[dict] = []
     high_stress_days = 0
 
-    for day, sent_values in per_day_sentiment.items():
-        stress_values = per_day_stress.get(day, [])
-        if not stress_values:
+    for day, (sent_sum, sent_count) in per_day_sentiment.items():
+        stress_sum, stress_count = per_day_stress.get(day, (0.0, 0))
+        if not stress_count:
             continue
 
-        avg_sent = sum(sent_values) / len(sent_values)
-        avg_stress = sum(stress_values) / len(stress_values)
+        avg_sent = sent_sum / sent_count
+        avg_stress = stress_sum / stress_count
 
         if avg_stress >= 0.7:
             high_stress_days += 1
 
+        face = day_view(face_days[day]) if day in face_days else {}
         days.append(
-            DaySummary(
-                date=day,
-                avg_sentiment=avg_sent,
-                avg_stress=avg_stress,
-            )
+            {
+                "date": day,
+                "avg_sentiment": avg_sent,
+                "avg_stress": avg_stress,
+                "face_distribution": face.get("face_distribution"),
+                "dominant_emotion": face.get("dominant_emotion"),
+                "face_captures": face.get("face_captures", 0),
+                "fused_stress": fuse_stress(avg_stress, face.get("face_stress")),
+            }
         )
 
-    days.sort(key=lambda d: d.date)
+    days.sort(key=lambda d: d["date"])
 
-    return DashboardSummary(
-        user_id=user_id,
-        days=days,
-        high_stress_days=high_stress_days,
+    user = await db.users.find_one(
+        {"_id": user_id}, {"timezone": 1, "show_streaks": 1, "engagement": 1}
     )
+    engagement = None
+    if user and user.get("show_streaks", True):
+        engagement = engagement_view(user)
+
+    return {
+        "user_id": user_id,
+        "days": days,
+        "high_stress_days": high_stress_days,
+        "engagement": engagement,
+    }
 
 
 @router.get("/summary/me", response_model=DashboardSummary)
 async def get_my_dashboard(current_user: User = Depends(get_current_user)):
-    return await _aggregate_for_user(current_user.id)
+    return FastJSONResponse(await _aggregate_for_user(current_user.id))
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.security import get_current_user
+from app.schemas.auth import User
+from app.services.data_export import import_records, iter_export_gzip, iter_lines
+
+router = APIRouter()
+
+
+@router.get("/export/me")
+async def export_my_data(current_user: User = Depends(get_current_user)):
+    """
+    Stream the user's profile, chat messages, check-ins and face emotions
+    as gzip-compressed NDJSON.
+    """
+    filename = f"wellness-export-{datetime.utcnow():%Y%m%d}.ndjson.gz"
+    return StreamingResponse(
+        iter_export_gzip(current_user.id),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/import/me")
+async def import_my_data(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Import an export file (gzip or plain NDJSON request body) into the
+    current account. Safe to repeat: already imported records count as duplicates.
+    """
+    return await import_records(iter_lines(request.stream()), current_user.id)
@@ -1,53 +1,53 @@
-import os
 from datetime import datetime
 
-import httpx
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
 
+from app.core.admission import CapacityExceeded
 from app.core.mongo import db
-from app.core.security import get_current_user
+from app.core.rate_limit import rate_limit, too_many_requests
 from app.schemas.auth import User
+from app.services.event_publisher import record_events
+from app.services.image_prep import ImageTooLarge, prepare_face_image
+from app.services.ml_engine import InvalidImage, analyze_face
 
 router = APIRouter()
 
-ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://127.0.0.1:8002")
-
 
 @router.post("/face")
 async def analyze_face_emotion(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(rate_limit("face")),
 ):
     """
-    Forward an uploaded face image to the ML service, store the result, and return it.
+    Forward an uploaded face image to the ML engine, store the result, and return it.
+
+    Uploads are capped at FACE_UPLOAD_MAX_BYTES (see main.py) and shrunk to
+    just above the model's input size before they are forwarded.
     """
     content = await file.read()
-    files = {
-        "file": (
-            file.filename or "face.jpg",
-            content,
-            file.content_type or "image/jpeg",
-        )
-    }
 
     try:
-        async with httpx.AsyncClient(timeout=40) as client:
-            resp = await client.post(f"{ML_SERVICE_URL}/api/emotion/face", files=files)
-        resp.raise_for_status()
+        content, content_type = await prepare_face_image(content, file.content_type or "image/jpeg")
+        data = await analyze_face(file.filename or "face.jpg", content, content_type)
+    except InvalidImage:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except CapacityExceeded as e:
+        raise too_many_requests(e.retry_after, "Face analysis is busy, try again shortly")
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"ML service error: {e}")
 
-    data = resp.json()
     emotion = data.get("emotion")
     scores = data.get("scores")
 
-    await db.face_emotions.insert_one(
-        {
-            "user_id": current_user.id,
-            "emotion": emotion,
-            "scores": scores,
-            "created_at": datetime.utcnow(),
-        }
-    )
+    doc = {
+        "user_id": current_user.id,
+        "emotion": emotion,
+        "scores": scores,
+        "created_at": datetime.utcnow(),
+    }
+    await db.face_emotions.insert_one(doc)
+    await record_events("face_emotions", [doc])
 
     return {"emotion": emotion, "scores": scores}
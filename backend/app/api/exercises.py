@@ -4,6 +4,7 @@ from uuid import uuid4
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 from app.core.mongo import db
+from app.core.responses import FastJSONResponse
 from app.core.security import get_current_user
 from app.schemas.auth import User
 from app.schemas.exercises import (
@@ -16,17 +17,22 @@ from app.schemas.exercises import (
 router = APIRouter()
 
 
+def exercise_dict(doc) -> dict:
+    """An exercise document in the Exercise schema's shape, as a plain dict."""
+    return {
+        "id": str(doc["_id"]),
+        "title": doc["title"],
+        "type": doc["type"],
+        "duration_minutes": int(doc.get("duration_minutes", 5)),
+        "difficulty": doc.get("difficulty", "easy"),
+        "tags": doc.get("tags", []),
+        "description": doc.get("description", ""),
+        "steps": doc.get("steps", []),
+    }
+
+
 def doc_to_exercise(doc) -> Exercise:
-    return Exercise(
-        id=str(doc["_id"]),
-        title=doc["title"],
-        type=doc["type"],
-        duration_minutes=int(doc.get("duration_minutes", 5)),
-        difficulty=doc.get("difficulty", "easy"),
-        tags=doc.get("tags", []),
-        description=doc.get("description", ""),
-        steps=doc.get("steps", []),
-    )
+    return Exercise(**exercise_dict(doc))
 
 
 @router.post("/seed-dev", status_code=status.HTTP_201_CREATED)
@@ -119,8 +125,16 @@ async def search_exercises(
     cursor = db.exercises.find(query).limit(limit)
     docs = await cursor.to_list(length=limit)
 
-    items: List[Exercise] = [doc_to_exercise(d) for d in docs]
-    return ExerciseSearchResponse(items=items)
+    return FastJSONResponse({"items": [exercise_dict(d) for d in docs]})
+
+
+def exercise_types_for(stress_score: float, stress_label: str, risk_flag: bool) -> List[ExerciseType]:
+    """Exercise types to recommend for a stress reading, most relevant first."""
+    if risk_flag or stress_score >= 0.75:
+        return ["breathing", "grounding"]
+    if stress_score >= 0.4 or stress_label == "stressed":
+        return ["grounding", "breathing", "journaling"]
+    return ["journaling", "grounding", "breathing"]
 
 
 @router.get("/recommend", response_model=ExerciseRecommendResponse)
@@ -143,16 +157,11 @@ async def recommend_exercises(
 
     if last_msgs:
         last = next((m for m in last_msgs if "stress_score" in m), last_msgs[0])
-        stress_score = float(last.get("stress_score", 0.0))
-        stress_label = last.get("stress_label", "not_stressed")
-        risk_flag = bool(last.get("risk_flag", False))
-
-        if risk_flag or stress_score >= 0.75:
-            types = ["breathing", "grounding"]
-        elif stress_score >= 0.4 or stress_label == "stressed":
-            types = ["grounding", "breathing", "journaling"]
-        else:
-            types = ["journaling", "grounding", "breathing"]
+        types = exercise_types_for(
+            float(last.get("stress_score", 0.0)),
+            last.get("stress_label", "not_stressed"),
+            bool(last.get("risk_flag", False)),
+        )
 
     cursor2 = db.exercises.find({"type": {"$in": types}}).limit(limit)
     docs = await cursor2.to_list(length=limit)
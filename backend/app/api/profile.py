@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import APIRouter, Depends, HTTPException, status
 
 from app.core.mongo import db
 from app.core.security import get_current_user
 from app.schemas.auth import User
 from app.schemas.profile import UpdateUserProfile, UserProfile
+from app.services.engagement import engagement_view, rebuild_engagement
+from app.services.task_queue import enqueue
 
 router = APIRouter()
 
@@ -18,6 +22,7 @@ def doc_to_profile(doc) -> UserProfile:
         goal=doc.get("goal"),
         show_streaks=doc.get("show_streaks", True),
         created_at=doc.get("created_at"),
+        engagement=engagement_view(doc),
     )
 
 
@@ -38,11 +43,22 @@ async def update_my_profile(
         for field, value in payload.model_dump(exclude_unset=True).items()
     }
 
+    if update_fields.get("timezone"):
+        try:
+            ZoneInfo(update_fields["timezone"])
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown timezone"
+            )
+
     if update_fields:
         await db.users.update_one(
             {"_id": current_user.id},
             {"$set": update_fields},
         )
+    if "timezone" in update_fields:
+        # Streak days are local days; recount them in the new timezone.
+        await enqueue(rebuild_engagement, current_user.id)
 
     updated = await db.users.find_one({"_id": current_user.id})
     if not updated:
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from .auth import router as auth_router
 from .chat import router as chat_router
+from .chat_ws import router as chat_ws_router
 from .dashboard import router as dashboard_router
 from .checkin import router as checkin_router
 from .exercises import router as exercises_router
@@ -8,11 +9,13 @@ from .games import router as games_router
 from .profile import router as profile_router
 from .emotion import router as emotion_router
 from .content import router as content_router
+from .data import router as data_router
 
 router = APIRouter()
 
 router.include_router(auth_router, prefix="/auth", tags=["auth"])
 router.include_router(chat_router, prefix="/chat", tags=["chat"])
+router.include_router(chat_ws_router, prefix="/chat", tags=["chat"])
 router.include_router(dashboard_router, prefix="/dashboard", tags=["dashboard"])
 router.include_router(checkin_router, prefix="/dashboard", tags=["checkins"])
 router.include_router(exercises_router, prefix="/exercises", tags=["exercises"])
@@ -20,3 +23,4 @@ router.include_router(games_router, prefix="/games", tags=["games"])
 router.include_router(profile_router, prefix="", tags=["profile"])
 router.include_router(emotion_router, prefix="/emotion", tags=["emotion"])
 router.include_router(content_router, prefix="/content", tags=["content"])
+router.include_router(data_router, prefix="/data", tags=["data"])
@@ -0,0 +1,71 @@
+"""
+Concurrency caps on in-flight ML and LLM calls.
+
+`ml_limiter` and `llm_limiter` bound how many calls each process has
+outstanding. A call waits at most ADMISSION_WAIT_SECONDS for a slot and
+otherwise raises CapacityExceeded, so callers shed load (fallback
+classifier, simple reply, 429) instead of queueing behind a saturated
+dependency. Deferrable background work uses `background_slot`, which never
+waits and leaves LLM_BACKGROUND_RESERVE slots free for live requests.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from app.core.metrics import ADMISSION_IN_FLIGHT, ADMISSION_REJECTIONS
+
+ML_MAX_IN_FLIGHT = int(os.getenv("ML_MAX_IN_FLIGHT", "16"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "32"))
+ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", "1"))
+LLM_BACKGROUND_RESERVE = int(os.getenv("LLM_BACKGROUND_RESERVE", str(max(1, LLM_MAX_IN_FLIGHT // 4))))
+
+
+class CapacityExceeded(RuntimeError):
+    """No in-flight slot freed up within the admission wait."""
+
+    reason = "overloaded"
+
+    def __init__(self, name: str, retry_after: float = 1.0):
+        super().__init__(f"{name} is at its concurrency limit")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self, wait: Optional[float] = ADMISSION_WAIT_SECONDS):
+        if self._semaphore.locked():
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(wait or 0.0, 0.001))
+            except asyncio.TimeoutError:
+                ADMISSION_REJECTIONS.labels(self.name).inc()
+                raise CapacityExceeded(self.name) from None
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.labels(self.name).inc()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.labels(self.name).dec()
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def background_slot(self, reserve: int):
+        """A slot for deferrable work: taken only while `reserve` slots stay free, never waited for."""
+        if self.limit - self.in_flight <= reserve:
+            ADMISSION_REJECTIONS.labels(f"{self.name}_background").inc()
+            raise CapacityExceeded(f"{self.name} (background)")
+        async with self.slot():
+            yield
+
+
+ml_limiter = ConcurrencyLimiter("ml", ML_MAX_IN_FLIGHT)
+llm_limiter = ConcurrencyLimiter("llm", LLM_MAX_IN_FLIGHT)
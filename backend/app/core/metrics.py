@@ -0,0 +1,209 @@
+# app/core/metrics.py
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+REQUEST_LATENCY = Histogram(
+    "backend_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+STAGE_LATENCY = Histogram(
+    "backend_stage_duration_seconds",
+    "Latency of named stages inside a request (see app.core.tracing.span)",
+    ["stage"],
+)
+
+MONGO_OPERATIONS = Counter(
+    "backend_mongo_operations_total",
+    "MongoDB commands issued by the backend",
+    ["command", "outcome"],
+)
+
+MONGO_LATENCY = Histogram(
+    "backend_mongo_command_duration_seconds",
+    "MongoDB command round-trip time",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+ML_CALLS = Counter(
+    "backend_ml_calls_total",
+    "Calls to the ML service",
+    ["endpoint", "outcome"],
+)
+
+ML_LATENCY = Histogram(
+    "backend_ml_call_duration_seconds",
+    "Round-trip time of ML service calls",
+    ["endpoint"],
+)
+
+ML_FALLBACKS = Counter(
+    "backend_ml_fallbacks_total",
+    "Text analyses served by the in-process fallback classifier",
+    ["reason"],
+)
+
+BACKGROUND_TASKS = Counter(
+    "backend_background_tasks_total",
+    "Post-response background jobs by outcome",
+    ["job", "outcome"],
+)
+
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    "backend_background_queue_depth",
+    "Jobs waiting in the in-process background queue",
+)
+
+LLM_CALLS = Counter(
+    "backend_llm_calls_total",
+    "Calls to the LLM provider",
+    ["outcome"],
+)
+
+LLM_LATENCY = Histogram(
+    "backend_llm_call_duration_seconds",
+    "Round-trip time of LLM completions",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+)
+
+LLM_RETRIES = Counter(
+    "backend_llm_retries_total",
+    "LLM attempts retried after a failure that is safe to repeat",
+)
+
+LLM_HEDGES = Counter(
+    "backend_llm_hedges_total",
+    "Hedged second LLM requests and whether they beat the original",
+    ["outcome"],
+)
+
+LLM_BREAKER_STATE = Gauge(
+    "backend_llm_breaker_state",
+    "LLM circuit breaker state (0 closed, 1 half-open, 2 open)",
+)
+
+LLM_FALLBACKS = Counter(
+    "backend_llm_fallbacks_total",
+    "Chat replies served by simple_reply instead of the LLM",
+    ["reason"],
+)
+
+CACHE_HITS = Counter(
+    "backend_cache_hits_total",
+    "Cache hits by cache name",
+    ["cache"],
+)
+
+CACHE_MISSES = Counter(
+    "backend_cache_misses_total",
+    "Cache misses by cache name",
+    ["cache"],
+)
+
+CRISIS_SCREENS = Counter(
+    "backend_crisis_screens_total",
+    "Chat messages checked by the crisis screener",
+    ["outcome"],
+)
+
+CRISIS_SCREEN_SECONDS = Histogram(
+    "backend_crisis_screen_duration_seconds",
+    "Time spent in the crisis phrase matcher",
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005),
+)
+
+WS_CONNECTIONS = Gauge(
+    "backend_ws_connections",
+    "Open chat WebSocket connections",
+)
+
+WS_MESSAGES = Counter(
+    "backend_ws_messages_total",
+    "Chat messages received over WebSocket",
+    ["outcome"],
+)
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "backend_rate_limit_rejections_total",
+    "Requests rejected by a rate-limit policy",
+    ["policy", "scope"],
+)
+
+RATE_LIMIT_GLOBAL_TOKENS = Gauge(
+    "backend_rate_limit_global_tokens",
+    "Tokens left in a policy's global bucket",
+    ["policy"],
+)
+
+RATE_LIMIT_USER_TOKENS = Histogram(
+    "backend_rate_limit_user_tokens",
+    "Tokens left in the caller's bucket after each check",
+    ["policy"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50),
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "backend_admission_in_flight",
+    "In-flight calls holding a concurrency slot",
+    ["limiter"],
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "backend_admission_rejections_total",
+    "Calls rejected because no concurrency slot freed up in time",
+    ["limiter"],
+)
+
+EVENTS_PUBLISHED = Counter(
+    "backend_events_published_total",
+    "Domain events picked up by the webhook publisher",
+    ["event_type"],
+)
+
+EVENT_DELIVERIES = Counter(
+    "backend_event_deliveries_total",
+    "Webhook batch deliveries by outcome",
+    ["outcome"],
+)
+
+EVENT_DELIVERY_LATENCY = Histogram(
+    "backend_event_delivery_duration_seconds",
+    "Time to deliver one event batch to a webhook, retries included",
+)
+
+ML_REPLICA_REQUESTS = Counter(
+    "backend_ml_replica_requests_total",
+    "Calls to each ml_service replica by outcome",
+    ["replica", "outcome"],
+)
+
+ML_REPLICA_LATENCY = Histogram(
+    "backend_ml_replica_duration_seconds",
+    "Latency of successful calls per ml_service replica",
+    ["replica"],
+)
+
+ML_REPLICA_OUTSTANDING = Gauge(
+    "backend_ml_replica_outstanding",
+    "In-flight calls per ml_service replica",
+    ["replica"],
+)
+
+ML_REPLICA_HEALTHY = Gauge(
+    "backend_ml_replica_healthy",
+    "1 while a replica is in rotation, 0 while ejected",
+    ["replica"],
+)
+
+FACE_IMAGE_BYTES = Histogram(
+    "backend_face_image_bytes",
+    "Face image size as uploaded and as forwarded to the ML engine",
+    ["stage"],
+    buckets=(16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6),
+)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Serialize the default registry in the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
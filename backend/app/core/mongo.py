@@ -1,12 +1,31 @@
 # app/core/mongo.py
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 import os
 from dotenv import load_dotenv
 
+from app.core.metrics import MONGO_LATENCY, MONGO_OPERATIONS
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("MONGO_DB", "mental_wellness")
 
-client = AsyncIOMotorClient(MONGO_URI)
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Count MongoDB commands and their latency for /metrics."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_OPERATIONS.labels(event.command_name, "success").inc()
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_OPERATIONS.labels(event.command_name, "failure").inc()
+        MONGO_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+
+client = AsyncIOMotorClient(MONGO_URI, event_listeners=[CommandMetricsListener()])
 db = client[DB_NAME]
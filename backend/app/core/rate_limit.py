@@ -0,0 +1,144 @@
+"""
+Rate limiting for expensive endpoints.
+
+Every policy in RATE_LIMIT_POLICIES (JSON env, merged over the defaults)
+has a per-user and a global token bucket: requests per minute plus a
+burst size. Buckets live in process memory by default. With
+RATE_LIMIT_STORE=mongo they are shared by all workers through atomic
+pipeline updates on the `rate_limits` collection. Routes opt in with `Depends(rate_limit("<policy>"))`, which
+answers 429 with a Retry-After header once a bucket is empty. In-flight
+caps on ML/LLM calls are in app.core.admission.
+"""
+import json
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+from fastapi import Depends, HTTPException, status
+from pymongo import ReturnDocument
+
+from app.core.metrics import (
+    RATE_LIMIT_GLOBAL_TOKENS,
+    RATE_LIMIT_REJECTIONS,
+    RATE_LIMIT_USER_TOKENS,
+)
+from app.core.mongo import db
+from app.core.security import get_current_user
+from app.schemas.auth import User
+
+DEFAULT_POLICIES = {
+    "chat": {"user_per_minute": 12, "user_burst": 5, "global_per_minute": 600, "global_burst": 60},
+    "face": {"user_per_minute": 6, "user_burst": 3, "global_per_minute": 120, "global_burst": 20},
+}
+RATE_LIMIT_POLICIES = {**DEFAULT_POLICIES, **json.loads(os.getenv("RATE_LIMIT_POLICIES", "{}"))}
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+
+
+class TokenBucket:
+    """In-memory token bucket refilled at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> tuple[float, float]:
+        """Consume one token; returns (retry_after, tokens left). retry_after is 0 if allowed."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0, self.tokens
+        return (1 - self.tokens) / self.rate, self.tokens
+
+
+class MemoryBucketStore:
+    def __init__(self):
+        self._buckets: dict[str, TokenBucket] = {}
+
+    async def take(self, key: str, per_minute: float, burst: int) -> tuple[float, float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(per_minute, burst)
+        return bucket.take()
+
+
+class MongoBucketStore:
+    """Buckets shared between workers; refill and take happen in one atomic update."""
+
+    IDLE_EXPIRY = timedelta(hours=1)
+
+    def __init__(self):
+        self._indexed = False
+
+    async def take(self, key: str, per_minute: float, burst: int) -> tuple[float, float]:
+        if not self._indexed:
+            await db.rate_limits.create_index("updated", expireAfterSeconds=int(self.IDLE_EXPIRY.total_seconds()))
+            self._indexed = True
+        rate = per_minute / 60.0
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, 1000]}
+        doc = await db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]},
+                    "updated": now,
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return 0.0, doc["tokens"]
+        return (1 - doc["tokens"]) / rate, doc["tokens"]
+
+
+_store = MongoBucketStore() if RATE_LIMIT_STORE == "mongo" else MemoryBucketStore()
+
+
+async def check_rate(policy_name: str, user_id: str) -> float:
+    """Take a token from the user and global buckets of a policy; returns seconds to wait (0 = allowed)."""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    policy = RATE_LIMIT_POLICIES[policy_name]
+    retry_after, tokens = await _store.take(
+        f"{policy_name}:user:{user_id}", policy["user_per_minute"], policy["user_burst"]
+    )
+    RATE_LIMIT_USER_TOKENS.labels(policy_name).observe(tokens)
+    if retry_after:
+        RATE_LIMIT_REJECTIONS.labels(policy_name, "user").inc()
+        return retry_after
+    retry_after, tokens = await _store.take(
+        f"{policy_name}:global", policy["global_per_minute"], policy["global_burst"]
+    )
+    RATE_LIMIT_GLOBAL_TOKENS.labels(policy_name).set(tokens)
+    if retry_after:
+        RATE_LIMIT_REJECTIONS.labels(policy_name, "global").inc()
+    return retry_after
+
+
+def too_many_requests(retry_after: float, detail: str = "Too many requests") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def rate_limit(policy_name: str):
+    """Route dependency enforcing a policy for the authenticated user."""
+
+    async def dependency(current_user: User = Depends(get_current_user)) -> User:
+        retry_after = await check_rate(policy_name, current_user.id)
+        if retry_after:
+            raise too_many_requests(retry_after)
+        return current_user
+
+    return dependency
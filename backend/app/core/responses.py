@@ -0,0 +1,33 @@
+"""
+Fast JSON responses for large payloads.
+
+Routes that return many items build plain dicts straight from Mongo
+projections and wrap them in FastJSONResponse. Returning a Response makes
+FastAPI skip response_model validation and jsonable_encoder, so the route
+keeps `response_model=` only for the OpenAPI schema and must produce the
+same keys itself. Encoding uses orjson when it is installed, and the
+standard library otherwise.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional; json below gives identical output, just slower
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,81 @@
+# app/core/tracing.py
+"""
+Lightweight per-request span timing.
+
+The HTTP middleware in `main.py` opens a trace for each request. Code on the
+request path wraps its stages in `span("name")`; durations are exported to
+Prometheus and returned to the caller in a `Server-Timing` header. The
+request id travels to ml_service in the `X-Request-ID` header, and the
+stage timings it reports back are merged into the same trace.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from uuid import uuid4
+
+from app.core.metrics import STAGE_LATENCY
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_spans: ContextVar[Optional[list]] = ContextVar("spans", default=None)
+
+
+def start_trace(request_id: Optional[str] = None) -> str:
+    rid = request_id or uuid4().hex
+    _request_id.set(rid)
+    _spans.set([])
+    return rid
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def current_spans() -> list:
+    return _spans.get() or []
+
+
+def propagation_headers() -> dict:
+    """Headers to attach to outgoing calls so downstream services join the trace."""
+    rid = _request_id.get()
+    return {REQUEST_ID_HEADER: rid} if rid else {}
+
+
+def _record(name: str, seconds: float, export: bool = True):
+    if export:
+        STAGE_LATENCY.labels(name).observe(seconds)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def record_server_timing(header: Optional[str], prefix: str):
+    """Merge a downstream `Server-Timing` header (durations in ms) into the trace."""
+    if not header:
+        return
+    for entry in header.split(","):
+        parts = [p.strip() for p in entry.split(";")]
+        name = parts[0]
+        for p in parts[1:]:
+            if p.startswith("dur="):
+                try:
+                    _record(f"{prefix}.{name}", float(p[4:]) / 1000.0, export=False)
+                except ValueError:
+                    pass
+
+
+def server_timing_header() -> str:
+    return ", ".join(
+        f"{name.replace(' ', '_')};dur={seconds * 1000:.2f}" for name, seconds in current_spans()
+    )
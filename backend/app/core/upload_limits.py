@@ -0,0 +1,56 @@
+"""
+Request body size limits for upload routes.
+
+FastAPI parses a multipart body before the route or its dependencies run,
+so limits have to be enforced below the app. `BodySizeLimitMiddleware`
+maps exact paths to a maximum body size in bytes:
+
+- a Content-Length over the limit is answered with 413 before any of the
+  body is read;
+- bodies without one (chunked uploads) are counted as they stream in and
+  stopped with 413 as soon as they pass the limit, so an oversized upload
+  is never buffered or spooled in full.
+"""
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+
+def _too_large(limit: int) -> str:
+    return f"Upload exceeds {limit} bytes"
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            response = JSONResponse(
+                {"detail": _too_large(limit)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised while the route reads its body; FastAPI passes
+                    # HTTPException through and answers 413.
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large(limit)
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
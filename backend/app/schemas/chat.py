@@ -13,6 +13,11 @@ class ChatMessage(BaseModel):
     timestamp: Optional[datetime] = None  # NEW (optional)
 
 
+class CrisisResource(BaseModel):
+    name: str
+    contact: str
+
+
 class ChatMessageResponse(BaseModel):
     reply: str
     ai_reply: str | None = None
@@ -20,8 +25,20 @@ class ChatMessageResponse(BaseModel):
     stress_label: str
     stress_score: float
     risk_flag: bool
+    analysis_source: str = "ml_service"  # "ml_service", "fallback" or "crisis_screener"
+    crisis: bool = False
+    crisis_resources: Optional[List[CrisisResource]] = None
+    reply_pending: bool = False  # full reply still generating; poll /chat/reply/{reply_id}
+    reply_id: Optional[str] = None
+
+
+class ChatReplyStatus(BaseModel):
+    reply_id: str
+    ready: bool
+    reply: Optional[str] = None
 
 
 class ChatHistoryResponse(BaseModel):
     user_id: str
     messages: List[ChatMessage]
+    next_before: Optional[datetime] = None  # pass as ?before= to load older (archived) messages
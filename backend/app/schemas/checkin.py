@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class CheckinItem(BaseModel):
+    mood: str
+    created_at: Optional[datetime] = None  # client time; server time if omitted
+    idempotency_key: str = Field(..., min_length=1, max_length=128)
+
+
+class CheckinBatchRequest(BaseModel):
+    items: List[CheckinItem]
+
+
+class CheckinItemResult(BaseModel):
+    idempotency_key: str
+    status: Literal["created", "duplicate", "invalid"]
+    detail: Optional[str] = None
+
+
+class CheckinBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[CheckinItemResult]
@@ -1,14 +1,22 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
+
+from app.schemas.profile import EngagementCounters
 
 
 class DaySummary(BaseModel):
     date: str
     avg_sentiment: float
     avg_stress: float
+    # face-emotion captures of the day, if any
+    face_distribution: Optional[Dict[str, float]] = None
+    dominant_emotion: Optional[str] = None
+    face_captures: int = 0
+    fused_stress: Optional[float] = None  # text stress blended with the face signal
 
 
 class DashboardSummary(BaseModel):
     user_id: str
     days: List[DaySummary]
     high_stress_days: int
+    engagement: Optional[EngagementCounters] = None  # None when the user hides streaks
@@ -1,9 +1,16 @@
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic import BaseModel, EmailStr
 
 
+class EngagementCounters(BaseModel):
+    current_streak: int = 0  # 0 once a full day passed without activity
+    longest_streak: int = 0
+    last_active_day: Optional[str] = None  # YYYY-MM-DD in the user's timezone
+    totals: Dict[str, int] = {}  # per activity: "checkins", "chat_messages"
+
+
 class UserProfile(BaseModel):
     id: str
     email: EmailStr
@@ -13,6 +20,7 @@ class UserProfile(BaseModel):
     goal: Optional[str] = None  # user's wellness goal
     show_streaks: bool = True
     created_at: Optional[datetime] = None
+    engagement: Optional[EngagementCounters] = None
 
 
 class UpdateUserProfile(BaseModel):
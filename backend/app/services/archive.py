@@ -0,0 +1,204 @@
+"""
+Retention and archival for `chat_messages`.
+
+Messages older than CHAT_RETENTION_DAYS are moved into `chat_archive`
+segments: one document per user, month and run of up to
+ARCHIVE_SEGMENT_SIZE messages, with the messages stored as a
+zlib-compressed BSON blob. Each segment also carries the per-day sentiment
+and stress aggregates of the assistant messages it holds. That keeps the
+dashboard correct after the raw messages leave the hot collection. The
+aggregates are written atomically with the data they summarize.
+
+The job is incremental: each run archives at most ARCHIVE_MAX_MESSAGES_PER_RUN
+messages, and segment ids are deterministic, so a run that stops partway
+can simply be repeated.
+"""
+import asyncio
+import logging
+import os
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+import bson
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.core.mongo import db
+
+CHAT_RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "180"))
+ARCHIVE_SEGMENT_SIZE = int(os.getenv("ARCHIVE_SEGMENT_SIZE", "500"))
+ARCHIVE_MAX_MESSAGES_PER_RUN = int(os.getenv("ARCHIVE_MAX_MESSAGES_PER_RUN", "50000"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "0"))
+
+logger = logging.getLogger(__name__)
+
+
+def _as_datetime(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def daily_aggregates(docs: list[dict]) -> dict:
+    """Per-day sentiment label counts and stress sums of assistant messages."""
+    daily: dict = defaultdict(lambda: {"sentiment_counts": {}, "stress_sum": 0.0, "stress_count": 0})
+    for d in docs:
+        created_at = _as_datetime(d.get("created_at"))
+        if d.get("sender") != "assistant" or not created_at:
+            continue
+        day = daily[created_at.date().isoformat()]
+        label = d.get("sentiment_label", "neutral")
+        day["sentiment_counts"][label] = day["sentiment_counts"].get(label, 0) + 1
+        day["stress_sum"] += float(d.get("stress_score", 0.0))
+        day["stress_count"] += 1
+    return dict(daily)
+
+
+def encode_messages(docs: list[dict]) -> bytes:
+    return zlib.compress(bson.encode({"messages": docs}), 6)
+
+
+def decode_messages(data: bytes) -> list[dict]:
+    return bson.decode(zlib.decompress(data))["messages"]
+
+
+async def ensure_archive_indexes():
+    await db.chat_archive.create_index([("user_id", ASCENDING), ("last_created_at", DESCENDING)])
+    await db.chat_messages.create_index([("user_id", ASCENDING), ("created_at", ASCENDING)])
+    # The sweep in run_archival matches on created_at alone across users;
+    # this keeps it to the messages past the cutoff instead of a full scan.
+    await db.chat_messages.create_index([("created_at", ASCENDING)])
+
+
+async def _archive_segment(user_id: str, month: str, docs: list[dict]) -> int:
+    segment = {
+        "_id": f"{user_id}:{month}:{docs[0]['_id']}",
+        "user_id": user_id,
+        "month": month,
+        "first_created_at": docs[0]["created_at"],
+        "last_created_at": docs[-1]["created_at"],
+        "count": len(docs),
+        "daily": daily_aggregates(docs),
+        "data": bson.Binary(encode_messages(docs)),
+        "archived_at": datetime.utcnow(),
+    }
+    try:
+        await db.chat_archive.insert_one(segment)
+    except DuplicateKeyError:
+        # Written by an interrupted earlier run, which may have had a different
+        # cutoff or budget: only finish moving what that segment really holds,
+        # and archive the rest of this batch under a new key.
+        existing = await db.chat_archive.find_one({"_id": segment["_id"]}, {"data": 1})
+        stored = {d["_id"] for d in decode_messages(existing["data"])} if existing else set()
+        moved = [d for d in docs if d["_id"] in stored]
+        rest = [d for d in docs if d["_id"] not in stored]
+        deleted = 0
+        if moved:
+            result = await db.chat_messages.delete_many({"_id": {"$in": [d["_id"] for d in moved]}})
+            deleted = result.deleted_count
+        if rest and moved:
+            deleted += await _archive_segment(user_id, month, rest)
+        return deleted
+    result = await db.chat_messages.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+    return result.deleted_count
+
+
+async def _archive_user(user_id: str, cutoff: datetime, budget: int) -> int:
+    cursor = (
+        db.chat_messages.find({"user_id": user_id, "created_at": {"$lt": cutoff}})
+        .sort("created_at", 1)
+        .limit(budget)
+        .batch_size(ARCHIVE_SEGMENT_SIZE)
+    )
+    archived = 0
+    batch: list[dict] = []
+    month: Optional[str] = None
+    async for doc in cursor:
+        created_at = _as_datetime(doc.get("created_at"))
+        doc_month = created_at.strftime("%Y-%m") if created_at else "unknown"
+        if batch and (doc_month != month or len(batch) >= ARCHIVE_SEGMENT_SIZE):
+            archived += await _archive_segment(user_id, month, batch)
+            batch = []
+        month = doc_month
+        batch.append(doc)
+    if batch:
+        archived += await _archive_segment(user_id, month, batch)
+    return archived
+
+
+async def run_archival(
+    retention_days: int = CHAT_RETENTION_DAYS,
+    max_messages: int = ARCHIVE_MAX_MESSAGES_PER_RUN,
+) -> dict:
+    """Archive up to max_messages messages older than the retention window."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    users = db.chat_messages.aggregate(
+        [
+            {"$match": {"created_at": {"$lt": cutoff}}},
+            {"$group": {"_id": "$user_id", "n": {"$sum": 1}}},
+        ]
+    )
+    archived = 0
+    user_count = 0
+    async for row in users:
+        if archived >= max_messages:
+            break
+        moved = await _archive_user(row["_id"], cutoff, max_messages - archived)
+        archived += moved
+        user_count += 1 if moved else 0
+    return {"cutoff": cutoff.isoformat(), "archived_messages": archived, "users": user_count}
+
+
+async def archive_loop(interval: float = ARCHIVE_INTERVAL_SECONDS):
+    """Background job started from main.py when ARCHIVE_INTERVAL_SECONDS > 0."""
+    await ensure_archive_indexes()
+    while True:
+        try:
+            report = await run_archival()
+            if report["archived_messages"]:
+                logger.info("Archived chat messages: %s", report)
+        except Exception as e:
+            logger.error("Archival run failed: %r", e)
+        await asyncio.sleep(interval)
+
+
+async def archived_daily_aggregates(user_id: str) -> dict:
+    """Merge the per-day aggregates of all of a user's archive segments."""
+    merged: dict = defaultdict(lambda: {"sentiment_counts": defaultdict(int), "stress_sum": 0.0, "stress_count": 0})
+    async for seg in db.chat_archive.find({"user_id": user_id}, {"daily": 1}):
+        for day, agg in (seg.get("daily") or {}).items():
+            target = merged[day]
+            for label, n in agg.get("sentiment_counts", {}).items():
+                target["sentiment_counts"][label] += n
+            target["stress_sum"] += agg.get("stress_sum", 0.0)
+            target["stress_count"] += agg.get("stress_count", 0)
+    return merged
+
+
+async def iter_archived_messages(user_id: str):
+    """All archived messages of a user, oldest first (used by the data export)."""
+    cursor = db.chat_archive.find({"user_id": user_id}, {"data": 1}).sort("last_created_at", 1)
+    async for seg in cursor:
+        for doc in decode_messages(seg["data"]):
+            yield doc
+
+
+async def load_archived_messages(user_id: str, before: datetime, limit: int) -> list[dict]:
+    """Newest `limit` archived messages older than `before`, newest first."""
+    cursor = db.chat_archive.find(
+        {"user_id": user_id, "first_created_at": {"$lt": before}},
+        {"data": 1},
+    ).sort("last_created_at", -1)
+    out: list[dict] = []
+    async for seg in cursor:
+        docs = [
+            d for d in decode_messages(seg["data"])
+            if d.get("created_at") and _as_datetime(d["created_at"]) < before
+        ]
+        docs.sort(key=lambda d: d["created_at"], reverse=True)
+        out.extend(docs[: limit - len(out)])
+        if len(out) >= limit:
+            break
+    return out
@@ -0,0 +1,144 @@
+"""
+Per-day mood check-in rollups.
+
+`checkin_daily` holds one document per user and UTC day with a count per
+mood (`_id` = "<user_id>:<YYYY-MM-DD>"). Writers increment it right after
+inserting check-ins, so the dashboard reads a handful of day documents
+instead of every check-in.
+
+Check-ins written before rollups existed, or imported in bulk, are folded
+in lazily: the first dashboard read for a user without a
+`checkin_rollup_state` marker rebuilds that user's days from
+`mood_checkins` with one aggregation.
+
+A rebuild replaces day documents wholesale, so an increment for a
+check-in it already counted would count it twice. The marker guards
+against that: a rebuild bumps its `generation` and sets `rebuilding`
+before scanning. Writers read the marker with `rollup_state` *before*
+inserting and pass it to `apply_checkins`, which leaves the rollups to any
+rebuild that overlaps the insert or the increment. It skips the increment
+while one is running, and drops the marker if one started since the read
+(even one that has already finished), so the next read rebuilds once more.
+"""
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.core.metrics import CACHE_HITS, CACHE_MISSES
+from app.core.mongo import db
+
+logger = logging.getLogger(__name__)
+
+
+def _day(created_at) -> str:
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    return created_at.date().isoformat()
+
+
+async def rollup_state(user_id: str) -> Optional[dict]:
+    """The rebuild marker, read before inserting check-ins; None if the read failed."""
+    try:
+        doc = await db.checkin_rollup_state.find_one({"_id": user_id}, {"generation": 1, "rebuilding": 1})
+    except PyMongoError as e:
+        logger.warning("Check-in rollup state read failed for %s: %r", user_id, e)
+        return None
+    return doc or {}
+
+
+async def apply_checkins(user_id: str, docs: list[dict], before: Optional[dict]):
+    """
+    Add newly inserted check-ins to the rollups with one unordered bulk
+    write. `before` is what `rollup_state` returned ahead of the insert.
+    """
+    counts = Counter((_day(d["created_at"]), d["mood"]) for d in docs)
+    if not counts:
+        return
+    per_day: dict[str, dict[str, int]] = {}
+    for (day, mood), n in counts.items():
+        per_day.setdefault(day, {})[f"counts.{mood}"] = n
+    ops = [
+        UpdateOne(
+            {"_id": f"{user_id}:{day}"},
+            {"$inc": incs, "$setOnInsert": {"user_id": user_id, "date": day}},
+            upsert=True,
+        )
+        for day, incs in per_day.items()
+    ]
+    try:
+        if before is None or before.get("rebuilding"):
+            # A rebuild may or may not see these check-ins; have it run again.
+            await invalidate_rollups(user_id)
+            return
+        await db.checkin_daily.bulk_write(ops, ordered=False)
+        after = await rollup_state(user_id)
+        if after is None or after.get("rebuilding") or after.get("generation") != before.get("generation"):
+            await invalidate_rollups(user_id)
+    except PyMongoError as e:
+        # The check-ins are stored; rebuild this user's rollups on the next read.
+        logger.warning("Check-in rollup update failed for %s: %r", user_id, e)
+        await invalidate_rollups(user_id)
+
+
+async def invalidate_rollups(user_id: str):
+    await db.checkin_rollup_state.delete_one({"_id": user_id})
+
+
+async def rebuild_rollups(user_id: str):
+    """Recompute all of a user's day rollups from mood_checkins."""
+    token = ObjectId()
+    await db.checkin_rollup_state.update_one(
+        {"_id": user_id},
+        {"$inc": {"generation": 1}, "$set": {"rebuilding": token}, "$unset": {"rebuilt_at": ""}},
+        upsert=True,
+    )
+    pipeline = [
+        {"$match": {"user_id": user_id, "created_at": {"$type": "date"}}},
+        {
+            "$group": {
+                "_id": {
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "mood": "$mood",
+                },
+                "n": {"$sum": 1},
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.day",
+                "counts": {"$push": {"k": "$_id.mood", "v": "$n"}},
+            }
+        },
+        {
+            "$project": {
+                "_id": {"$concat": [user_id + ":", "$_id"]},
+                "user_id": user_id,
+                "date": "$_id",
+                "counts": {"$arrayToObject": "$counts"},
+            }
+        },
+        {"$merge": {"into": "checkin_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    async for _ in db.mood_checkins.aggregate(pipeline):
+        pass
+    # Matches nothing if a check-in invalidated the marker or another rebuild took over.
+    await db.checkin_rollup_state.update_one(
+        {"_id": user_id, "rebuilding": token},
+        {"$set": {"rebuilt_at": datetime.utcnow()}, "$unset": {"rebuilding": ""}},
+    )
+
+
+async def daily_mood_counts(user_id: str) -> dict[str, dict[str, int]]:
+    """{day: {mood: count}} for a user, rebuilding the rollups first if needed."""
+    if await db.checkin_rollup_state.find_one({"_id": user_id, "rebuilt_at": {"$exists": True}}, {"_id": 1}):
+        CACHE_HITS.labels("checkin_daily").inc()
+    else:
+        CACHE_MISSES.labels("checkin_daily").inc()
+        await rebuild_rollups(user_id)
+    cursor = db.checkin_daily.find({"user_id": user_id}, {"_id": 0, "date": 1, "counts": 1})
+    return {d["date"]: d.get("counts", {}) async for d in cursor}
@@ -0,0 +1,235 @@
+"""
+Prompt assembly with a rolling per-user conversation summary.
+
+Older turns are folded into a short summary stored in
+`conversation_summaries` (one document per user), updated in the
+background after replies. Each prompt is then built as
+
+    system prompt + summary, recent turns (newest kept first), user message
+
+within CHAT_CONTEXT_TOKEN_BUDGET tokens, so long conversations keep their
+context while prompt size and LLM latency stay bounded.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from app.core.mongo import db
+from app.core.tracing import span
+from app.services.llm_client import generate_background_llm_reply
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "12"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "250"))
+# Number of turns older than the recent window needed before re-summarizing.
+SUMMARY_BATCH_TURNS = int(os.getenv("SUMMARY_BATCH_TURNS", "6"))
+SUMMARY_LLM_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_LLM_TIMEOUT_SECONDS", "10"))
+
+# Per-message framing overhead of chat-completion formats.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+logger = logging.getLogger(__name__)
+# user_id -> [lock, holders and waiters]; entries go away with their last user.
+_summary_locks: dict[str, list] = {}
+
+
+def count_tokens(text: str) -> int:
+    """
+    Local tokenizer estimate: punctuation marks are one token each, and
+    words cost one token per started 6 characters, which tracks BPE
+    tokenizers closely enough for budgeting.
+    """
+    return sum(1 + (len(piece) - 1) // 6 for piece in _TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Cut text at a token boundary so that count_tokens(result) <= max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    matches = list(_TOKEN_RE.finditer(text))
+    if keep == "tail":
+        matches.reverse()
+    used = 0
+    cut = 0 if keep == "head" else len(text)
+    for m in matches:
+        cost = 1 + (len(m.group()) - 1) // 6
+        if used + cost > max_tokens - 1:  # one token left for the ellipsis
+            break
+        used += cost
+        cut = m.end() if keep == "head" else m.start()
+    return text[:cut] + " …" if keep == "head" else "… " + text[cut:]
+
+
+def _message_tokens(message: dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _as_chat_message(doc: dict) -> dict:
+    return {
+        "role": "assistant" if doc.get("sender") == "assistant" else "user",
+        "content": doc.get("text", ""),
+    }
+
+
+async def build_llm_messages(
+    user_id: str,
+    system_prompt: str,
+    user_msg: str,
+    before: datetime,
+    token_budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+    recent: Optional[list[dict]] = None,
+) -> tuple[list[dict], int]:
+    """
+    Assemble the LLM prompt for a new user message; returns (messages, prompt tokens).
+    `before` is the timestamp of the current message, which is excluded from history.
+    `recent` (oldest first, with sender/text/created_at) replaces the history
+    query when the caller already holds the latest turns, as WebSocket sessions do.
+    """
+    with span("chat.build_context"):
+        summary_doc = await db.conversation_summaries.find_one({"_id": user_id})
+        covered_until = (summary_doc or {}).get("covered_until")
+        if recent is not None:
+            recent_desc = [
+                d for d in reversed(recent)
+                if d["created_at"] < before and (not covered_until or d["created_at"] > covered_until)
+            ][:CHAT_RECENT_TURNS]
+        else:
+            query: dict = {"user_id": user_id, "created_at": {"$lt": before}}
+            if covered_until:
+                query["created_at"]["$gt"] = covered_until
+            cursor = (
+                db.chat_messages.find(query, {"sender": 1, "text": 1})
+                .sort("created_at", -1)
+                .limit(CHAT_RECENT_TURNS)
+            )
+            recent_desc = await cursor.to_list(length=CHAT_RECENT_TURNS)
+
+    user_message = {"role": "user", "content": user_msg}
+    remaining = token_budget - _message_tokens(user_message)
+
+    system_content = system_prompt
+    summary = (summary_doc or {}).get("summary")
+    if summary:
+        system_content += "\n\nSummary of the earlier conversation:\n" + summary
+    system_message = {"role": "system", "content": system_content}
+    if _message_tokens(system_message) > remaining and summary:
+        # The personalization prompt always wins over the summary.
+        room = max(remaining - _message_tokens({"content": system_prompt}) - 12, 0)
+        system_message["content"] = (
+            system_prompt + "\n\nSummary of the earlier conversation:\n"
+            + truncate_to_tokens(summary, room, keep="tail")
+        )
+    remaining -= _message_tokens(system_message)
+
+    history: list[dict] = []
+    for doc in recent_desc:
+        message = _as_chat_message(doc)
+        cost = _message_tokens(message)
+        if cost > remaining:
+            break
+        history.append(message)
+        remaining -= cost
+    history.reverse()
+
+    messages = [system_message, *history, user_message]
+    return messages, token_budget - remaining
+
+
+def _extractive_summary(previous: Optional[str], docs: list[dict]) -> str:
+    """Fallback when the LLM is unavailable: keep the gist of each user turn."""
+    lines = [previous] if previous else []
+    for d in docs:
+        if d.get("sender") != "assistant":
+            first = re.split(r"(?<=[.!?])\s", d.get("text", "").strip(), maxsplit=1)[0]
+            if first:
+                lines.append(f"- User said: {truncate_to_tokens(first, 30)}")
+    return truncate_to_tokens("\n".join(lines), SUMMARY_MAX_TOKENS, keep="tail")
+
+
+async def _summarize(previous: Optional[str], docs: list[dict]) -> str:
+    transcript = "\n".join(
+        f"{'Assistant' if d.get('sender') == 'assistant' else 'User'}: {d.get('text', '')}"
+        for d in docs
+    )
+    prompt = [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a conversation between a user and a "
+                "mental wellness assistant. Merge the new turns into the existing summary. "
+                "Keep facts about the user, their goals, stressors, what helped and any "
+                f"safety concerns. Write at most {SUMMARY_MAX_TOKENS} tokens, no preamble."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Existing summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}",
+        },
+    ]
+    try:
+        text = await generate_background_llm_reply(
+            prompt, deadline=time.monotonic() + SUMMARY_LLM_TIMEOUT_SECONDS
+        )
+        return truncate_to_tokens(text.strip(), SUMMARY_MAX_TOKENS)
+    except Exception as e:
+        logger.info("Summary LLM call failed, using extractive summary: %s", e)
+        return _extractive_summary(previous, docs)
+
+
+@asynccontextmanager
+async def _summary_lock(user_id: str):
+    entry = _summary_locks.setdefault(user_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _summary_locks[user_id]
+
+
+async def update_summary(user_id: str):
+    """
+    Fold turns that have fallen out of the recent window into the user's
+    summary. Cheap no-op until SUMMARY_BATCH_TURNS such turns have piled up.
+    """
+    async with _summary_lock(user_id):
+        summary_doc = await db.conversation_summaries.find_one({"_id": user_id}) or {}
+        query: dict = {"user_id": user_id}
+        if summary_doc.get("covered_until"):
+            query["created_at"] = {"$gt": summary_doc["covered_until"]}
+
+        pending = await db.chat_messages.count_documents(query)
+        if pending - CHAT_RECENT_TURNS < SUMMARY_BATCH_TURNS:
+            return
+
+        cursor = (
+            db.chat_messages.find(query, {"sender": 1, "text": 1, "created_at": 1})
+            .sort("created_at", 1)
+            .limit(pending - CHAT_RECENT_TURNS)
+        )
+        docs = await cursor.to_list(length=pending - CHAT_RECENT_TURNS)
+        if not docs:
+            return
+
+        summary = await _summarize(summary_doc.get("summary"), docs)
+        await db.conversation_summaries.update_one(
+            {"_id": user_id},
+            {
+                "$set": {
+                    "summary": summary,
+                    "covered_until": docs[-1]["created_at"],
+                    "updated_at": datetime.utcnow(),
+                },
+                "$inc": {"summarized_messages": len(docs)},
+            },
+            upsert=True,
+        )
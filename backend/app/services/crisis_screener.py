@@ -0,0 +1,181 @@
+"""
+First-stage crisis screener for chat messages.
+
+A single Aho-Corasick automaton over a curated multilingual phrase list is
+compiled once at import (the C `pyahocorasick` automaton when installed,
+otherwise the pure-Python one below). Screening a message is one pass over its
+normalized text (case-folded, accents and apostrophes removed, runs of
+non-word characters collapsed to one space), so it costs microseconds and
+runs before the ML call, profile lookups and LLM generation. Phrases are
+matched on word boundaries by padding both sides with spaces.
+
+This is deliberately a high-precision list of explicit self-harm language;
+subtler risk is left to the stress model's `risk_flag`.
+"""
+import re
+import time
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from app.core.metrics import CRISIS_SCREEN_SECONDS, CRISIS_SCREENS
+
+try:
+    import ahocorasick
+except ImportError:  # optional; the pure-Python automaton gives the same matches
+    ahocorasick = None
+
+CRISIS_PHRASES: dict[str, tuple[str, ...]] = {
+    "en": (
+        "kill myself", "killing myself", "kill my self", "killing my self",
+        "end my life", "ending my life", "take my own life", "taking my own life",
+        "suicide", "suicidal", "want to die", "wanna die", "better off dead",
+        "hurt myself", "hurting myself", "hurt my self", "harm myself", "harming myself",
+        "harm my self", "self harm", "cut myself", "cutting myself", "cut my self",
+        "no reason to live", "don't want to live", "don't want to be alive",
+        "end it all", "ending it all", "overdose",
+    ),
+    "es": (
+        "suicidarme", "suicidio", "quiero morir", "quiero morirme", "matarme",
+        "quitarme la vida", "acabar con mi vida", "no quiero vivir", "hacerme daño",
+    ),
+    "fr": (
+        "me suicider", "je veux mourir", "envie de mourir", "me tuer",
+        "mettre fin à mes jours", "en finir avec la vie", "me faire du mal",
+    ),
+    "de": (
+        "mich umbringen", "selbstmord", "suizid", "will sterben", "nicht mehr leben",
+        "mir das leben nehmen", "mich selbst verletzen",
+    ),
+    "pt": (
+        "me matar", "suicídio", "quero morrer", "tirar minha vida", "não quero viver",
+        "me machucar",
+    ),
+    "it": (
+        "uccidermi", "suicidarmi", "voglio morire", "togliermi la vita", "farmi del male",
+        "non voglio vivere",
+    ),
+}
+
+# Shown with every crisis response; the language-specific entries come first.
+CRISIS_RESOURCES: dict[str, list[dict]] = {
+    "intl": [
+        {"name": "Emergency services", "contact": "112 (EU) / 911 (US, CA)"},
+        {"name": "Find a helpline in your country", "contact": "https://findahelpline.com"},
+    ],
+    "en": [
+        {"name": "988 Suicide & Crisis Lifeline (US)", "contact": "Call or text 988"},
+        {"name": "Samaritans (UK & IE)", "contact": "116 123"},
+    ],
+    "es": [{"name": "Línea 024 de atención a la conducta suicida (ES)", "contact": "024"}],
+    "fr": [{"name": "Numéro national de prévention du suicide (FR)", "contact": "3114"}],
+    "de": [{"name": "TelefonSeelsorge (DE)", "contact": "0800 111 0 111"}],
+    "pt": [{"name": "SNS 24 (PT)", "contact": "808 24 24 24"}],
+    "it": [{"name": "Telefono Amico (IT)", "contact": "02 2327 2327"}],
+}
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    """Case-fold, strip accents and apostrophes, and pad with single spaces."""
+    text = text.casefold()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("'", "").replace("’", "")
+    return " " + _NON_WORD.sub(" ", text).strip() + " "
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every pattern in one pass over the text."""
+
+    def __init__(self, patterns: Iterable[tuple[str, object]]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list] = [[]]
+        for pattern, value in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(value)
+
+        # Breadth-first, so every fail link points at an already finished state.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> list:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = []
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.extend(out[state])
+        return found
+
+
+@dataclass
+class ScreenResult:
+    crisis: bool
+    matches: list[tuple[str, str]] = field(default_factory=list)  # (language, phrase)
+    elapsed_us: float = 0.0
+
+    @property
+    def language(self) -> Optional[str]:
+        return self.matches[0][0] if self.matches else None
+
+
+class _CAhoCorasick:
+    """Same interface as AhoCorasick, backed by pyahocorasick."""
+
+    def __init__(self, patterns: Iterable[tuple[str, object]]):
+        values: dict[str, list] = {}
+        for pattern, value in patterns:
+            values.setdefault(pattern, []).append(value)
+        self._automaton = ahocorasick.Automaton()
+        for pattern, vals in values.items():
+            self._automaton.add_word(pattern, vals)
+        self._automaton.make_automaton()
+
+    def find(self, text: str) -> list:
+        return [v for _, vals in self._automaton.iter(text) for v in vals]
+
+
+_matcher = (_CAhoCorasick if ahocorasick is not None else AhoCorasick)(
+    (normalize(phrase), (lang, phrase))
+    for lang, phrases in CRISIS_PHRASES.items()
+    for phrase in phrases
+)
+
+
+def screen(text: str) -> ScreenResult:
+    start = time.perf_counter()
+    matches = _matcher.find(normalize(text))
+    elapsed = time.perf_counter() - start
+    CRISIS_SCREEN_SECONDS.observe(elapsed)
+    CRISIS_SCREENS.labels("crisis" if matches else "clear").inc()
+    return ScreenResult(crisis=bool(matches), matches=matches, elapsed_us=elapsed * 1e6)
+
+
+def crisis_resources(language: Optional[str]) -> list[dict]:
+    """Helplines for the given language (if known) followed by the international ones."""
+    return CRISIS_RESOURCES.get(language or "", []) + CRISIS_RESOURCES["intl"]
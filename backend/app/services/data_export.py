@@ -0,0 +1,207 @@
+"""
+Streaming per-user export and bulk import.
+
+Exports are gzip-compressed NDJSON: one `{"type": ..., "doc": ...}` record
+per line, with Mongo types (ObjectId, datetime) encoded as Extended JSON so
+they survive the round trip. Documents are read with batched cursors and
+compressed as they stream, so memory use does not grow with history size.
+
+Imports read the same format back and write it with chunked, unordered
+`insert_many`. Every document keeps (or gets) a stable `_id`, so importing
+the same file twice only reports duplicates. Chat messages are exported
+from `chat_archive` too; one whose `_id` is already in the user's archive
+segments counts as a duplicate instead of returning to `chat_messages`.
+"""
+import time
+import zlib
+from typing import AsyncIterable, AsyncIterator, Optional
+from uuid import NAMESPACE_URL, uuid5
+
+from bson import json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+from pymongo.errors import BulkWriteError
+
+from app.core.mongo import db
+from app.services.archive import iter_archived_messages
+from app.services.checkin_rollups import invalidate_rollups
+from app.services.engagement import rebuild_engagement
+from app.services.face_aggregates import invalidate_face_cache
+
+EXPORT_COLLECTIONS = ("chat_messages", "mood_checkins", "face_emotions")
+PROFILE_FIELDS = ("email", "display_name", "language", "timezone", "goal", "show_streaks", "created_at")
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+GZIP_FLUSH_BYTES = 256 * 1024
+DUPLICATE_KEY = 11000
+
+
+def _line(record_type: str, doc: dict) -> bytes:
+    return (json_util.dumps({"type": record_type, "doc": doc}, json_options=RELAXED_JSON_OPTIONS) + "\n").encode("utf-8")
+
+
+async def iter_export_records(user_id: str, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Yield NDJSON lines for the user's profile and per-user collections."""
+    user = await db.users.find_one({"_id": user_id}, {f: 1 for f in PROFILE_FIELDS})
+    if user:
+        yield _line("profile", user)
+    for name in EXPORT_COLLECTIONS:
+        cursor = db[name].find({"user_id": user_id}).sort("_id", 1).batch_size(batch_size)
+        async for doc in cursor:
+            yield _line(name, doc)
+        if name == "chat_messages":
+            async for doc in iter_archived_messages(user_id):
+                yield _line(name, doc)
+
+
+async def iter_export_gzip(user_id: str, stats: Optional[dict] = None) -> AsyncIterator[bytes]:
+    """Gzip-compress the export as it streams, emitting a chunk every GZIP_FLUSH_BYTES of input."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    pending = 0
+    records = raw_bytes = 0
+    async for line in iter_export_records(user_id):
+        records += 1
+        raw_bytes += len(line)
+        chunk = compressor.compress(line)
+        pending += len(line)
+        if chunk:
+            yield chunk
+        if pending >= GZIP_FLUSH_BYTES:
+            flushed = compressor.flush(zlib.Z_SYNC_FLUSH)
+            if flushed:
+                yield flushed
+            pending = 0
+    yield compressor.flush()
+    if stats is not None:
+        stats.update(records=records, raw_bytes=raw_bytes)
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream (gzip or plain) into lines without buffering it whole."""
+    decompressor = None
+    buffer = b""
+    first = True
+    async for chunk in chunks:
+        if first:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(47)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if decompressor is not None:
+        buffer += decompressor.flush()
+    for line in buffer.split(b"\n"):
+        if line.strip():
+            yield line
+
+
+def _stable_id(target_user_id: str, source_user_id: Optional[str], doc: dict):
+    """
+    Keep the exported _id when importing back into the same user. When the
+    data moves to another user (or the doc has no _id), derive a
+    deterministic one so re-running the import stays idempotent.
+    """
+    original = doc.get("_id")
+    if original is not None and source_user_id in (None, target_user_id):
+        return original
+    basis = str(original) if original is not None else json_util.dumps(
+        {k: doc.get(k) for k in sorted(doc) if k != "_id"}
+    )
+    return str(uuid5(NAMESPACE_URL, f"{target_user_id}:{basis}"))
+
+
+class ImportReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.inserted: dict[str, int] = {}
+        self.duplicates: dict[str, int] = {}
+        self.errors: list[str] = []
+        self.records = 0
+        self.profile_updated = False
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "records": self.records,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "profile_updated": self.profile_updated,
+            "errors": self.errors[:20],
+            "elapsed_s": round(elapsed, 3),
+            "records_per_s": round(self.records / elapsed, 1) if elapsed else None,
+        }
+
+
+async def _flush(name: str, docs: list[dict], report: ImportReport):
+    if not docs:
+        return
+    try:
+        result = await db[name].insert_many(docs, ordered=False)
+        inserted = len(result.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details
+        inserted = details.get("nInserted", 0)
+        for err in details.get("writeErrors", []):
+            if err.get("code") == DUPLICATE_KEY:
+                report.duplicates[name] = report.duplicates.get(name, 0) + 1
+            else:
+                report.errors.append(f"{name}: {err.get('errmsg')}")
+    report.inserted[name] = report.inserted.get(name, 0) + inserted
+    docs.clear()
+
+
+async def import_records(
+    lines: AsyncIterable[bytes],
+    target_user_id: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> dict:
+    """Import an export stream into `target_user_id`; returns a throughput report."""
+    report = ImportReport()
+    buffers: dict[str, list[dict]] = {name: [] for name in EXPORT_COLLECTIONS}
+    archived_ids: Optional[set] = None  # loaded with the first chat message
+    async for line in lines:
+        report.records += 1
+        try:
+            record = json_util.loads(line)
+            record_type, doc = record["type"], record["doc"]
+        except (ValueError, KeyError, TypeError) as e:
+            report.errors.append(f"line {report.records}: {e}")
+            continue
+
+        if record_type == "profile":
+            fields = {k: doc[k] for k in PROFILE_FIELDS if k in doc and k not in ("email", "created_at")}
+            if fields:
+                result = await db.users.update_one({"_id": target_user_id}, {"$set": fields})
+                report.profile_updated = result.matched_count > 0
+            continue
+        if record_type not in buffers:
+            report.errors.append(f"line {report.records}: unknown record type {record_type!r}")
+            continue
+
+        doc["_id"] = _stable_id(target_user_id, doc.get("user_id"), doc)
+        doc["user_id"] = target_user_id
+        if record_type == "chat_messages":
+            if archived_ids is None:
+                archived_ids = {d["_id"] async for d in iter_archived_messages(target_user_id)}
+            if doc["_id"] in archived_ids:
+                report.duplicates[record_type] = report.duplicates.get(record_type, 0) + 1
+                continue
+        buf = buffers[record_type]
+        buf.append(doc)
+        if len(buf) >= chunk_size:
+            await _flush(record_type, buf, report)
+
+    for name, buf in buffers.items():
+        await _flush(name, buf, report)
+    if report.inserted.get("face_emotions"):
+        await invalidate_face_cache(target_user_id)
+    if report.inserted.get("mood_checkins"):
+        await invalidate_rollups(target_user_id)
+    if report.inserted.get("mood_checkins") or report.inserted.get("chat_messages") or report.profile_updated:
+        await rebuild_engagement(target_user_id)
+    return report.as_dict()
@@ -0,0 +1,203 @@
+"""
+Streak and engagement counters kept on the user document.
+
+`users.engagement` holds:
+
+    current_streak   consecutive active days ending at last_active_day
+    longest_streak
+    last_active_day  "YYYY-MM-DD" in the user's `timezone` (UTC if unset)
+    totals           {"checkins": n, "chat_messages": n}
+
+Writers call `record_activity` after storing check-ins or user chat
+messages. It resolves the user's timezone with `zone()`, like rebuilds and
+readers do, and passes the key to one update with an aggregation pipeline:
+MongoDB never sees a stored name its tz database might reject or read
+differently, and concurrent writers cannot lose each other's increments.
+Nothing is scanned: each timestamp either keeps, extends or restarts the
+streak. Timestamps older than last_active_day (offline check-ins synced
+late) only add to the totals. They can fill a gap in the past, which only
+a rebuild picks up.
+
+`rebuild_engagement` recomputes a user's counters from mood_checkins,
+chat_messages and chat_archive. It backs scripts/backfill_engagement.py,
+data imports and timezone changes.
+
+The stored current_streak is the streak as of last_active_day. Readers go
+through `engagement_view`, which reports 0 once a full day has passed
+without activity.
+"""
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from pymongo.errors import PyMongoError
+
+from app.core.mongo import db
+from app.services.archive import iter_archived_messages
+
+ACTIVITIES = ("checkins", "chat_messages")
+# Every UTC offset is a multiple of 15 minutes, so flooring timestamps to a
+# quarter hour never moves them to another local day.
+_SLOT = timedelta(minutes=15)
+_DAY_MS = 24 * 60 * 60 * 1000
+
+logger = logging.getLogger(__name__)
+
+
+def zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name) if name else ZoneInfo("UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def local_day(created_at: datetime, tz: ZoneInfo) -> date:
+    """Local date of a naive-UTC timestamp."""
+    return created_at.replace(tzinfo=timezone.utc).astimezone(tz).date()
+
+
+def _slots(timestamps: list[datetime]) -> list[datetime]:
+    slots = {datetime.min + (ts - datetime.min) // _SLOT * _SLOT for ts in timestamps}
+    return sorted(slots)
+
+
+def _update_pipeline(activity: str, timestamps: list[datetime], tz: ZoneInfo) -> list[dict]:
+    """Fold the timestamps, oldest first, into `engagement` in one pipeline update."""
+    day = {"$dateToString": {"format": "%Y-%m-%d", "date": "$$this", "timezone": tz.key}}
+    prev_day = {
+        "$dateToString": {
+            "format": "%Y-%m-%d",
+            "date": {"$subtract": [{"$dateFromString": {"dateString": "$$day", "format": "%Y-%m-%d"}}, _DAY_MS]},
+        }
+    }
+    # A missing last_active_day compares below any day string.
+    streak = {
+        "$switch": {
+            "branches": [
+                {"case": {"$gte": ["$$value.last_active_day", "$$day"]}, "then": "$$value.current_streak"},
+                {"case": {"$eq": ["$$value.last_active_day", "$$prev"]}, "then": {"$add": ["$$value.current_streak", 1]}},
+            ],
+            "default": 1,
+        }
+    }
+    fold = {
+        "$reduce": {
+            "input": _slots(timestamps),
+            "initialValue": {
+                "current_streak": {"$ifNull": ["$engagement.current_streak", 0]},
+                "longest_streak": {"$ifNull": ["$engagement.longest_streak", 0]},
+                "last_active_day": "$engagement.last_active_day",
+            },
+            "in": {
+                "$let": {
+                    "vars": {"day": day},
+                    "in": {
+                        "$let": {
+                            "vars": {"prev": prev_day},
+                            "in": {
+                                "$let": {
+                                    "vars": {"streak": streak},
+                                    "in": {
+                                        "current_streak": "$$streak",
+                                        "longest_streak": {"$max": ["$$value.longest_streak", "$$streak"]},
+                                        "last_active_day": {"$max": ["$$value.last_active_day", "$$day"]},
+                                    },
+                                }
+                            },
+                        }
+                    },
+                }
+            },
+        }
+    }
+    totals = {
+        "$mergeObjects": [
+            {"$ifNull": ["$engagement.totals", {}]},
+            {activity: {"$add": [{"$ifNull": [f"$engagement.totals.{activity}", 0]}, len(timestamps)]}},
+        ]
+    }
+    return [{"$set": {"engagement": {"$mergeObjects": [fold, {"totals": totals}]}}}]
+
+
+async def record_activity(user_id: str, activity: str, timestamps: list[datetime]):
+    """Count newly stored activity (naive-UTC `created_at` values) towards the counters."""
+    if not timestamps:
+        return
+    try:
+        user = await db.users.find_one({"_id": user_id}, {"timezone": 1})
+        if user is None:
+            return
+        tz = zone(user.get("timezone"))
+        await db.users.update_one({"_id": user_id}, _update_pipeline(activity, timestamps, tz))
+    except PyMongoError as e:
+        # The activity itself is stored; the backfill script can repair the counters.
+        logger.warning("Engagement update failed for %s: %r", user_id, e)
+
+
+def streaks(days: list[date]) -> tuple[int, int]:
+    """(streak ending at the last day, longest streak) over distinct sorted days."""
+    current = longest = 0
+    previous = None
+    for d in days:
+        current = current + 1 if previous is not None and d - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = d
+    return current, longest
+
+
+async def _day_counts(collection, match: dict, tz_name: str) -> dict[str, int]:
+    pipeline = [
+        {"$match": {**match, "created_at": {"$type": "date"}}},
+        {
+            "$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": tz_name}},
+                "n": {"$sum": 1},
+            }
+        },
+    ]
+    return {row["_id"]: row["n"] async for row in collection.aggregate(pipeline)}
+
+
+async def rebuild_engagement(user_id: str) -> Optional[dict]:
+    """Recompute a user's counters from all of their stored activity."""
+    user = await db.users.find_one({"_id": user_id}, {"timezone": 1})
+    if user is None:
+        return None
+    tz = zone(user.get("timezone"))
+    checkin_days = await _day_counts(db.mood_checkins, {"user_id": user_id}, tz.key)
+    chat_days = await _day_counts(db.chat_messages, {"user_id": user_id, "sender": "user"}, tz.key)
+    async for doc in iter_archived_messages(user_id):
+        created_at = doc.get("created_at")
+        if doc.get("sender") == "user" and isinstance(created_at, datetime):
+            key = local_day(created_at, tz).isoformat()
+            chat_days[key] = chat_days.get(key, 0) + 1
+
+    days = sorted(date.fromisoformat(d) for d in checkin_days.keys() | chat_days.keys())
+    current, longest = streaks(days)
+    engagement = {
+        "current_streak": current,
+        "longest_streak": longest,
+        "last_active_day": days[-1].isoformat() if days else None,
+        "totals": {"checkins": sum(checkin_days.values()), "chat_messages": sum(chat_days.values())},
+    }
+    await db.users.update_one({"_id": user_id}, {"$set": {"engagement": engagement}})
+    return engagement
+
+
+def engagement_view(user: dict, today: Optional[date] = None) -> dict:
+    """The counters as shown to the user; a streak not extended by yesterday reads as 0."""
+    stored = user.get("engagement") or {}
+    last = stored.get("last_active_day")
+    if today is None:
+        today = datetime.now(zone(user.get("timezone"))).date()
+    current = stored.get("current_streak", 0)
+    if not last or date.fromisoformat(last) < today - timedelta(days=1):
+        current = 0
+    totals = stored.get("totals") or {}
+    return {
+        "current_streak": current,
+        "longest_streak": stored.get("longest_streak", 0),
+        "last_active_day": last,
+        "totals": {activity: totals.get(activity, 0) for activity in ACTIVITIES},
+    }
@@ -0,0 +1,275 @@
+"""
+Publishes domain events to n8n (or any webhook) without touching request latency.
+
+Events:
+
+    chat.risk_flagged       assistant message stored with risk_flag set
+    checkin.created         mood check-in stored
+    face_emotion.recorded   face-emotion capture stored
+
+Two sources, picked with EVENT_SOURCE:
+
+- "change_stream" (default) tails a MongoDB change stream on the watched
+  collections, so the write paths do nothing extra. Requires a replica set.
+  The resume token is saved after every delivered batch, so a restart
+  continues where the last one stopped.
+- "outbox" is for standalone servers: writers call `record_events` right
+  after their own write, which inserts the events into `event_outbox`
+  before the request returns, and the publisher drains that collection in
+  `_id` order.
+
+The publisher is a single asyncio task. It collects up to EVENT_BATCH_SIZE
+events, or whatever arrived within EVENT_BATCH_MAX_WAIT_SECONDS. Each batch
+is POSTed as `{"events": [...]}` to every URL in EVENT_WEBHOOK_URLS, with
+exponential backoff on 5xx, 429 and network errors. A batch a URL still refuses is
+stored in `event_dead_letters` for `replay_dead_letters`. With several
+backend workers, a lease in `event_publisher_state` makes one of them the
+publisher. Delivery is at-least-once; event ids are stable for deduplication.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import uuid4
+
+import httpx
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from app.core.metrics import EVENT_DELIVERIES, EVENT_DELIVERY_LATENCY, EVENTS_PUBLISHED
+from app.core.mongo import db
+
+EVENT_WEBHOOK_URLS = [u.strip() for u in os.getenv("EVENT_WEBHOOK_URLS", "").split(",") if u.strip()]
+EVENT_WEBHOOK_SECRET = os.getenv("EVENT_WEBHOOK_SECRET", "")
+EVENT_SOURCE = os.getenv("EVENT_SOURCE", "change_stream")
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "100"))
+EVENT_BATCH_MAX_WAIT_SECONDS = float(os.getenv("EVENT_BATCH_MAX_WAIT_SECONDS", "1.0"))
+EVENT_DELIVERY_RETRIES = int(os.getenv("EVENT_DELIVERY_RETRIES", "5"))
+EVENT_RETRY_BASE_SECONDS = float(os.getenv("EVENT_RETRY_BASE_SECONDS", "0.5"))
+EVENT_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("EVENT_WEBHOOK_TIMEOUT_SECONDS", "5"))
+EVENT_LEASE_SECONDS = float(os.getenv("EVENT_LEASE_SECONDS", "30"))
+
+SIGNATURE_HEADER = "X-Signature-SHA256"
+EVENT_TYPES = {
+    "chat_messages": "chat.risk_flagged",
+    "mood_checkins": "checkin.created",
+    "face_emotions": "face_emotion.recorded",
+}
+# Fields copied into the event payload; message text is left out on purpose.
+EVENT_FIELDS = {
+    "chat_messages": ("stress_score", "stress_label", "sentiment_label", "analysis_source"),
+    "mood_checkins": ("mood",),
+    "face_emotions": ("emotion", "scores"),
+}
+# MongoDB error codes
+DUPLICATE_KEY = 11000
+CHANGE_STREAM_UNSUPPORTED = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+logger = logging.getLogger(__name__)
+
+
+def is_event(collection: str, doc: dict) -> bool:
+    return collection in EVENT_TYPES and (collection != "chat_messages" or bool(doc.get("risk_flag")))
+
+
+def to_event(collection: str, doc: dict) -> dict:
+    created_at = doc.get("created_at")
+    return {
+        "id": f"{collection}:{doc['_id']}",
+        "type": EVENT_TYPES[collection],
+        "user_id": doc.get("user_id"),
+        "occurred_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+        "data": {k: doc[k] for k in EVENT_FIELDS[collection] if k in doc},
+    }
+
+
+async def _insert_outbox(entries: list[dict]):
+    try:
+        await db.event_outbox.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Entries already stored are fine; anything else must reach the caller.
+        if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+            raise
+
+
+async def record_events(collection: str, docs: list[dict]):
+    """Write side of EVENT_SOURCE=outbox; a no-op for change streams or without webhooks."""
+    if EVENT_SOURCE != "outbox" or not EVENT_WEBHOOK_URLS:
+        return
+    entries = [
+        {"_id": ObjectId(), "event": to_event(collection, d)} for d in docs if is_event(collection, d)
+    ]
+    if entries:
+        # Inline, not on the background queue: a queued insert dies with the
+        # process, and the domain write it belongs to would never be published.
+        await _insert_outbox(entries)
+
+
+def sign(body: bytes, secret: str = EVENT_WEBHOOK_SECRET) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class WebhookSink:
+    """POSTs event batches to one URL, retrying before dead-lettering."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url
+        self.client = client
+
+    async def deliver(self, events: list[dict]) -> bool:
+        body = json.dumps({"events": events}).encode()
+        headers = {"Content-Type": "application/json"}
+        if EVENT_WEBHOOK_SECRET:
+            headers[SIGNATURE_HEADER] = sign(body)
+        start = time.perf_counter()
+        error = None
+        for attempt in range(EVENT_DELIVERY_RETRIES + 1):
+            try:
+                response = await self.client.post(self.url, content=body, headers=headers)
+                response.raise_for_status()
+                EVENT_DELIVERIES.labels("delivered").inc()
+                EVENT_DELIVERY_LATENCY.observe(time.perf_counter() - start)
+                return True
+            except httpx.HTTPStatusError as e:
+                error = f"HTTP {e.response.status_code}"
+                if e.response.status_code < 500 and e.response.status_code != 429:
+                    break  # the receiver rejected the batch; retrying will not help
+            except httpx.HTTPError as e:
+                error = repr(e)
+            if attempt < EVENT_DELIVERY_RETRIES:
+                EVENT_DELIVERIES.labels("retried").inc()
+                await asyncio.sleep(random.uniform(0.5, 1.0) * EVENT_RETRY_BASE_SECONDS * 2 ** attempt)
+
+        EVENT_DELIVERIES.labels("dead_lettered").inc()
+        logger.error("Dead-lettering %d events for %s: %s", len(events), self.url, error)
+        await db.event_dead_letters.insert_one(
+            {"url": self.url, "events": events, "error": error, "failed_at": datetime.utcnow()}
+        )
+        return False
+
+
+class EventPublisher:
+    def __init__(self, urls: list[str] = EVENT_WEBHOOK_URLS, source: str = EVENT_SOURCE):
+        self.source = source
+        self.owner = uuid4().hex
+        self._client = httpx.AsyncClient(timeout=EVENT_WEBHOOK_TIMEOUT_SECONDS)
+        self.sinks = [WebhookSink(url, self._client) for url in urls]
+        self._lease_until = 0.0
+
+    async def publish(self, events: list[dict]):
+        for event in events:
+            EVENTS_PUBLISHED.labels(event["type"]).inc()
+        await asyncio.gather(*(sink.deliver(events) for sink in self.sinks))
+
+    async def _hold_lease(self) -> bool:
+        """Take or renew the publisher lease; False if another worker holds it."""
+        if time.monotonic() < self._lease_until - EVENT_LEASE_SECONDS / 2:
+            return True
+        now = datetime.utcnow()
+        try:
+            await db.event_publisher_state.update_one(
+                {"_id": "lease", "$or": [{"owner": self.owner}, {"expires": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires": now + timedelta(seconds=EVENT_LEASE_SECONDS)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            self._lease_until = 0.0
+            return False
+        self._lease_until = time.monotonic() + EVENT_LEASE_SECONDS
+        return True
+
+    async def _tail_change_stream(self):
+        state = await db.event_publisher_state.find_one({"_id": "change_stream"}) or {}
+        saved_token = state.get("resume_token")
+        pipeline = [
+            {"$match": {
+                "operationType": "insert",
+                "ns.coll": {"$in": list(EVENT_TYPES)},
+                "$or": [{"ns.coll": {"$ne": "chat_messages"}}, {"fullDocument.risk_flag": True}],
+            }}
+        ]
+        async with db.watch(
+            pipeline,
+            resume_after=saved_token,
+            max_await_time_ms=int(EVENT_BATCH_MAX_WAIT_SECONDS * 1000),
+        ) as stream:
+            while await self._hold_lease():
+                batch: list[dict] = []
+                deadline = time.monotonic() + EVENT_BATCH_MAX_WAIT_SECONDS
+                while len(batch) < EVENT_BATCH_SIZE and time.monotonic() < deadline:
+                    change = await stream.try_next()
+                    if change is None:
+                        break
+                    batch.append(to_event(change["ns"]["coll"], change["fullDocument"]))
+                if batch:
+                    await self.publish(batch)
+                token = stream.resume_token
+                if token is not None and token != saved_token:
+                    await db.event_publisher_state.update_one(
+                        {"_id": "change_stream"},
+                        {"$set": {"resume_token": token, "updated": datetime.utcnow()}},
+                        upsert=True,
+                    )
+                    saved_token = token
+
+    async def _drain_outbox(self):
+        while await self._hold_lease():
+            entries = await db.event_outbox.find().sort("_id", 1).limit(EVENT_BATCH_SIZE).to_list(EVENT_BATCH_SIZE)
+            if not entries:
+                await asyncio.sleep(EVENT_BATCH_MAX_WAIT_SECONDS)
+                continue
+            await self.publish([e["event"] for e in entries])
+            await db.event_outbox.delete_many({"_id": {"$in": [e["_id"] for e in entries]}})
+
+    async def run(self):
+        """Publish until cancelled; started from main.py when EVENT_WEBHOOK_URLS is set."""
+        tail = self._drain_outbox if self.source == "outbox" else self._tail_change_stream
+        while True:
+            try:
+                if await self._hold_lease():
+                    await tail()
+                else:
+                    await asyncio.sleep(EVENT_LEASE_SECONDS / 2)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    logger.error("Change streams need a replica set; set EVENT_SOURCE=outbox instead")
+                    return
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Event resume token expired; continuing from now, some events were missed")
+                    await db.event_publisher_state.delete_one({"_id": "change_stream"})
+                    continue
+                logger.error("Event publisher failed: %r", e)
+                await asyncio.sleep(EVENT_BATCH_MAX_WAIT_SECONDS)
+            except Exception as e:
+                logger.error("Event publisher failed: %r", e)
+                await asyncio.sleep(EVENT_BATCH_MAX_WAIT_SECONDS)
+
+    async def close(self):
+        await self._client.aclose()
+        await db.event_publisher_state.delete_one({"_id": "lease", "owner": self.owner})
+
+
+async def replay_dead_letters(url: Optional[str] = None, limit: int = 100) -> dict:
+    """Redeliver dead-lettered batches (optionally for one URL); failures are stored again."""
+    # Letters stored by this run's own failed deliveries are left for the next one.
+    query = {"failed_at": {"$lte": datetime.utcnow()}}
+    if url:
+        query["url"] = url
+    report = {"replayed": 0, "failed": 0}
+    async with httpx.AsyncClient(timeout=EVENT_WEBHOOK_TIMEOUT_SECONDS) as client:
+        async for letter in db.event_dead_letters.find(query).sort("failed_at", 1).limit(limit):
+            ok = await WebhookSink(letter["url"], client).deliver(letter["events"])
+            # Removed only once deliver() returns: on failure it has stored a new
+            # letter, and a crash mid-delivery keeps this one for the next replay.
+            await db.event_dead_letters.delete_one({"_id": letter["_id"]})
+            report["replayed" if ok else "failed"] += 1
+    return report
@@ -0,0 +1,122 @@
+"""
+Daily face-emotion aggregates for the dashboard.
+
+Each `face_emotions` document stores the classifier's `scores` dict. Scores
+are packed into fixed-order NumPy rows (FACE_LABELS), so a day's
+distribution is a single vectorized mean over however many captures it has.
+
+Finished days never change, so their aggregates are cached in
+`face_emotion_daily` (one document per user, `through` = last cached day)
+and only captures after that day are read on each dashboard request.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+from app.core.metrics import CACHE_HITS, CACHE_MISSES
+from app.core.mongo import db
+
+FACE_LABELS = ("sad", "disgust", "angry", "neutral", "fear", "surprise", "happy")
+# How much each emotion counts towards the face stress signal.
+FACE_STRESS_WEIGHTS = np.array([0.6, 0.5, 0.8, 0.0, 1.0, 0.3, 0.0])
+# Share of the fused stress score taken from the face signal on days with captures.
+FACE_STRESS_FUSION_WEIGHT = float(os.getenv("FACE_STRESS_FUSION_WEIGHT", "0.3"))
+
+_LABEL_INDEX = {label: i for i, label in enumerate(FACE_LABELS)}
+
+
+def scores_matrix(score_dicts: list[dict]) -> np.ndarray:
+    """Pack score dicts into an (n, len(FACE_LABELS)) array; each row sums to 1.
+    Dicts with none of FACE_LABELS are dropped."""
+    matrix = np.zeros((len(score_dicts), len(FACE_LABELS)))
+    for row, scores in enumerate(score_dicts):
+        for label, value in scores.items():
+            col = _LABEL_INDEX.get(label.lower())
+            if col is not None:
+                matrix[row, col] = value
+    totals = matrix.sum(axis=1, keepdims=True)
+    keep = totals[:, 0] > 0
+    return matrix[keep] / totals[keep]
+
+
+def summarize_day(matrix: np.ndarray) -> dict:
+    distribution = matrix.mean(axis=0)
+    return {
+        "distribution": distribution.round(4).tolist(),
+        "captures": int(matrix.shape[0]),
+    }
+
+
+def day_view(cached: dict) -> dict:
+    """Dashboard fields for one day's cached aggregate."""
+    distribution = np.asarray(cached["distribution"])
+    return {
+        "face_distribution": dict(zip(FACE_LABELS, distribution.tolist())),
+        "dominant_emotion": FACE_LABELS[int(distribution.argmax())],
+        "face_captures": cached["captures"],
+        "face_stress": float(distribution @ FACE_STRESS_WEIGHTS),
+    }
+
+
+def fuse_stress(text_stress: float, face_stress: Optional[float]) -> float:
+    if face_stress is None:
+        return text_stress
+    w = FACE_STRESS_FUSION_WEIGHT
+    return (1 - w) * text_stress + w * face_stress
+
+
+async def _daily_from_captures(user_id: str, since: Optional[datetime]) -> dict:
+    query: dict = {"user_id": user_id, "scores": {"$type": "object"}}
+    if since is not None:
+        query["created_at"] = {"$gte": since}
+    per_day: dict = defaultdict(list)
+    cursor = db.face_emotions.find(query, {"scores": 1, "created_at": 1, "_id": 0})
+    async for doc in cursor.batch_size(1000):
+        created_at = doc.get("created_at")
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        if created_at:
+            per_day[created_at.date().isoformat()].append(doc["scores"])
+    daily = {}
+    for day, rows in per_day.items():
+        matrix = scores_matrix(rows)
+        if len(matrix):
+            daily[day] = summarize_day(matrix)
+    return daily
+
+
+async def face_daily_aggregates(user_id: str) -> dict:
+    """{day: summarize_day(...)} for all of a user's captures, using the per-day cache."""
+    cache = await db.face_emotion_daily.find_one({"_id": user_id}) or {}
+    days: dict = dict(cache.get("days") or {})
+    through = cache.get("through")
+    since = None
+    if through:
+        CACHE_HITS.labels("face_daily").inc()
+        since = datetime.fromisoformat(through) + timedelta(days=1)
+    else:
+        CACHE_MISSES.labels("face_daily").inc()
+
+    fresh = await _daily_from_captures(user_id, since)
+    days.update(fresh)
+
+    today = datetime.utcnow().date().isoformat()
+    finished = {day: agg for day, agg in fresh.items() if day < today}
+    yesterday = (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+    if finished or through != yesterday:
+        await db.face_emotion_daily.update_one(
+            {"_id": user_id},
+            {
+                "$set": {"through": yesterday, **{f"days.{d}": agg for d, agg in finished.items()}},
+            },
+            upsert=True,
+        )
+    return days
+
+
+async def invalidate_face_cache(user_id: str):
+    """Drop the cached aggregates, e.g. after captures were imported for past days."""
+    await db.face_emotion_daily.delete_one({"_id": user_id})
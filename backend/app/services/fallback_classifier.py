@@ -0,0 +1,181 @@
+"""
+Tiny in-process text classifier used when the ML service is slow or down.
+
+Scores come from a keyword lexicon plus, when an artifact is available, a
+hashed-feature linear model trained offline from the BERT labels stored in
+`chat_messages` (see scripts/train_fallback_classifier.py). The output has
+the same shape as ml_service's /analyze response, so the chat pipeline
+does not care which path produced it.
+"""
+import gzip
+import json
+import math
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Optional
+
+SENTIMENT_CLASSES = ["very_negative", "negative", "neutral", "positive"]
+STRESS_CLASSES = ["not_stressed", "stressed"]
+
+N_FEATURES = 2 ** 18
+RISK_THRESHOLD = 0.8
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parents[2] / "models" / "fallback_classifier.json.gz"
+FALLBACK_MODEL_PATH = Path(os.getenv("FALLBACK_MODEL_PATH", str(DEFAULT_MODEL_PATH)))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Lexicon weights are added to the stress logit / sentiment scores.
+STRESS_LEXICON = {
+    "stressed": 1.5, "stress": 1.2, "anxious": 1.4, "anxiety": 1.4, "panic": 1.8,
+    "overwhelmed": 1.8, "exhausted": 1.0, "cant sleep": 1.2, "insomnia": 1.0,
+    "scared": 1.0, "afraid": 1.0, "hopeless": 2.0, "worthless": 2.0, "alone": 0.8,
+    "cry": 1.0, "crying": 1.0, "pressure": 0.8, "deadline": 0.6, "burnout": 1.5,
+    "stressé": 1.5, "stressée": 1.5, "angoisse": 1.5, "épuisé": 1.0, "épuisée": 1.0,
+    "gestresst": 1.5, "angst": 1.2, "überfordert": 1.8,
+    "calm": -1.2, "relaxed": -1.4, "fine": -0.6, "good": -0.6, "great": -1.0,
+    "happy": -1.2, "peaceful": -1.4, "rested": -1.0, "calme": -1.2, "entspannt": -1.4,
+}
+
+# Phrases that always raise the risk flag, regardless of the score.
+CRISIS_LEXICON = (
+    "kill myself", "end my life", "suicide", "suicidal", "want to die", "self harm",
+    "hurt myself", "me tuer", "suicider", "umbringen", "nicht mehr leben",
+)
+
+SENTIMENT_LEXICON = {
+    "hopeless": -2.0, "worthless": -2.0, "hate": -1.5, "terrible": -1.5, "awful": -1.5,
+    "sad": -1.0, "bad": -0.8, "overwhelmed": -1.0, "anxious": -0.8, "tired": -0.5, "angry": -1.0, "lonely": -1.0, "triste": -1.0,
+    "good": 1.0, "great": 1.5, "happy": 1.5, "better": 0.8, "calm": 0.8, "grateful": 1.5,
+    "thanks": 0.5, "love": 1.2, "content": 1.0, "heureux": 1.5, "heureuse": 1.5, "gut": 1.0,
+}
+
+
+def tokenize(text: str) -> list[str]:
+    # Drop apostrophes so "can't" and "cant" hash the same.
+    return _WORD_RE.findall(text.lower().replace("'", "").replace("\u2019", ""))
+
+
+def features(text: str, n_features: int = N_FEATURES) -> dict[int, float]:
+    """Signed hashed unigram + bigram counts, L2-normalised."""
+    tokens = tokenize(text)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vec: dict[int, float] = {}
+    for g in grams:
+        h = zlib.crc32(g.encode("utf-8"))
+        idx = h % n_features
+        sign = 1.0 if (h >> 31) & 1 == 0 else -1.0
+        vec[idx] = vec.get(idx, 0.0) + sign
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {i: v / norm for i, v in vec.items()}
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def _softmax(values: list[float]) -> list[float]:
+    top = max(values)
+    exps = [math.exp(v - top) for v in values]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def _lexicon_score(tokens: list[str], lexicon: dict[str, float]) -> float:
+    joined = " ".join(tokens)
+    score = 0.0
+    for term, weight in lexicon.items():
+        if " " in term:
+            if term in joined:
+                score += weight
+        elif term in tokens:
+            score += weight
+    return score
+
+
+class FallbackClassifier:
+    def __init__(self, artifact: Optional[dict] = None):
+        self.artifact = artifact
+        if artifact:
+            self.n_features = int(artifact["n_features"])
+            stress = artifact["stress"]
+            self.stress_bias = float(stress["bias"])
+            self.stress_weights = {int(k): float(v) for k, v in stress["weights"].items()}
+            sentiment = artifact["sentiment"]
+            self.sentiment_bias = [float(b) for b in sentiment["bias"]]
+            self.sentiment_weights = {
+                int(k): [float(w) for w in v] for k, v in sentiment["weights"].items()
+            }
+        else:
+            self.n_features = N_FEATURES
+
+    @classmethod
+    def load(cls, path: Path = FALLBACK_MODEL_PATH) -> "FallbackClassifier":
+        """Load the trained artifact if present, otherwise run lexicon-only."""
+        if not path.exists():
+            return cls()
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def has_model(self) -> bool:
+        return self.artifact is not None
+
+    def stress_logit(self, vec: dict[int, float]) -> float:
+        if not self.has_model:
+            return -1.0
+        return self.stress_bias + sum(self.stress_weights.get(i, 0.0) * v for i, v in vec.items())
+
+    def sentiment_scores(self, vec: dict[int, float]) -> list[float]:
+        if not self.has_model:
+            return [0.0, 0.0, 0.5, 0.0]
+        scores = list(self.sentiment_bias)
+        for i, v in vec.items():
+            w = self.sentiment_weights.get(i)
+            if w:
+                for c in range(len(scores)):
+                    scores[c] += w[c] * v
+        return scores
+
+    def analyze(self, text: str) -> dict:
+        tokens = tokenize(text)
+        vec = features(text, self.n_features)
+
+        joined = " ".join(tokens)
+        crisis = any(term in joined for term in CRISIS_LEXICON)
+
+        stress_score = _sigmoid(self.stress_logit(vec) + _lexicon_score(tokens, STRESS_LEXICON))
+        if crisis:
+            stress_score = max(stress_score, RISK_THRESHOLD + 0.01)
+        stress_probs = {"not_stressed": 1.0 - stress_score, "stressed": stress_score}
+
+        sent = self.sentiment_scores(vec)
+        lex = _lexicon_score(tokens, SENTIMENT_LEXICON)
+        # Push mass towards the negative or positive end of the scale.
+        sent = [sent[0] - lex, sent[1] - 0.5 * lex, sent[2], sent[3] + lex]
+        sent_probs = _softmax(sent)
+        sent_idx = max(range(len(sent_probs)), key=sent_probs.__getitem__)
+
+        return {
+            "sentiment_label": SENTIMENT_CLASSES[sent_idx],
+            "sentiment_probs": {c: sent_probs[i] for i, c in enumerate(SENTIMENT_CLASSES)},
+            "stress_label": "stressed" if stress_score >= 0.5 else "not_stressed",
+            "stress_probs": stress_probs,
+            "stress_score": stress_score,
+            # Without a trained model the lexicon alone is too coarse to raise risk.
+            "risk_flag": crisis or (self.has_model and stress_score > RISK_THRESHOLD),
+        }
+
+
+_classifier: Optional[FallbackClassifier] = None
+
+
+def get_fallback_classifier() -> FallbackClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = FallbackClassifier.load()
+    return _classifier
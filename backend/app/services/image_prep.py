@@ -0,0 +1,88 @@
+"""
+Shrinks face uploads before they are sent to the ML engine.
+
+The face model sees a 224x224 input, but phone cameras send 12+ megapixel
+JPEGs. Decoding and posting those at full size wastes bandwidth and
+ml_service CPU. `prepare_face_image` brings the shorter side down to
+FACE_IMAGE_SIDE pixels, a little above the model's input, and re-encodes
+the result as a JPEG:
+
+- JPEGs are decoded in draft mode, so libjpeg scales by 1/2, 1/4 or 1/8
+  while decoding and never builds the full-size bitmap; a resize finishes
+  the job;
+- EXIF orientation is applied before re-encoding, which drops the EXIF
+  block;
+- images already at or below the target size are forwarded unchanged.
+
+The work runs on a small thread pool (FACE_PREP_WORKERS). Pillow releases
+the GIL while it decodes and resizes, so the event loop keeps serving
+requests. Images over FACE_MAX_PIXELS are rejected from their header,
+before any pixel is decoded.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from app.core.metrics import FACE_IMAGE_BYTES
+from app.core.tracing import span
+from app.services.ml_engine import InvalidImage
+
+FACE_UPLOAD_MAX_BYTES = int(os.getenv("FACE_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+FACE_MAX_PIXELS = int(os.getenv("FACE_MAX_PIXELS", str(50_000_000)))
+FACE_IMAGE_SIDE = int(os.getenv("FACE_IMAGE_SIDE", "256"))
+FACE_JPEG_QUALITY = int(os.getenv("FACE_JPEG_QUALITY", "90"))
+FACE_PREP_WORKERS = int(os.getenv("FACE_PREP_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=FACE_PREP_WORKERS, thread_name_prefix="face-prep")
+
+
+class ImageTooLarge(ValueError):
+    """The image has more pixels than FACE_MAX_PIXELS."""
+
+
+def _decode_shrunk(image: Image.Image, side: int) -> Image.Image:
+    scale = side / min(image.size)
+    image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    scale = side / min(image.size)
+    if scale < 1:
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(target, Image.Resampling.BICUBIC, reducing_gap=2.0)
+    return image
+
+
+def shrink_image(content: bytes, content_type: str, side: int = FACE_IMAGE_SIDE) -> tuple[bytes, str]:
+    """(image bytes, content type) with the shorter side at most `side` pixels."""
+    try:
+        image = Image.open(BytesIO(content))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    except (OSError, SyntaxError, ValueError) as e:
+        # PIL raises UnidentifiedImageError (an OSError) for undecodable uploads.
+        raise InvalidImage(str(e)) from e
+    width, height = image.size
+    if width * height > FACE_MAX_PIXELS:
+        raise ImageTooLarge(f"{width}x{height} exceeds {FACE_MAX_PIXELS} pixels")
+    if min(width, height) <= side:
+        return content, content_type
+
+    try:
+        image = _decode_shrunk(image, side)  # draft() is a no-op for non-JPEGs
+    except (OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(str(e)) from e
+    out = BytesIO()
+    image.save(out, "JPEG", quality=FACE_JPEG_QUALITY)
+    return out.getvalue(), "image/jpeg"
+
+
+async def prepare_face_image(content: bytes, content_type: str) -> tuple[bytes, str]:
+    """Shrink an upload off the event loop; raises InvalidImage or ImageTooLarge."""
+    FACE_IMAGE_BYTES.labels("upload").observe(len(content))
+    loop = asyncio.get_running_loop()
+    with span("face.prepare"):
+        content, content_type = await loop.run_in_executor(_executor, shrink_image, content, content_type)
+    FACE_IMAGE_BYTES.labels("forwarded").observe(len(content))
+    return content, content_type
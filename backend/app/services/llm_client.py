@@ -1,23 +1,265 @@
+import asyncio
 import os
-from typing import List, Dict, Any
+import random
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional
 
 import httpx
 
+from app.core.admission import (
+    ADMISSION_WAIT_SECONDS,
+    LLM_BACKGROUND_RESERVE,
+    CapacityExceeded,
+    llm_limiter,
+)
+from app.core.metrics import (
+    LLM_BREAKER_STATE,
+    LLM_CALLS,
+    LLM_HEDGES,
+    LLM_LATENCY,
+    LLM_RETRIES,
+)
+
 # alias for chat message structure
 ChatMessage = Dict[str, str]
 
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "40"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.25"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Below this much remaining budget an attempt cannot realistically succeed.
+MIN_ATTEMPT_SECONDS = 0.2
+
+# Status codes where the provider rejected the request before doing any work,
+# so sending it again cannot produce a duplicate completion.
+RETRYABLE_STATUS = {429, 503}
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised when the LLM is skipped or gave up; `reason` is a short metric label."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(detail or reason)
+        self.reason = reason
+
 
-async def generate_llm_reply(messages: List[ChatMessage]) -> str:
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: after `failure_threshold` failures calls are
+    skipped for `reset_timeout` seconds, then a single trial call is let
+    through (half-open) to decide whether to close again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._export()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._export()
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self._export()
+
+    def release_trial(self):
+        """End a half-open trial that produced no verdict (cancelled, or never sent)."""
+        self._trial_in_flight = False
+
+    def _export(self):
+        LLM_BREAKER_STATE.set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state])
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, used for the hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+latencies = LatencyTracker()
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=LLM_TIMEOUT_SECONDS)
+    return _client
+
+
+async def close_llm_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def llm_status() -> dict:
+    """Breaker state and latency snapshot for health/diagnostics endpoints."""
+    return {
+        "breaker_state": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "p95_seconds": latencies.p95(),
+        "hedging": LLM_HEDGE,
+    }
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return False
+
+
+async def _post(url: str, payload: dict, headers: dict, timeout: float) -> dict:
+    resp = await _get_client().post(url, json=payload, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _hedged_post(url: str, payload: dict, headers: dict, timeout: float) -> dict:
+    """Send the request; if it is slower than the recent p95, race a second copy."""
+    hedge_after = latencies.p95() if LLM_HEDGE else None
+    primary = asyncio.create_task(_post(url, payload, headers, timeout))
+    if hedge_after is None or hedge_after >= timeout:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    secondary = asyncio.create_task(_post(url, payload, headers, timeout - hedge_after))
+    pending = {primary, secondary}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    LLM_HEDGES.labels("won" if task is secondary else "lost").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def generate_llm_reply(messages: List[ChatMessage], deadline: Optional[float] = None) -> str:
     """
     Call Groq's OpenAI-compatible ChatCompletion API.
+
+    `deadline` is a `time.monotonic()` timestamp; the call (including retries)
+    never runs past it. Raises LLMUnavailable when the breaker is open, the
+    budget runs out or no in-flight slot frees up, so callers can fall back
+    immediately.
     """
+    if deadline is None:
+        deadline = time.monotonic() + LLM_TIMEOUT_SECONDS
+    try:
+        async with llm_limiter.slot(wait=min(ADMISSION_WAIT_SECONDS, deadline - time.monotonic())):
+            return await _generate_llm_reply(messages, deadline)
+    except CapacityExceeded as e:
+        LLM_CALLS.labels("overloaded").inc()
+        raise LLMUnavailable("overloaded", str(e)) from e
+
+
+async def _generate_llm_reply(messages: List[ChatMessage], deadline: float) -> str:
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise RuntimeError("GROQ_API_KEY is missing in environment variables")
 
+    # No await in between, so a half-open state here means this call is the trial.
+    trial = breaker.state == breaker.HALF_OPEN
+    if not breaker.allow():
+        LLM_CALLS.labels("skipped").inc()
+        raise LLMUnavailable("circuit_open", "LLM circuit breaker is open")
+    try:
+        return await _call_provider(messages, deadline, api_key)
+    finally:
+        # A trial that was cancelled (client gone, caller's wait_for) or never
+        # sent must not keep the breaker half-open with no way out.
+        if trial:
+            breaker.release_trial()
+
+
+async def generate_background_llm_reply(messages: List[ChatMessage], deadline: float) -> str:
+    """
+    LLM call for background work such as conversation summaries.
+
+    It only runs while the chat breaker is closed, and it never moves the
+    breaker, so background failures cannot cut live chats off the LLM. It
+    takes an llm_limiter slot only while LLM_BACKGROUND_RESERVE slots stay
+    free for chats, and it never waits for one. It is not hedged and stays
+    out of the chat latency window. Raises LLMUnavailable when skipped.
+    """
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY is missing in environment variables")
+    if breaker.state != breaker.CLOSED:
+        LLM_CALLS.labels("skipped").inc()
+        raise LLMUnavailable("circuit_open", "LLM circuit breaker is not closed")
+    try:
+        async with llm_limiter.background_slot(LLM_BACKGROUND_RESERVE):
+            return await _call_provider(messages, deadline, api_key, background=True)
+    except CapacityExceeded as e:
+        LLM_CALLS.labels("overloaded").inc()
+        raise LLMUnavailable("overloaded", str(e)) from e
+
+
+async def _call_provider(
+    messages: List[ChatMessage], deadline: float, api_key: str, background: bool = False
+) -> str:
+    """Send the completion with retries; background calls leave the breaker and latency window alone."""
     model = os.getenv("GROQ_MODEL_ID", "llama-3.1-70b-versatile")
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    base_url = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1")
+    url = f"{base_url.rstrip('/')}/chat/completions"
     payload: dict[str, Any] = {
         "model": model,
         "messages": messages,
@@ -30,9 +272,46 @@ async def generate_llm_reply(messages: List[ChatMessage]) -> str:
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient(timeout=40) as client:
-        resp = await client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining < MIN_ATTEMPT_SECONDS:
+            if attempt and not background:
+                # Only count the provider's failure, not a caller budget that
+                # ran out before anything was sent.
+                breaker.record_failure()
+            LLM_CALLS.labels("deadline").inc()
+            raise LLMUnavailable("deadline", "Chat budget exhausted before the LLM replied")
+
+        timeout = min(remaining, LLM_TIMEOUT_SECONDS)
+        start = time.perf_counter()
+        try:
+            post = _post if background else _hedged_post
+            data = await asyncio.wait_for(post(url, payload, headers, timeout), timeout)
+        except Exception as e:
+            LLM_LATENCY.observe(time.perf_counter() - start)
+            backoff = random.uniform(0, LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+            if (
+                attempt < LLM_MAX_RETRIES
+                and _is_retryable(e)
+                and deadline - time.monotonic() - backoff >= MIN_ATTEMPT_SECONDS
+            ):
+                attempt += 1
+                LLM_RETRIES.inc()
+                await asyncio.sleep(backoff)
+                continue
+            if not background:
+                breaker.record_failure()
+            if isinstance(e, asyncio.TimeoutError):
+                LLM_CALLS.labels("deadline").inc()
+                raise LLMUnavailable("deadline", "LLM did not reply within the chat budget") from e
+            LLM_CALLS.labels("error").inc()
+            raise
 
-    return data["choices"][0]["message"]["content"]
+        elapsed = time.perf_counter() - start
+        LLM_LATENCY.observe(elapsed)
+        if not background:
+            latencies.add(elapsed)
+            breaker.record_success()
+        LLM_CALLS.labels("success").inc()
+        return data["choices"][0]["message"]["content"]
@@ -0,0 +1,344 @@
+"""
+Text and face analysis engines behind the chat and emotion endpoints.
+
+ML_MODE selects how analysis runs:
+
+- "remote" (default): HTTP calls to ml_service at ML_SERVICE_URL, or
+  balanced over the replicas in ML_SERVICE_URLS (see ml_replicas.py),
+  in msgpack when the replica supports it (see ml_protocol.py).
+- "embedded": the ml_service pipeline (`ml_service/app/main.py`) is loaded
+  into a spawned process-pool worker, so torch never runs on the event
+  loop. Requests and results cross the process boundary as raw bytes and
+  small tuples of floats, with no JSON or multipart encoding.
+
+Both engines return the same dicts as ml_service's HTTP API.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from app.core.admission import ml_limiter
+from app.core.metrics import ML_CALLS, ML_LATENCY
+from app.core.tracing import propagation_headers, record_server_timing, span
+from app.services import ml_protocol
+from app.services.ml_replicas import Replica, ReplicaPool, replica_urls
+
+load_dotenv()
+
+ML_MODE = os.getenv("ML_MODE", "remote")
+ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://127.0.0.1:8002")
+ML_SERVICE_URLS = os.getenv("ML_SERVICE_URLS", "")
+ML_SERVICE_DIR = os.getenv(
+    "ML_SERVICE_DIR", str(Path(__file__).resolve().parents[3] / "ml_service")
+)
+ML_EMBEDDED_WORKERS = int(os.getenv("ML_EMBEDDED_WORKERS", "1"))
+ML_FACE_TIMEOUT_SECONDS = float(os.getenv("ML_FACE_TIMEOUT_SECONDS", "40"))
+ML_SCHEMA_TIMEOUT_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# Worker-process side of the embedded engine
+# ---------------------------------------------------------------------------
+
+_ml_main = None
+_ml_face = None
+
+
+def _init_worker(ml_service_dir: str):
+    """
+    Import ml_service inside the worker. Both projects use a top-level `app`
+    package, so the backend's modules are set aside while ml_service's are
+    imported and put back afterwards; the ml_service objects keep working
+    through the references held here.
+    """
+    global _ml_main, _ml_face
+    backend_modules = {
+        name: mod for name, mod in sys.modules.items() if name == "app" or name.startswith("app.")
+    }
+    for name in backend_modules:
+        del sys.modules[name]
+    sys.path.insert(0, ml_service_dir)
+    try:
+        import app.emotion_face as ml_face
+        import app.main as ml_main
+    finally:
+        sys.path.remove(ml_service_dir)
+        for name in [n for n in sys.modules if n == "app" or n.startswith("app.")]:
+            sys.modules["ml_service." + name] = sys.modules.pop(name)
+        sys.modules.update(backend_modules)
+    _ml_main, _ml_face = ml_main, ml_face
+
+
+def _worker_schema() -> tuple[list[str], list[str]]:
+    return list(_ml_main.sentiment_classes), list(_ml_main.stress_classes)
+
+
+def _worker_analyze(text: str) -> tuple:
+    result = _ml_main.analyze_text(text)  # goes through ml_service's cascade
+    return (
+        [result["sentiment_probs"][c] for c in _ml_main.sentiment_classes],
+        [result["stress_probs"][c] for c in _ml_main.stress_classes],
+        result["stress_score"],
+        result["risk_flag"],
+    )
+
+
+def _worker_face(content: bytes) -> tuple[str, dict]:
+    return _ml_face.predict_face_emotion(_ml_face.decode_image(content))
+
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+
+
+class InvalidImage(ValueError):
+    """The ML side could not decode the uploaded image."""
+
+
+class RemoteEngine:
+    mode = "remote"
+
+    def __init__(self, urls: Optional[list[str]] = None):
+        self.pool = ReplicaPool(urls or replica_urls(ML_SERVICE_URLS, ML_SERVICE_URL))
+        self._client: Optional[httpx.AsyncClient] = None
+        self._schemas: dict[str, dict] = {}  # schema id -> label order, for msgpack rows
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+        return self._client
+
+    async def start(self):
+        if len(self.pool.replicas) > 1:
+            self.pool.start(self._http())
+
+    async def close(self):
+        await self.pool.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, path: str, face: bool, timeout: float, encode) -> tuple[httpx.Response, Replica]:
+        """
+        POST to a picked replica; `encode(replica)` returns the request kwargs.
+        A call that never connected is retried once on another replica.
+        """
+        replica = self.pool.pick(face)
+        try:
+            async with self.pool.use(replica):
+                return await self._send_encoded(replica, path, timeout, encode), replica
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            retry = self.pool.pick(face, exclude=replica)
+            if retry is replica:
+                raise
+        async with self.pool.use(retry):
+            return await self._send_encoded(retry, path, timeout, encode), retry
+
+    async def _send_encoded(self, replica: Replica, path: str, timeout: float, encode) -> httpx.Response:
+        resp = await self._send(replica, path, timeout, encode(replica))
+        if resp.status_code == 415 and replica.binary:
+            # The replica no longer takes msgpack bodies (rolled back, or
+            # restarted with ML_BINARY_PROTOCOL=0); resend this call as JSON.
+            logger.warning("%s rejected a msgpack body; switching it back to JSON requests", replica.url)
+            replica.binary = False
+            resp = await self._send(replica, path, timeout, encode(replica))
+        return resp
+
+    async def _send(self, replica: Replica, path: str, timeout: float, kwargs: dict) -> httpx.Response:
+        headers = {**propagation_headers(), "Accept": ml_protocol.ACCEPT, **kwargs.pop("headers", {})}
+        resp = await self._http().post(replica.url + path, headers=headers, timeout=timeout, **kwargs)
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+        return resp
+
+    async def _decode(self, resp: httpx.Response, replica: Replica) -> tuple[object, Optional[dict]]:
+        """(payload, labels); labels is None for JSON responses."""
+        record_server_timing(resp.headers.get("Server-Timing"), "ml_service")
+        if not ml_protocol.is_msgpack(resp.headers.get("content-type")):
+            return resp.json(), None
+        replica.binary = True
+        schema_id = resp.headers.get(ml_protocol.SCHEMA_HEADER)
+        labels = self._schemas.get(schema_id)
+        if labels is None:
+            schema = (await self._http().get(f"{replica.url}/schema", timeout=ML_SCHEMA_TIMEOUT_SECONDS)).json()
+            self._schemas[schema["id"]] = schema["labels"]
+            if schema["id"] != schema_id:
+                raise ml_protocol.SchemaMismatch(
+                    f"{replica.url} answered with schema {schema_id!r} but /schema is {schema['id']!r}"
+                )
+            labels = schema["labels"]
+        return ml_protocol.unpackb(resp.content), labels
+
+    async def analyze(self, text: str, timeout: float) -> dict:
+        def encode(replica: Replica) -> dict:
+            if replica.binary:
+                return {
+                    "content": ml_protocol.packb({"text": text}),
+                    "headers": {"Content-Type": ml_protocol.MSGPACK_TYPE},
+                }
+            return {"json": {"text": text}}
+
+        resp, replica = await self._post("/analyze", False, timeout, encode)
+        resp.raise_for_status()
+        payload, labels = await self._decode(resp, replica)
+        return ml_protocol.unpack_analysis(payload, labels) if labels else payload
+
+    async def analyze_face(self, filename: str, content: bytes, content_type: str, timeout: float) -> dict:
+        def encode(replica: Replica) -> dict:
+            if replica.binary:
+                return {"content": content, "headers": {"Content-Type": content_type}}
+            return {"files": {"file": (filename, content, content_type)}}
+
+        resp, replica = await self._post("/api/emotion/face", True, timeout, encode)
+        if resp.status_code == 400:
+            raise InvalidImage(resp.text)
+        resp.raise_for_status()
+        payload, labels = await self._decode(resp, replica)
+        return ml_protocol.unpack_face(payload, labels) if labels else payload
+
+    def status(self) -> dict:
+        return {"replicas": self.pool.status()}
+
+
+class EmbeddedEngine:
+    mode = "embedded"
+
+    def __init__(self, ml_service_dir: str = ML_SERVICE_DIR, workers: int = ML_EMBEDDED_WORKERS):
+        self.ml_service_dir = ml_service_dir
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._sentiment_classes: list[str] = []
+        self._stress_classes: list[str] = []
+
+    async def start(self):
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.ml_service_dir,),
+        )
+        # Loads the models now rather than on the first chat message.
+        self._sentiment_classes, self._stress_classes = await self._run(_worker_schema)
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, fn, *args, timeout: Optional[float] = None):
+        if self._pool is None:
+            await self.start()
+        pool = self._pool
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), timeout)
+        except BrokenProcessPool:
+            # A worker died (OOM, native crash) and the executor refuses all
+            # further work; drop it so the next call starts a fresh pool.
+            if self._pool is pool:
+                logger.error("Embedded ML worker pool broke; restarting it on the next call")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            raise
+
+    async def analyze(self, text: str, timeout: float) -> dict:
+        sent_probs, stress_probs, stress_score, risk_flag = await self._run(
+            _worker_analyze, text, timeout=timeout
+        )
+        sent_idx = max(range(len(sent_probs)), key=sent_probs.__getitem__)
+        stress_idx = max(range(len(stress_probs)), key=stress_probs.__getitem__)
+        return {
+            "sentiment_label": self._sentiment_classes[sent_idx],
+            "sentiment_probs": dict(zip(self._sentiment_classes, sent_probs)),
+            "stress_label": self._stress_classes[stress_idx],
+            "stress_probs": dict(zip(self._stress_classes, stress_probs)),
+            "stress_score": stress_score,
+            "risk_flag": risk_flag,
+        }
+
+    async def analyze_face(self, filename: str, content: bytes, content_type: str, timeout: float) -> dict:
+        try:
+            emotion, scores = await self._run(_worker_face, content, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise
+        except (OSError, SyntaxError, ValueError) as e:
+            # PIL raises UnidentifiedImageError (an OSError) for undecodable uploads.
+            raise InvalidImage(str(e)) from e
+        return {"emotion": emotion, "scores": scores}
+
+
+_engine = None
+
+
+def get_ml_engine():
+    global _engine
+    if _engine is None:
+        _engine = EmbeddedEngine() if ML_MODE == "embedded" else RemoteEngine()
+    return _engine
+
+
+async def start_ml_engine():
+    await get_ml_engine().start()
+
+
+def ml_status() -> dict:
+    """Replica health and load for /health (remote mode only)."""
+    engine = get_ml_engine()
+    return engine.status() if isinstance(engine, RemoteEngine) else {}
+
+
+async def close_ml_engine():
+    if _engine is not None:
+        await _engine.close()
+
+
+async def analyze_text(text: str, timeout: float) -> dict:
+    """
+    Run text analysis on the configured engine, recording call metrics.
+    Raises CapacityExceeded when all ML_MAX_IN_FLIGHT slots stay busy.
+    """
+    start = time.perf_counter()
+    try:
+        async with ml_limiter.slot():
+            with span("ml.analyze"):
+                result = await get_ml_engine().analyze(text, timeout)
+    except Exception:
+        ML_CALLS.labels("analyze", "error").inc()
+        raise
+    finally:
+        ML_LATENCY.labels("analyze").observe(time.perf_counter() - start)
+    ML_CALLS.labels("analyze", "success").inc()
+    return result
+
+
+async def analyze_face(
+    filename: str, content: bytes, content_type: str, timeout: float = ML_FACE_TIMEOUT_SECONDS
+) -> dict:
+    """Run face emotion analysis on the configured engine, recording call metrics."""
+    start = time.perf_counter()
+    try:
+        async with ml_limiter.slot():
+            with span("ml.face"):
+                result = await get_ml_engine().analyze_face(filename, content, content_type, timeout)
+    except Exception:
+        ML_CALLS.labels("face", "error").inc()
+        raise
+    finally:
+        ML_LATENCY.labels("face").observe(time.perf_counter() - start)
+    ML_CALLS.labels("face", "success").inc()
+    return result
@@ -0,0 +1,69 @@
+"""
+Client side of ml_service's optional msgpack wire format (ml_service/app/binary.py).
+
+The remote engine always sends `Accept: application/x-msgpack,
+application/json`, so replicas without msgpack keep answering JSON. Once a
+replica has answered in msgpack, request bodies to it are msgpack as well,
+and face uploads are sent as the raw image body instead of multipart.
+Msgpack rows carry label indices and positional probabilities. The label
+order is fetched from the replica's GET /schema the first time a schema id
+(X-ML-Schema header) is seen, then cached. A replica that answers 415 to a
+msgpack body goes back to JSON requests, and a /schema whose id is not the
+one the response named (the replica was redeployed in between) is not used
+to decode it.
+
+ML_BINARY_PROTOCOL=0, or msgpack not being installed, keeps everything JSON.
+"""
+import os
+from typing import Optional
+
+try:
+    import msgpack
+except ImportError:  # optional; JSON is used without it
+    msgpack = None
+
+ML_BINARY_PROTOCOL = os.getenv("ML_BINARY_PROTOCOL", "1") == "1" and msgpack is not None
+
+MSGPACK_TYPE = "application/x-msgpack"
+SCHEMA_HEADER = "X-ML-Schema"
+ACCEPT = f"{MSGPACK_TYPE}, application/json" if ML_BINARY_PROTOCOL else "application/json"
+
+
+class SchemaMismatch(RuntimeError):
+    """GET /schema returned another schema than the response was encoded with."""
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(MSGPACK_TYPE)
+
+
+def packb(payload) -> bytes:
+    return msgpack.packb(payload)
+
+
+def unpackb(data: bytes):
+    return msgpack.unpackb(data)
+
+
+def unpack_analysis(row: list, labels: dict) -> dict:
+    """One analysis row back into the /analyze JSON shape."""
+    sentiment, stress = labels["sentiment"], labels["stress"]
+    sent_idx, sent_probs, stress_idx, stress_probs, stress_score, risk_flag, cascade = row
+    return {
+        "sentiment_label": sentiment[sent_idx],
+        "sentiment_probs": dict(zip(sentiment, sent_probs)),
+        "stress_label": stress[stress_idx],
+        "stress_probs": dict(zip(stress, stress_probs)),
+        "stress_score": stress_score,
+        "risk_flag": risk_flag,
+        "cascade": {
+            "sentiment": "fast" if cascade[0] else "full",
+            "stress": "fast" if cascade[1] else "full",
+        } if cascade else None,
+    }
+
+
+def unpack_face(row: list, labels: dict) -> dict:
+    face = labels["face"]
+    label_idx, scores = row
+    return {"emotion": face[label_idx], "scores": dict(zip(face, scores))}
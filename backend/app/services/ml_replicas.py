@@ -0,0 +1,185 @@
+"""
+Client-side load balancing over ml_service replicas for the remote engine.
+
+ML_SERVICE_URLS is a comma-separated list of replicas; without it the
+single ML_SERVICE_URL is used. Each call goes to one replica, picked by
+ML_LB_STRATEGY:
+
+- "p2c" (default): power of two choices. Two random candidates are drawn
+  and the one with fewer outstanding calls wins. This spreads load without
+  herding every worker onto the same "best" node.
+- "least_outstanding": the candidate with the fewest in-flight calls.
+
+Ties are broken at random. Per-replica EWMA latency is reported, not used
+for routing, so one slow cold-start call cannot starve a replica.
+
+A probe task calls every replica's /health each ML_HEALTH_INTERVAL_SECONDS.
+ML_EJECT_AFTER_FAILURES consecutive failures take a replica out of rotation;
+failures can be probe errors, connection errors, timeouts or 5xx answers.
+ML_READMIT_AFTER_SUCCESSES consecutive good probes bring it back. /health
+also says whether the face model is loaded. Image calls prefer replicas
+that report it, and skip replicas that report it missing. If every replica
+is ejected, calls still go to the one with the fewest failures rather than
+failing outright.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+from app.core.metrics import (
+    ML_REPLICA_HEALTHY,
+    ML_REPLICA_LATENCY,
+    ML_REPLICA_OUTSTANDING,
+    ML_REPLICA_REQUESTS,
+)
+
+ML_LB_STRATEGY = os.getenv("ML_LB_STRATEGY", "p2c")
+ML_HEALTH_INTERVAL_SECONDS = float(os.getenv("ML_HEALTH_INTERVAL_SECONDS", "5"))
+ML_HEALTH_TIMEOUT_SECONDS = float(os.getenv("ML_HEALTH_TIMEOUT_SECONDS", "1"))
+ML_EJECT_AFTER_FAILURES = int(os.getenv("ML_EJECT_AFTER_FAILURES", "3"))
+ML_READMIT_AFTER_SUCCESSES = int(os.getenv("ML_READMIT_AFTER_SUCCESSES", "2"))
+# Weight of the newest sample in each replica's latency average.
+LATENCY_EWMA_ALPHA = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+def replica_urls(urls: str, fallback: str) -> list[str]:
+    parsed = [u.strip().rstrip("/") for u in urls.split(",") if u.strip()]
+    return parsed or [fallback.rstrip("/")]
+
+
+def is_replica_failure(exc: BaseException) -> bool:
+    """Errors that say something about the replica, not about the request."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.has_face: Optional[bool] = None  # unknown until the first probe
+        self.binary = False  # answered in msgpack at least once (see ml_protocol.py)
+        self.outstanding = 0
+        self.failures = 0
+        self.successes = 0
+        self.latency: Optional[float] = None
+        ML_REPLICA_HEALTHY.labels(url).set(1)
+
+    def record_success(self, elapsed: Optional[float] = None):
+        self.failures = 0
+        if elapsed is not None:
+            ML_REPLICA_LATENCY.labels(self.url).observe(elapsed)
+            self.latency = elapsed if self.latency is None else (
+                LATENCY_EWMA_ALPHA * elapsed + (1 - LATENCY_EWMA_ALPHA) * self.latency
+            )
+        if not self.healthy:
+            self.successes += 1
+            if self.successes >= ML_READMIT_AFTER_SUCCESSES:
+                self.healthy = True
+                ML_REPLICA_HEALTHY.labels(self.url).set(1)
+                logger.info("ML replica %s back in rotation", self.url)
+
+    def record_failure(self, reason: str):
+        self.successes = 0
+        self.failures += 1
+        if self.healthy and self.failures >= ML_EJECT_AFTER_FAILURES:
+            self.healthy = False
+            ML_REPLICA_HEALTHY.labels(self.url).set(0)
+            logger.warning("Ejecting ML replica %s after %d failures (%s)", self.url, self.failures, reason)
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "face_model": self.has_face,
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+        }
+
+
+class ReplicaPool:
+    def __init__(self, urls: list[str], strategy: str = ML_LB_STRATEGY):
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def candidates(self, face: bool = False) -> list[Replica]:
+        pool = [r for r in self.replicas if r.healthy]
+        if face:
+            with_face = [r for r in pool if r.has_face]
+            pool = with_face or [r for r in pool if r.has_face is not False] or pool
+        return pool or sorted(self.replicas, key=lambda r: r.failures)[:1]
+
+    def pick(self, face: bool = False, exclude: Optional[Replica] = None) -> Replica:
+        pool = self.candidates(face)
+        if exclude is not None and len(pool) > 1:
+            pool = [r for r in pool if r is not exclude]
+        if len(pool) == 1:
+            return pool[0]
+        if self.strategy != "least_outstanding":
+            pool = random.sample(pool, 2)
+        least = min(r.outstanding for r in pool)
+        return random.choice([r for r in pool if r.outstanding == least])
+
+    @asynccontextmanager
+    async def use(self, replica: Replica):
+        """Track one call on `replica`: outstanding count, latency and failures."""
+        replica.outstanding += 1
+        ML_REPLICA_OUTSTANDING.labels(replica.url).set(replica.outstanding)
+        start = time.perf_counter()
+        try:
+            yield replica
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_replica_failure(e):
+                ML_REPLICA_REQUESTS.labels(replica.url, "error").inc()
+                replica.record_failure(type(e).__name__)
+            else:
+                ML_REPLICA_REQUESTS.labels(replica.url, "rejected").inc()
+            raise
+        else:
+            ML_REPLICA_REQUESTS.labels(replica.url, "success").inc()
+            replica.record_success(time.perf_counter() - start)
+        finally:
+            replica.outstanding -= 1
+            ML_REPLICA_OUTSTANDING.labels(replica.url).set(replica.outstanding)
+
+    async def probe(self, client: httpx.AsyncClient, replica: Replica):
+        try:
+            resp = await client.get(f"{replica.url}/health", timeout=ML_HEALTH_TIMEOUT_SECONDS)
+            resp.raise_for_status()
+            models = resp.json().get("models")
+        except (httpx.HTTPError, ValueError) as e:
+            replica.record_failure(f"health probe: {type(e).__name__}")
+            return
+        if isinstance(models, dict):
+            replica.has_face = bool(models.get("face"))
+        replica.record_success()
+
+    async def probe_loop(self, client: httpx.AsyncClient, interval: float = ML_HEALTH_INTERVAL_SECONDS):
+        while True:
+            await asyncio.gather(*(self.probe(client, r) for r in self.replicas))
+            await asyncio.sleep(interval)
+
+    def start(self, client: httpx.AsyncClient):
+        if self._probe_task is None and ML_HEALTH_INTERVAL_SECONDS > 0:
+            self._probe_task = asyncio.create_task(self.probe_loop(client))
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    def status(self) -> list[dict]:
+        return [r.status() for r in self.replicas]
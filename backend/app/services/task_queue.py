@@ -0,0 +1,137 @@
+"""
+In-process queue for non-critical work that can run after the response.
+
+Jobs are coroutine functions enqueued with `await enqueue(fn, *args)`.
+In the default "background" mode a fixed pool of worker tasks runs them
+with bounded concurrency and retries with exponential backoff, and
+`drain()` lets queued work finish on shutdown. With TASK_QUEUE_MODE=sync
+the job runs to completion inside `enqueue` instead, which keeps tests
+deterministic.
+
+Jobs must be safe to retry (for example, inserts with a pre-generated _id).
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import Awaitable, Callable, Optional
+
+from app.core.metrics import BACKGROUND_QUEUE_DEPTH, BACKGROUND_TASKS
+
+TASK_QUEUE_MODE = os.getenv("TASK_QUEUE_MODE", "background")
+TASK_QUEUE_CONCURRENCY = int(os.getenv("TASK_QUEUE_CONCURRENCY", "4"))
+TASK_QUEUE_MAX_SIZE = int(os.getenv("TASK_QUEUE_MAX_SIZE", "10000"))
+TASK_QUEUE_MAX_RETRIES = int(os.getenv("TASK_QUEUE_MAX_RETRIES", "3"))
+TASK_QUEUE_RETRY_BASE_SECONDS = float(os.getenv("TASK_QUEUE_RETRY_BASE_SECONDS", "0.2"))
+TASK_QUEUE_DRAIN_SECONDS = float(os.getenv("TASK_QUEUE_DRAIN_SECONDS", "10"))
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[..., Awaitable[None]]
+
+
+async def _run_with_retries(fn: Job, args: tuple, max_retries: int, base_delay: float):
+    name = getattr(fn, "__name__", "job")
+    for attempt in range(max_retries + 1):
+        try:
+            await fn(*args)
+            BACKGROUND_TASKS.labels(name, "success").inc()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == max_retries:
+                BACKGROUND_TASKS.labels(name, "failed").inc()
+                logger.error("Background job %s failed after %d attempts: %r", name, attempt + 1, e)
+                return
+            BACKGROUND_TASKS.labels(name, "retried").inc()
+            await asyncio.sleep(random.uniform(0.5, 1.0) * base_delay * 2 ** attempt)
+
+
+class BackgroundTaskQueue:
+    def __init__(
+        self,
+        concurrency: int = TASK_QUEUE_CONCURRENCY,
+        max_size: int = TASK_QUEUE_MAX_SIZE,
+        max_retries: int = TASK_QUEUE_MAX_RETRIES,
+        retry_base: float = TASK_QUEUE_RETRY_BASE_SECONDS,
+    ):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._workers: list[asyncio.Task] = []
+        self._closing = False
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"bg-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def enqueue(self, fn: Job, *args):
+        """Schedule fn(*args); runs it inline if the queue is full or shutting down."""
+        if self._closing or not self._workers:
+            await _run_with_retries(fn, args, self.max_retries, self.retry_base)
+            return
+        try:
+            self._queue.put_nowait((fn, args))
+        except asyncio.QueueFull:
+            logger.warning("Background queue full, running %s inline", getattr(fn, "__name__", fn))
+            await _run_with_retries(fn, args, self.max_retries, self.retry_base)
+            return
+        BACKGROUND_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _worker(self):
+        while True:
+            fn, args = await self._queue.get()
+            try:
+                await _run_with_retries(fn, args, self.max_retries, self.retry_base)
+            finally:
+                self._queue.task_done()
+                BACKGROUND_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def drain(self, timeout: float = TASK_QUEUE_DRAIN_SECONDS):
+        """Stop accepting background work, wait for queued jobs, then stop the workers."""
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Background queue drain timed out with %d jobs left", self._queue.qsize())
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class SyncTaskQueue:
+    """Test-mode executor: every job completes before enqueue() returns."""
+
+    def __init__(self, max_retries: int = TASK_QUEUE_MAX_RETRIES, retry_base: float = 0.0):
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+
+    def start(self):
+        pass
+
+    async def enqueue(self, fn: Job, *args):
+        await _run_with_retries(fn, args, self.max_retries, self.retry_base)
+
+    async def drain(self, timeout: float = TASK_QUEUE_DRAIN_SECONDS):
+        pass
+
+
+_queue: Optional[BackgroundTaskQueue | SyncTaskQueue] = None
+
+
+def get_task_queue() -> BackgroundTaskQueue | SyncTaskQueue:
+    global _queue
+    if _queue is None:
+        _queue = SyncTaskQueue() if TASK_QUEUE_MODE == "sync" else BackgroundTaskQueue()
+    return _queue
+
+
+async def enqueue(fn: Job, *args):
+    await get_task_queue().enqueue(fn, *args)
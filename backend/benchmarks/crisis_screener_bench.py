@@ -0,0 +1,98 @@
+"""
+Microbenchmark for the chat crisis screener.
+
+Times `screen()` per message over a mix of ordinary chat messages, crisis
+messages in several languages and long messages, and compares it with a
+naive baseline that checks every phrase with `in`. Reports microseconds per
+message (p50 / p99 / max) and messages per second. Needs no services.
+
+Run from the `backend` directory:
+
+    python -m benchmarks.crisis_screener_bench --messages 50000
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.load_test import CHAT_SAMPLES, percentile
+from app.services.crisis_screener import CRISIS_PHRASES, normalize, screen
+
+CRISIS_SAMPLES = [
+    "Honestly I just want to kill myself, nothing is getting better.",
+    "I don't want to live anymore.",
+    "A veces pienso en quitarme la vida.",
+    "J'ai envie de mourir ce soir.",
+    "Ich will nicht mehr leben.",
+    "Eu não quero viver mais.",
+]
+
+
+def _messages(n: int, crisis_share: float, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    long_text = " ".join(CHAT_SAMPLES) * 8  # ~2.5k characters, the slow end of real messages
+    out = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < crisis_share:
+            out.append(rng.choice(CRISIS_SAMPLES))
+        elif roll < crisis_share + 0.05:
+            out.append(long_text)
+        else:
+            out.append(rng.choice(CHAT_SAMPLES))
+    return out
+
+
+_NORMALIZED_PHRASES = [normalize(p) for phrases in CRISIS_PHRASES.values() for p in phrases]
+
+
+def _naive(text: str) -> bool:
+    normalized = normalize(text)
+    return any(p in normalized for p in _NORMALIZED_PHRASES)
+
+
+def _time(fn, messages: list[str]) -> dict:
+    per_message: list[float] = []
+    hits = 0
+    started = time.perf_counter()
+    for text in messages:
+        start = time.perf_counter()
+        result = fn(text)
+        per_message.append((time.perf_counter() - start) * 1e6)
+        hits += bool(getattr(result, "crisis", result))
+    elapsed = time.perf_counter() - started
+    per_message.sort()
+    return {
+        "messages": len(messages),
+        "crisis_hits": hits,
+        "p50_us": round(percentile(per_message, 50), 2),
+        "p99_us": round(percentile(per_message, 99), 2),
+        "max_us": round(per_message[-1], 2),
+        "messages_per_s": round(len(messages) / elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--crisis-share", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default="crisis_screener_bench.json")
+    args = parser.parse_args()
+
+    messages = _messages(args.messages, args.crisis_share, args.seed)
+    for text in messages[:100]:  # warm up
+        screen(text)
+    results = {"aho_corasick": _time(screen, messages), "naive_in": _time(_naive, messages)}
+    for name, r in results.items():
+        print(
+            f"{name:13s} p50 {r['p50_us']:8.2f} us  p99 {r['p99_us']:8.2f} us  "
+            f"max {r['max_us']:8.2f} us  {r['messages_per_s']:>8d} msg/s  hits {r['crisis_hits']}"
+        )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Offline stand-ins for the services the backend talks to.
+
+- a fake ml_service exposing `/health`, `/analyze` and `/api/emotion/face`
+- a fake Groq (OpenAI-compatible) `/openai/v1/chat/completions`
+
+Latencies are drawn from a log-normal distribution around a configurable
+median so the backend sees realistic tail behaviour.
+"""
+import asyncio
+import math
+import random
+import zlib
+
+from fastapi import FastAPI, File, UploadFile
+from pydantic import BaseModel
+
+SENTIMENT_CLASSES = ["very_negative", "negative", "neutral", "positive"]
+STRESS_CLASSES = ["not_stressed", "stressed"]
+FACE_CLASSES = ["sad", "disgust", "angry", "neutral", "fear", "surprise", "happy"]
+
+
+def sample_latency(median_ms: float, sigma: float = 0.35) -> float:
+    """Log-normal latency in seconds with the given median."""
+    if median_ms <= 0:
+        return 0.0
+    return random.lognormvariate(math.log(median_ms / 1000.0), sigma)
+
+
+def _softmax(values: list[float]) -> list[float]:
+    top = max(values)
+    exps = [math.exp(v - top) for v in values]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def _scores_for(text: str, classes: list[str]) -> dict[str, float]:
+    # Deterministic per text so repeated runs produce the same labels.
+    rng = random.Random(zlib.crc32(f"{text}:{len(classes)}".encode("utf-8")))
+    probs = _softmax([rng.uniform(-2.0, 2.0) for _ in classes])
+    return {label: probs[i] for i, label in enumerate(classes)}
+
+
+class AnalyzeRequest(BaseModel):
+    text: str
+
+
+def create_fake_ml_app(analyze_ms: float = 40.0, face_ms: float = 120.0) -> FastAPI:
+    app = FastAPI(title="Fake ML Service")
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.post("/analyze")
+    async def analyze(req: AnalyzeRequest):
+        await asyncio.sleep(sample_latency(analyze_ms))
+        sent_probs = _scores_for(req.text, SENTIMENT_CLASSES)
+        stress_probs = _scores_for(req.text, STRESS_CLASSES)
+        stress_score = stress_probs["stressed"]
+        return {
+            "sentiment_label": max(sent_probs, key=sent_probs.get),
+            "sentiment_probs": sent_probs,
+            "stress_label": max(stress_probs, key=stress_probs.get),
+            "stress_probs": stress_probs,
+            "stress_score": stress_score,
+            "risk_flag": stress_score > 0.8,
+        }
+
+    @app.post("/api/emotion/face")
+    async def face(file: UploadFile = File(...)):
+        content = await file.read()
+        await asyncio.sleep(sample_latency(face_ms))
+        scores = _scores_for(str(len(content)), FACE_CLASSES)
+        return {"emotion": max(scores, key=scores.get), "scores": scores}
+
+    return app
+
+
+def create_fake_groq_app(completion_ms: float = 800.0) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(payload: dict):
+        await asyncio.sleep(sample_latency(completion_ms))
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": payload.get("model", "fake"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "Thanks for sharing. Let's take one slow breath together.",
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 12, "total_tokens": 12},
+        }
+
+    return app
@@ -0,0 +1,103 @@
+"""
+Compare the pydantic and fast-JSON response paths for chat history.
+
+Builds synthetic history documents (as returned by the Mongo projection)
+and times producing the HTTP body both ways:
+
+- pydantic: a ChatMessage per document, a ChatHistoryResponse, then
+  jsonable_encoder + JSONResponse, which is what FastAPI does for a
+  route returning models with `response_model`.
+- fast: plain dicts rendered by FastJSONResponse (orjson when installed).
+
+Needs no services. Run from the `backend` directory:
+
+    python -m benchmarks.json_bench --sizes 500,5000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.load_test import CHAT_SAMPLES, percentile
+from app.core import responses
+from app.core.responses import FastJSONResponse
+from app.schemas.chat import ChatHistoryResponse, ChatMessage
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _docs(n: int) -> list[dict]:
+    start = datetime(2024, 1, 1, 8, 0, 0)
+    return [
+        {
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "text": CHAT_SAMPLES[i % len(CHAT_SAMPLES)] * (1 + i % 3),
+            "created_at": start + timedelta(seconds=37 * i, milliseconds=i % 1000),
+        }
+        for i in range(n)
+    ]
+
+
+def pydantic_body(user_id: str, docs: list[dict]) -> bytes:
+    messages = [
+        ChatMessage(sender=d.get("sender", "user"), text=d.get("text", ""), timestamp=d.get("created_at"))
+        for d in docs
+    ]
+    model = ChatHistoryResponse(user_id=user_id, messages=messages, next_before=None)
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+def fast_body(user_id: str, docs: list[dict]) -> bytes:
+    messages = [
+        {"sender": d.get("sender", "user"), "text": d.get("text", ""), "timestamp": d.get("created_at")}
+        for d in docs
+    ]
+    return FastJSONResponse({"user_id": user_id, "messages": messages, "next_before": None}).body
+
+
+def _time(fn, docs: list[dict], repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn("bench-user", docs)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(percentile(samples, 50), 3), "p95_ms": round(percentile(samples, 95), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_int_list, default=[500, 5000])
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--out", default="json_bench.json")
+    args = parser.parse_args()
+
+    encoder = "orjson" if responses.orjson is not None else "json"
+    results = []
+    for size in args.sizes:
+        docs = _docs(size)
+        # Both paths must produce the same document.
+        assert json.loads(pydantic_body("bench-user", docs)) == json.loads(fast_body("bench-user", docs))
+        row = {
+            "messages": size,
+            "pydantic": _time(pydantic_body, docs, args.repeat),
+            "fast": _time(fast_body, docs, args.repeat),
+        }
+        row["speedup_p50"] = round(row["pydantic"]["p50_ms"] / row["fast"]["p50_ms"], 1)
+        results.append(row)
+        print(
+            f"{size:6d} messages  pydantic p50 {row['pydantic']['p50_ms']:8.2f} ms  "
+            f"fast ({encoder}) p50 {row['fast']['p50_ms']:7.2f} ms  x{row['speedup_p50']}"
+        )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "encoder": encoder, "results": results}, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Offline end-to-end load test for the backend.
+
+Starts the backend app, a fake ml_service and a fake Groq endpoint as local
+processes, then drives mixed traffic (signup/login, chat turns, dashboard,
+exercise search, check-ins, face uploads) from a pool of virtual users and
+reports throughput and p50/p95/p99 latency per endpoint.
+
+Run from the `backend` directory:
+
+    python -m benchmarks.load_test --users 20 --duration 60 --out results.json
+    python -m benchmarks.load_test --mongo memory --compare results.json
+
+`--mongo memory` uses mongomock-motor instead of a local mongod, so nothing
+but this machine is needed. It is not a runtime dependency; install it with
+
+    pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from uuid import uuid4
+
+import httpx
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Relative weight of each action in the steady-state traffic mix.
+TRAFFIC_MIX = {
+    "chat_message": 40,
+    "chat_history": 8,
+    "dashboard": 15,
+    "exercise_search": 12,
+    "exercise_recommend": 5,
+    "game_recommend": 5,
+    "checkin": 10,
+    "face_upload": 5,
+}
+
+CHAT_SAMPLES = [
+    "I feel a bit tired today but overall okay.",
+    "Work has been really stressful and I can't sleep.",
+    "I had a great walk this morning, feeling calm.",
+    "Everything feels overwhelming lately and I don't know what to do.",
+    "Can you suggest something to help me focus before my exam?",
+    "I argued with my friend and I keep thinking about it.",
+]
+SEARCH_TERMS = [None, "breath", "anxiety", "sleep", "ground", "journal"]
+MOODS = ["very_negative", "negative", "neutral", "positive", "very_positive"]
+
+
+def _face_jpeg() -> bytes:
+    """A real 640x480 JPEG: the backend decodes and shrinks uploads before the ML call."""
+    out = BytesIO()
+    Image.effect_noise((640, 480), 64).convert("RGB").save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+FACE_JPEG = _face_jpeg()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve_fake_ml(port: int, analyze_ms: float, face_ms: float):
+    import uvicorn
+    from benchmarks.fakes import create_fake_ml_app
+
+    uvicorn.run(create_fake_ml_app(analyze_ms, face_ms), host="127.0.0.1", port=port, log_level="warning")
+
+
+def _serve_fake_groq(port: int, completion_ms: float):
+    import uvicorn
+    from benchmarks.fakes import create_fake_groq_app
+
+    uvicorn.run(create_fake_groq_app(completion_ms), host="127.0.0.1", port=port, log_level="warning")
+
+
+def _serve_backend(port: int, env: dict, mongo_mode: str):
+    os.environ.update(env)
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    import uvicorn
+    from app.core import mongo
+
+    if mongo_mode == "memory":
+        # Must happen before the routers import `db`.
+        from mongomock_motor import AsyncMongoMockClient
+
+        mongo.client = AsyncMongoMockClient()
+        mongo.db = mongo.client[mongo.DB_NAME]
+
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Service at {url} did not become ready")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def add(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def _timed(recorder: Recorder, endpoint: str, request) -> httpx.Response | None:
+    start = time.perf_counter()
+    try:
+        resp = await request
+        ok = resp.status_code < 400
+    except httpx.HTTPError:
+        resp, ok = None, False
+    recorder.add(endpoint, time.perf_counter() - start, ok)
+    return resp
+
+
+async def _virtual_user(client: httpx.AsyncClient, recorder: Recorder, stop_at: float, rng: random.Random):
+    creds = {"email": f"load-{uuid4().hex[:12]}@example.com", "password": "password123"}
+    await _timed(recorder, "auth_signup", client.post("/api/auth/signup", json=creds))
+    resp = await _timed(recorder, "auth_login", client.post("/api/auth/login", json=creds))
+    if resp is None or resp.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    actions = list(TRAFFIC_MIX)
+    weights = [TRAFFIC_MIX[a] for a in actions]
+
+    while time.monotonic() < stop_at:
+        action = rng.choices(actions, weights)[0]
+        if action == "chat_message":
+            req = client.post("/api/chat/message", json={"message": rng.choice(CHAT_SAMPLES)}, headers=headers)
+        elif action == "chat_history":
+            req = client.get("/api/chat/history/me", headers=headers)
+        elif action == "dashboard":
+            req = client.get("/api/dashboard/summary/me", headers=headers)
+        elif action == "exercise_search":
+            term = rng.choice(SEARCH_TERMS)
+            params = {"q": term} if term else {}
+            req = client.get("/api/exercises/search", params=params, headers=headers)
+        elif action == "exercise_recommend":
+            req = client.get("/api/exercises/recommend", headers=headers)
+        elif action == "game_recommend":
+            req = client.get("/api/games/recommend", headers=headers)
+        elif action == "checkin":
+            req = client.post("/api/dashboard/checkin", params={"mood": rng.choice(MOODS)}, headers=headers)
+        else:
+            files = {"file": ("face.jpg", FACE_JPEG, "image/jpeg")}
+            req = client.post("/api/emotion/face", files=files, headers=headers)
+        await _timed(recorder, action, req)
+
+
+async def _seed_exercises(client: httpx.AsyncClient):
+    creds = {"email": f"seed-{uuid4().hex[:8]}@example.com", "password": "password123"}
+    resp = await client.post("/api/auth/signup", json=creds)
+    resp.raise_for_status()
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    await client.post("/api/exercises/seed-dev", headers=headers)
+
+
+async def run_load(base_url: str, users: int, duration: float, seed: int) -> tuple[Recorder, float]:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users * 2, max_keepalive_connections=users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        await _seed_exercises(client)
+        started = time.monotonic()
+        stop_at = started + duration
+        await asyncio.gather(
+            *(_virtual_user(client, recorder, stop_at, random.Random(seed + i)) for i in range(users))
+        )
+        elapsed = time.monotonic() - started
+    return recorder, elapsed
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    total = 0
+    total_errors = 0
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        errors = recorder.errors.get(endpoint, 0)
+        total += len(values)
+        total_errors += errors
+        endpoints[endpoint] = {
+            "count": len(values),
+            "errors": errors,
+            "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+            "mean_ms": 1000 * sum(values) / len(values),
+            "p50_ms": 1000 * percentile(values, 50),
+            "p95_ms": 1000 * percentile(values, 95),
+            "p99_ms": 1000 * percentile(values, 99),
+            "max_ms": 1000 * values[-1],
+        }
+    return {
+        "elapsed_s": elapsed,
+        "total_requests": total,
+        "total_errors": total_errors,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(summary: dict):
+    print(f"\n{summary['total_requests']} requests in {summary['elapsed_s']:.1f}s "
+          f"({summary['throughput_rps']:.1f} req/s, {summary['total_errors']} errors)\n")
+    header = f"{'endpoint':<20}{'count':>8}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, s in summary["endpoints"].items():
+        print(f"{name:<20}{s['count']:>8}{s['errors']:>6}{s['throughput_rps']:>8.1f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+
+
+def print_comparison(baseline: dict, current: dict):
+    """Print p95 and throughput deltas against a previous results file."""
+    print(f"\nComparison against {baseline.get('meta', {}).get('git_commit') or 'baseline'}:")
+    print(f"{'endpoint':<20}{'p95 before':>12}{'p95 now':>10}{'delta':>9}{'rps delta':>11}")
+    for name, now in current["summary"]["endpoints"].items():
+        before = baseline.get("summary", {}).get("endpoints", {}).get(name)
+        if not before:
+            continue
+        delta = (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+        rps_delta = (
+            (now["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] * 100
+            if before["throughput_rps"] else 0.0
+        )
+        print(f"{name:<20}{before['p95_ms']:>12.1f}{now['p95_ms']:>10.1f}{delta:>8.1f}%{rps_delta:>10.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Steady-state seconds")
+    parser.add_argument("--mongo", choices=["local", "memory"], default="local")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--ml-latency-ms", type=float, default=40.0)
+    parser.add_argument("--face-latency-ms", type=float, default=120.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="load_test_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to diff against")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    ml_port, groq_port, backend_port = _free_port(), _free_port(), _free_port()
+    env = {
+        "ML_SERVICE_URL": f"http://127.0.0.1:{ml_port}",
+        "GROQ_API_URL": f"http://127.0.0.1:{groq_port}/openai/v1",
+        "GROQ_API_KEY": "offline-benchmark",
+        "MONGO_URI": args.mongo_uri,
+        "MONGO_DB": f"loadtest_{uuid4().hex[:8]}",
+        # Measure capacity, not the per-user limits (virtual users loop much faster than people).
+        "RATE_LIMIT_ENABLED": "0",
+    }
+
+    procs = [
+        ctx.Process(target=_serve_fake_ml, args=(ml_port, args.ml_latency_ms, args.face_latency_ms), daemon=True),
+        ctx.Process(target=_serve_fake_groq, args=(groq_port, args.llm_latency_ms), daemon=True),
+        ctx.Process(target=_serve_backend, args=(backend_port, env, args.mongo), daemon=True),
+    ]
+    for p in procs:
+        p.start()
+
+    try:
+        _wait_ready(f"http://127.0.0.1:{ml_port}/health")
+        _wait_ready(f"http://127.0.0.1:{backend_port}/health")
+        recorder, elapsed = asyncio.run(
+            run_load(f"http://127.0.0.1:{backend_port}", args.users, args.duration, args.seed)
+        )
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join(timeout=5)
+
+    summary = summarize(recorder, elapsed)
+    results = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "config": vars(args),
+        },
+        "summary": summary,
+    }
+    print_report(summary)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), results)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare the remote (HTTP) and embedded (process-pool) ML engines.
+
+Starts ml_service with uvicorn for the remote engine and an in-process
+EmbeddedEngine, then sends the same text and face workload through both,
+sequentially and with concurrency, and reports latency percentiles and
+throughput. Needs the ml_service models on disk.
+
+Run from the `backend` directory:
+
+    python -m benchmarks.ml_mode_bench --requests 200 --concurrency 1,8
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+from benchmarks.load_test import CHAT_SAMPLES, _free_port, _wait_ready, percentile
+from app.services.ml_engine import ML_SERVICE_DIR, EmbeddedEngine, RemoteEngine
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _sample_jpeg() -> bytes:
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.effect_noise((640, 480), 64).convert("RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def _drive(engine, kind: str, requests: int, concurrency: int, jpeg: bytes) -> dict:
+    latencies: list[float] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            if kind == "text":
+                await engine.analyze(CHAT_SAMPLES[i % len(CHAT_SAMPLES)], timeout=60)
+            else:
+                await engine.analyze_face("face.jpg", jpeg, "image/jpeg", timeout=60)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "p99_ms": 1000 * percentile(latencies, 99),
+    }
+
+
+async def run(args) -> dict:
+    jpeg = _sample_jpeg()
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ML_SERVICE_DIR,
+        env={**os.environ, "PYTHONPATH": ML_SERVICE_DIR},
+    )
+    engines = {
+        "remote": RemoteEngine([f"http://127.0.0.1:{port}"]),
+        "embedded": EmbeddedEngine(workers=args.workers),
+    }
+    results: dict = {}
+    try:
+        _wait_ready(f"http://127.0.0.1:{port}/health", timeout=300)
+        for name, engine in engines.items():
+            await engine.start()
+            # Warm up caches and lazily initialised kernels.
+            await _drive(engine, "text", 5, 1, jpeg)
+            for kind in ("text", "face"):
+                for concurrency in args.concurrency:
+                    row = await _drive(engine, kind, args.requests, concurrency, jpeg)
+                    results.setdefault(name, []).append({"kind": kind, **row})
+                    print(
+                        f"{name:<9} {kind:<5} c={concurrency:<3} {row['throughput_rps']:8.1f} req/s "
+                        f"p50={row['p50_ms']:7.2f}ms p95={row['p95_ms']:7.2f}ms"
+                    )
+            await engine.close()
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8])
+    parser.add_argument("--workers", type=int, default=1, help="Embedded process-pool size")
+    parser.add_argument("--out", default="ml_mode_bench.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Compare the JSON and msgpack wire formats of the backend <-> ml_service hop.
+
+Builds the responses ml_service returns for /analyze, /analyze/batch and
+/emotion/face, then measures for each format:
+
+- bytes on the wire per response;
+- encode time on the ml_service side (json.dumps vs packing the rows);
+- decode time on the backend side, back to the dicts the engine returns
+  (json.loads vs msgpack.unpackb + ml_protocol.unpack_analysis/unpack_face).
+
+Row layouts match ml_service/app/binary.py. Needs no services, only
+msgpack. Run from the `backend` directory:
+
+    python -m benchmarks.ml_protocol_bench --batch 32
+"""
+import argparse
+import json
+import random
+import time
+
+import msgpack
+
+from benchmarks.load_test import percentile
+from app.services import ml_protocol
+
+LABELS = {
+    "sentiment": ["very_negative", "negative", "neutral", "positive"],
+    "stress": ["not_stressed", "stressed"],
+    "face": ["angry", "disgust", "fear", "happy", "neutral", "sad", "surprise"],
+}
+
+
+def _probs(rng: random.Random, labels: list[str]) -> dict:
+    raw = [rng.random() for _ in labels]
+    total = sum(raw)
+    return {name: value / total for name, value in zip(labels, raw)}
+
+
+def _analysis(rng: random.Random) -> dict:
+    sentiment = _probs(rng, LABELS["sentiment"])
+    stress = _probs(rng, LABELS["stress"])
+    return {
+        "sentiment_label": max(sentiment, key=sentiment.get),
+        "sentiment_probs": sentiment,
+        "stress_label": max(stress, key=stress.get),
+        "stress_probs": stress,
+        "stress_score": stress["stressed"],
+        "risk_flag": stress["stressed"] > 0.8,
+        "cascade": {"sentiment": "fast", "stress": "full"},
+    }
+
+
+def _face(rng: random.Random) -> dict:
+    scores = _probs(rng, LABELS["face"])
+    return {"emotion": max(scores, key=scores.get), "scores": scores}
+
+
+def _pack_analysis(result: dict) -> list:
+    sentiment, stress = LABELS["sentiment"], LABELS["stress"]
+    cascade = result["cascade"]
+    return [
+        sentiment.index(result["sentiment_label"]),
+        [result["sentiment_probs"][c] for c in sentiment],
+        stress.index(result["stress_label"]),
+        [result["stress_probs"][c] for c in stress],
+        result["stress_score"],
+        result["risk_flag"],
+        [cascade["sentiment"] == "fast", cascade["stress"] == "fast"] if cascade else None,
+    ]
+
+
+def _pack_face(result: dict) -> list:
+    labels = LABELS["face"]
+    return [labels.index(result["emotion"]), [result["scores"][name] for name in labels]]
+
+
+def _cases(batch: int) -> dict:
+    rng = random.Random(0)
+    analyses = [_analysis(rng) for _ in range(batch)]
+    face = _face(rng)
+    return {
+        "analyze": (
+            analyses[0],
+            _pack_analysis,
+            lambda row: ml_protocol.unpack_analysis(row, LABELS),
+        ),
+        f"analyze_batch_{batch}": (
+            {"results": analyses},
+            lambda r: {"results": [_pack_analysis(a) for a in r["results"]]},
+            lambda body: {"results": [ml_protocol.unpack_analysis(row, LABELS) for row in body["results"]]},
+        ),
+        "face": (face, _pack_face, lambda row: ml_protocol.unpack_face(row, LABELS)),
+    }
+
+
+def _close(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) < 1e-6
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _time_us(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return round(percentile(samples, 50), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--out", default="ml_protocol_bench.json")
+    args = parser.parse_args()
+
+    results = []
+    for name, (payload, pack, unpack) in _cases(args.batch).items():
+        json_body = json.dumps(payload).encode()
+        msgpack_body = msgpack.packb(pack(payload), use_single_float=True)
+        # Floats go out as float32, so the round trip only matches to that precision.
+        assert _close(unpack(msgpack.unpackb(msgpack_body)), payload)
+
+        row = {
+            "response": name,
+            "json": {
+                "bytes": len(json_body),
+                "encode_us": _time_us(lambda: json.dumps(payload).encode(), args.repeat),
+                "decode_us": _time_us(lambda: json.loads(json_body), args.repeat),
+            },
+            "msgpack": {
+                "bytes": len(msgpack_body),
+                "encode_us": _time_us(lambda: msgpack.packb(pack(payload), use_single_float=True), args.repeat),
+                "decode_us": _time_us(lambda: unpack(msgpack.unpackb(msgpack_body)), args.repeat),
+            },
+        }
+        row["size_ratio"] = round(row["json"]["bytes"] / row["msgpack"]["bytes"], 1)
+        results.append(row)
+        j, m = row["json"], row["msgpack"]
+        print(
+            f"{name:18s} json {j['bytes']:6d} B  enc {j['encode_us']:7.1f} µs  dec {j['decode_us']:7.1f} µs | "
+            f"msgpack {m['bytes']:6d} B  enc {m['encode_us']:7.1f} µs  dec {m['decode_us']:7.1f} µs  "
+            f"x{row['size_ratio']} smaller"
+        )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,36 @@
+import asyncio
+import logging
 import os
+import time
 from uuid import uuid4
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router as api_router
+from app.core.metrics import REQUEST_LATENCY, render_latest
 from app.core.mongo import db
 from app.core.security import hash_password
+from app.core.tracing import (
+    REQUEST_ID_HEADER,
+    current_spans,
+    server_timing_header,
+    start_trace,
+)
+from app.core.upload_limits import BodySizeLimitMiddleware
+from app.services.archive import ARCHIVE_INTERVAL_SECONDS, archive_loop
+from app.services.event_publisher import EVENT_WEBHOOK_URLS, EventPublisher
+from app.services.image_prep import FACE_UPLOAD_MAX_BYTES
+from app.services.llm_client import close_llm_client, llm_status
+from app.services.ml_engine import ML_MODE, close_ml_engine, ml_status, start_ml_engine
+from app.services.task_queue import get_task_queue
+
+logger = logging.getLogger("app.requests")
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "2.0"))
 
 app = FastAPI(title="Mental Wellness Backend", version="1.0.0")
 
+# Added first so it sits inside CORSMiddleware and its 413s carry CORS headers.
+app.add_middleware(BodySizeLimitMiddleware, limits={"/api/emotion/face": FACE_UPLOAD_MAX_BYTES})
 # Allow local dev origins; relax for now since this is demo/local.
 app.add_middleware(
     CORSMiddleware,
@@ -18,9 +41,47 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    request_id = start_trace(request.headers.get(REQUEST_ID_HEADER))
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_LATENCY.labels(request.method, route, str(status_code)).observe(elapsed)
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            breakdown = ", ".join(f"{name}={s * 1000:.0f}ms" for name, s in current_spans())
+            logger.warning(
+                "Slow request %s %s %.0fms [%s] %s",
+                request.method, route, elapsed * 1000, request_id, breakdown,
+            )
+
+    response.headers[REQUEST_ID_HEADER] = request_id
+    timing = server_timing_header()
+    if timing:
+        response.headers["Server-Timing"] = timing
+    return response
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok", "service": "backend"}
+    return {
+        "status": "ok",
+        "service": "backend",
+        "ml_mode": ML_MODE,
+        "ml": ml_status(),
+        "llm": llm_status(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
 
 app.include_router(api_router, prefix="/api")
@@ -43,3 +104,50 @@ async def ensure_demo_user():
             "hashed_password": hash_password(demo_password),
         }
     )
+
+
+@app.on_event("startup")
+async def warm_ml_engine():
+    await start_ml_engine()
+
+
+@app.on_event("startup")
+async def start_background_queue():
+    get_task_queue().start()
+
+
+@app.on_event("startup")
+async def start_archival():
+    if ARCHIVE_INTERVAL_SECONDS > 0:
+        app.state.archive_task = asyncio.create_task(archive_loop())
+
+
+@app.on_event("startup")
+async def start_event_publisher():
+    if EVENT_WEBHOOK_URLS:
+        app.state.event_publisher = EventPublisher()
+        app.state.event_task = asyncio.create_task(app.state.event_publisher.run())
+
+
+@app.on_event("shutdown")
+async def stop_event_publisher():
+    task = getattr(app.state, "event_task", None)
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await app.state.event_publisher.close()
+
+
+@app.on_event("shutdown")
+async def stop_archival():
+    task = getattr(app.state, "archive_task", None)
+    if task:
+        task.cancel()
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    # Let post-reply jobs finish while the clients they use are still open.
+    await get_task_queue().drain()
+    await close_llm_client()
+    await close_ml_engine()
@@ -0,0 +1,66 @@
+"""
+Build the streak and engagement counters (users.engagement) from existing data.
+
+One-time job for users whose activity predates the counters; it can also
+repair counters after a failed update. Run from the `backend` directory:
+
+    python -m scripts.backfill_engagement                  # every user
+    python -m scripts.backfill_engagement --email demo@example.com
+
+Each user is rebuilt with two aggregations (check-ins and chat messages
+grouped by local day) plus a pass over their archived chat segments.
+Activity recorded while a user is being rebuilt can be overwritten, so run
+it at a quiet time or re-run it for the affected users.
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.mongo import db
+from app.services.engagement import rebuild_engagement
+
+
+async def _rebuild_all(concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def one(user_id: str):
+        nonlocal done
+        async with semaphore:
+            await rebuild_engagement(user_id)
+        done += 1
+        if done % 1000 == 0:
+            print(f"  {done} users")
+
+    tasks = set()
+    async for user in db.users.find({}, {"_id": 1}):
+        tasks.add(asyncio.create_task(one(user["_id"])))
+        if len(tasks) >= concurrency * 4:
+            _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return done
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--user-id")
+    target.add_argument("--email")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.user_id or args.email:
+        query = {"_id": args.user_id} if args.user_id else {"email": args.email}
+        user = await db.users.find_one(query, {"_id": 1})
+        if not user:
+            raise SystemExit("No such user")
+        print(f"{user['_id']}: {await rebuild_engagement(user['_id'])}")
+        return
+    count = await _rebuild_all(args.concurrency)
+    print(f"Rebuilt engagement counters of {count} users in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""
+Run the webhook event publisher on its own, or replay dead-lettered batches.
+
+Run from the `backend` directory:
+
+    python -m scripts.event_publisher run
+    python -m scripts.event_publisher replay --url http://localhost:8099/events --limit 100
+
+`run` takes the same lease as the in-process publisher, so it can run next
+to API workers without double delivery.
+"""
+import argparse
+import asyncio
+
+from app.services.event_publisher import EVENT_WEBHOOK_URLS, EventPublisher, replay_dead_letters
+
+
+async def run():
+    if not EVENT_WEBHOOK_URLS:
+        raise SystemExit("Set EVENT_WEBHOOK_URLS first")
+    publisher = EventPublisher()
+    try:
+        await publisher.run()
+    finally:
+        await publisher.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("run")
+    replay = sub.add_parser("replay")
+    replay.add_argument("--url", default=None, help="only batches that failed for this URL")
+    replay.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        await run()
+    else:
+        report = await replay_dead_letters(args.url, args.limit)
+        print(f"Replayed {report['replayed']} batches, {report['failed']} failed again")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+"""
+Run one incremental archival pass (for cron instead of ARCHIVE_INTERVAL_SECONDS).
+
+Run from the `backend` directory:
+
+    python -m scripts.run_archival --retention-days 180 --max-messages 50000
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.archive import (
+    ARCHIVE_MAX_MESSAGES_PER_RUN,
+    CHAT_RETENTION_DAYS,
+    ensure_archive_indexes,
+    run_archival,
+)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-days", type=int, default=CHAT_RETENTION_DAYS)
+    parser.add_argument("--max-messages", type=int, default=ARCHIVE_MAX_MESSAGES_PER_RUN)
+    args = parser.parse_args()
+
+    await ensure_archive_indexes()
+    start = time.perf_counter()
+    report = await run_archival(args.retention_days, args.max_messages)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Archived {report['archived_messages']} messages of {report['users']} users "
+        f"older than {report['cutoff']} in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,203 @@
+"""
+Train and evaluate the backend's fallback text classifier.
+
+Each user message in `chat_messages` is paired with the assistant message
+that answered it, which carries the BERT labels from ml_service. Replies
+that were themselves produced by the fallback path are skipped.
+
+Run from the `backend` directory:
+
+    python -m scripts.train_fallback_classifier train --out models/fallback_classifier.json.gz
+    python -m scripts.train_fallback_classifier evaluate
+
+`train` holds out a fraction of the pairs and prints agreement on them;
+`evaluate` reports agreement of the current artifact on all stored pairs.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import random
+import time
+from collections import Counter
+from pathlib import Path
+
+from app.core.mongo import db
+from app.services.fallback_classifier import (
+    FALLBACK_MODEL_PATH,
+    N_FEATURES,
+    SENTIMENT_CLASSES,
+    FallbackClassifier,
+    features,
+)
+
+
+async def load_pairs(limit: int | None = None) -> list[tuple[str, dict]]:
+    """(user text, assistant labels) pairs in conversation order."""
+    cursor = (
+        db.chat_messages.find(
+            {},
+            {"user_id": 1, "sender": 1, "text": 1, "created_at": 1,
+             "sentiment_label": 1, "stress_label": 1, "risk_flag": 1, "analysis_source": 1},
+        )
+        .sort([("user_id", 1), ("created_at", 1)])
+        .batch_size(2000)
+    )
+    pairs: list[tuple[str, dict]] = []
+    last_user_text: dict[str, str] = {}
+    async for doc in cursor:
+        uid = doc.get("user_id")
+        if doc.get("sender") == "user":
+            last_user_text[uid] = doc.get("text", "")
+            continue
+        text = last_user_text.pop(uid, None)
+        if not text or "stress_label" not in doc:
+            continue
+        if doc.get("analysis_source") == "fallback":
+            continue
+        pairs.append((text, doc))
+        if limit and len(pairs) >= limit:
+            break
+    return pairs
+
+
+def _sigmoid(x: float) -> float:
+    x = max(-30.0, min(30.0, x))
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def train(pairs, epochs: int, lr: float, l2: float, n_features: int) -> dict:
+    """Plain SGD over sparse hashed features for both heads."""
+    data = [
+        (
+            features(text, n_features),
+            1.0 if doc.get("stress_label") == "stressed" else 0.0,
+            SENTIMENT_CLASSES.index(doc.get("sentiment_label", "neutral"))
+            if doc.get("sentiment_label") in SENTIMENT_CLASSES else 2,
+        )
+        for text, doc in pairs
+    ]
+    n_classes = len(SENTIMENT_CLASSES)
+    stress_w: dict[int, float] = {}
+    stress_b = 0.0
+    sent_w: dict[int, list[float]] = {}
+    sent_b = [0.0] * n_classes
+
+    rng = random.Random(0)
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        step = lr / (1 + epoch)
+        for vec, y_stress, y_sent in data:
+            p = _sigmoid(stress_b + sum(stress_w.get(i, 0.0) * v for i, v in vec.items()))
+            g = p - y_stress
+            stress_b -= step * g
+            for i, v in vec.items():
+                w = stress_w.get(i, 0.0)
+                stress_w[i] = w - step * (g * v + l2 * w)
+
+            scores = list(sent_b)
+            for i, v in vec.items():
+                w = sent_w.get(i)
+                if w:
+                    for c in range(n_classes):
+                        scores[c] += w[c] * v
+            top = max(scores)
+            exps = [math.exp(s - top) for s in scores]
+            total = sum(exps)
+            grads = [e / total - (1.0 if c == y_sent else 0.0) for c, e in enumerate(exps)]
+            for c in range(n_classes):
+                sent_b[c] -= step * grads[c]
+            for i, v in vec.items():
+                w = sent_w.setdefault(i, [0.0] * n_classes)
+                for c in range(n_classes):
+                    w[c] -= step * (grads[c] * v + l2 * w[c])
+
+    return {
+        "version": 1,
+        "n_features": n_features,
+        "trained_on": len(data),
+        "stress": {
+            "bias": stress_b,
+            "weights": {str(i): round(w, 5) for i, w in stress_w.items() if abs(w) > 1e-4},
+        },
+        "sentiment": {
+            "classes": SENTIMENT_CLASSES,
+            "bias": sent_b,
+            "weights": {
+                str(i): [round(x, 5) for x in w]
+                for i, w in sent_w.items() if max(abs(x) for x in w) > 1e-4
+            },
+        },
+    }
+
+
+def agreement_report(classifier: FallbackClassifier, pairs) -> dict:
+    counts = Counter()
+    start = time.perf_counter()
+    for text, doc in pairs:
+        pred = classifier.analyze(text)
+        counts["total"] += 1
+        counts["stress_agree"] += pred["stress_label"] == doc.get("stress_label")
+        counts["sentiment_agree"] += pred["sentiment_label"] == doc.get("sentiment_label")
+        bert_risk = bool(doc.get("risk_flag"))
+        counts["risk_agree"] += pred["risk_flag"] == bert_risk
+        counts["risk_bert"] += bert_risk
+        counts["risk_missed"] += bert_risk and not pred["risk_flag"]
+        counts["risk_extra"] += pred["risk_flag"] and not bert_risk
+    elapsed = time.perf_counter() - start
+    total = counts["total"] or 1
+    return {
+        "pairs": counts["total"],
+        "stress_agreement": counts["stress_agree"] / total,
+        "sentiment_agreement": counts["sentiment_agree"] / total,
+        "risk_agreement": counts["risk_agree"] / total,
+        "risk_recall": 1 - counts["risk_missed"] / counts["risk_bert"] if counts["risk_bert"] else None,
+        "risk_false_positives": counts["risk_extra"],
+        "mean_latency_us": 1e6 * elapsed / total,
+    }
+
+
+def print_report(title: str, report: dict):
+    print(f"\n{title}")
+    for key, value in report.items():
+        print(f"  {key:<22} {value:.4f}" if isinstance(value, float) else f"  {key:<22} {value}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--out", type=Path, default=FALLBACK_MODEL_PATH)
+    parser.add_argument("--limit", type=int, help="Use at most this many pairs")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-6)
+    parser.add_argument("--features", type=int, default=N_FEATURES)
+    args = parser.parse_args()
+
+    pairs = await load_pairs(args.limit)
+    print(f"Loaded {len(pairs)} labelled message pairs")
+    if not pairs:
+        return
+
+    if args.command == "evaluate":
+        print_report(f"Agreement of {args.out} with BERT labels", agreement_report(FallbackClassifier.load(args.out), pairs))
+        return
+
+    random.Random(42).shuffle(pairs)
+    cut = int(len(pairs) * (1 - args.holdout))
+    train_pairs, test_pairs = pairs[:cut], pairs[cut:]
+    artifact = train(train_pairs, args.epochs, args.lr, args.l2, args.features)
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(args.out, "wt", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+    print(f"Wrote {args.out} ({args.out.stat().st_size / 1024:.1f} KiB)")
+
+    if test_pairs:
+        print_report("Held-out agreement with BERT labels", agreement_report(FallbackClassifier(artifact), test_pairs))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Export or import one user's data from the command line.
+
+Run from the `backend` directory:
+
+    python -m scripts.user_data export --email demo@example.com --out demo.ndjson.gz
+    python -m scripts.user_data import demo.ndjson.gz --user-id <target user id>
+
+Both commands stream with constant memory and print throughput at the end.
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from app.core.mongo import db
+from app.services.data_export import import_records, iter_export_gzip, iter_lines
+
+READ_CHUNK_BYTES = 256 * 1024
+
+
+async def _resolve_user(user_id: str | None, email: str | None) -> str:
+    if user_id:
+        return user_id
+    user = await db.users.find_one({"email": email}, {"_id": 1})
+    if not user:
+        raise SystemExit(f"No user with email {email}")
+    return user["_id"]
+
+
+async def export_user(user_id: str, out: Path):
+    stats: dict = {}
+    start = time.perf_counter()
+    written = 0
+    with out.open("wb") as f:
+        async for chunk in iter_export_gzip(user_id, stats):
+            f.write(chunk)
+            written += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Exported {stats.get('records', 0)} records to {out} in {elapsed:.2f}s "
+        f"({stats.get('records', 0) / elapsed:.0f} records/s, "
+        f"{stats.get('raw_bytes', 0) / 1e6:.1f} MB raw -> {written / 1e6:.1f} MB gzip)"
+    )
+
+
+async def _read_file(path: Path):
+    with path.open("rb") as f:
+        while chunk := f.read(READ_CHUNK_BYTES):
+            yield chunk
+
+
+async def import_user(user_id: str, path: Path, chunk_size: int):
+    report = await import_records(iter_lines(_read_file(path)), user_id, chunk_size)
+    print(
+        f"Imported {report['records']} records in {report['elapsed_s']}s "
+        f"({report['records_per_s']} records/s)"
+    )
+    print(f"  inserted:   {report['inserted']}")
+    print(f"  duplicates: {report['duplicates']}")
+    print(f"  profile updated: {report['profile_updated']}")
+    for err in report["errors"]:
+        print(f"  error: {err}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export")
+    who = exp.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user-id")
+    who.add_argument("--email")
+    exp.add_argument("--out", type=Path, required=True)
+
+    imp = sub.add_parser("import")
+    imp.add_argument("file", type=Path)
+    target = imp.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user-id")
+    target.add_argument("--email")
+    imp.add_argument("--chunk-size", type=int, default=1000)
+
+    args = parser.parse_args()
+    user_id = await _resolve_user(args.user_id, args.email)
+    if args.command == "export":
+        await export_user(user_id, args.out)
+    else:
+        await import_user(user_id, args.file, args.chunk_size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Local stand-in for an n8n webhook, for testing the event publisher.
+
+Run from the `backend` directory:
+
+    python -m scripts.webhook_sink --port 8099 --fail-rate 0.2
+    EVENT_WEBHOOK_URLS=http://localhost:8099/events uvicorn main:app
+
+Prints one line per received batch. With --fail-rate a share of requests
+answers 503, which exercises retries; --reject answers every request with
+400, so batches end up in `event_dead_letters`. With --secret the
+X-Signature-SHA256 header is checked like a real receiver would.
+"""
+import argparse
+import hmac
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.services.event_publisher import SIGNATURE_HEADER, sign
+
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if args.secret and not hmac.compare_digest(
+                self.headers.get(SIGNATURE_HEADER, ""), sign(body, args.secret)
+            ):
+                return self._answer(401, "bad signature")
+            if args.reject:
+                return self._answer(400, "rejected")
+            if random.random() < args.fail_rate:
+                return self._answer(503, "injected failure")
+            events = json.loads(body)["events"]
+            types: dict = {}
+            for e in events:
+                types[e["type"]] = types.get(e["type"], 0) + 1
+            print(f"{self.path}: {len(events)} events {types}", flush=True)
+            self._answer(200, "ok")
+
+        def _answer(self, code: int, text: str):
+            self.send_response(code)
+            self.send_header("Content-Type", "text/plain")
+            self.end_headers()
+            self.wfile.write(text.encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--reject", action="store_true")
+    parser.add_argument("--secret", default="")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    print(f"Webhook sink listening on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Re-running archival over a segment left behind by an interrupted run.
+
+Uses mongomock-motor (see benchmarks/requirements.txt). Run from the
+`backend` directory:
+
+    python -m pytest tests
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app.services import archive  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = mongomock_motor.AsyncMongoMockClient()
+    database = client["archive_test"]
+    monkeypatch.setattr(archive, "db", database)
+    return database
+
+
+def _messages(user_id: str, n: int) -> list[dict]:
+    start = datetime(2024, 1, 1, 9, 0, 0)
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "text": f"message {i}",
+            "created_at": start + timedelta(minutes=i),
+            "sentiment_label": "neutral",
+            "stress_score": 0.1,
+        }
+        for i in range(n)
+    ]
+
+
+async def _archived_ids(db, user_id: str) -> set:
+    return {d["_id"] async for d in archive.iter_archived_messages(user_id)}
+
+
+def test_rerun_with_larger_batch_keeps_unarchived_messages(db):
+    async def run():
+        docs = _messages("u1", 10)
+        await db.chat_messages.insert_many([dict(d) for d in docs])
+        # An earlier run stored a segment of the first 4 messages, then
+        # stopped before deleting them from chat_messages.
+        await db.chat_archive.insert_one(
+            {
+                "_id": f"u1:2024-01:{docs[0]['_id']}",
+                "user_id": "u1",
+                "month": "2024-01",
+                "first_created_at": docs[0]["created_at"],
+                "last_created_at": docs[3]["created_at"],
+                "count": 4,
+                "daily": archive.daily_aggregates(docs[:4]),
+                "data": archive.encode_messages(docs[:4]),
+            }
+        )
+
+        # This run sees all 10 messages in one batch under the same key.
+        moved = await archive._archive_user("u1", datetime(2025, 1, 1), budget=100)
+
+        assert moved == 10
+        assert await db.chat_messages.count_documents({"user_id": "u1"}) == 0
+        assert await _archived_ids(db, "u1") == {d["_id"] for d in docs}
+        assert await db.chat_archive.count_documents({"user_id": "u1"}) == 2
+
+    asyncio.run(run())
+
+
+def test_rerun_of_identical_batch_is_idempotent(db):
+    async def run():
+        docs = _messages("u2", 6)
+        await db.chat_messages.insert_many([dict(d) for d in docs])
+        await archive._archive_segment("u2", "2024-01", docs)
+        await db.chat_messages.insert_many([dict(d) for d in docs])  # delete "never happened"
+
+        moved = await archive._archive_segment("u2", "2024-01", docs)
+
+        assert moved == 6
+        assert await db.chat_archive.count_documents({"user_id": "u2"}) == 1
+        assert await _archived_ids(db, "u2") == {d["_id"] for d in docs}
+
+    asyncio.run(run())
@@ -0,0 +1,115 @@
+"""
+Check-in rollup increments racing a rebuild of the same user's days.
+
+Uses mongomock-motor (see benchmarks/requirements.txt). Run from the
+`backend` directory:
+
+    python -m pytest tests
+"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from app.services import checkin_rollups  # noqa: E402
+
+USER = "u1"
+DAY = "2024-01-01"
+
+
+class _MergingCollection:
+    """mongomock has no `$merge`: run the stages before it and replace the targets."""
+
+    def __init__(self, collection, database):
+        self._collection = collection
+        self._database = database
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def aggregate(self, pipeline: list[dict]):
+        merge = pipeline[-1].get("$merge")
+        if merge is None:
+            async for doc in self._collection.aggregate(pipeline):
+                yield doc
+            return
+        target = self._database[merge["into"]]
+        async for doc in self._collection.aggregate(pipeline[:-1]):
+            await target.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+
+
+class _Database:
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        collection = getattr(self._database, name)
+        return _MergingCollection(collection, self._database) if name == "mood_checkins" else collection
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = mongomock_motor.AsyncMongoMockClient()
+    database = client["rollups_test"]
+    monkeypatch.setattr(checkin_rollups, "db", _Database(database))
+    return database
+
+
+def _checkin() -> dict:
+    return {"_id": ObjectId(), "user_id": USER, "mood": "happy", "created_at": datetime(2024, 1, 1, 9, 0)}
+
+
+async def _state(db):
+    return await db.checkin_rollup_state.find_one({"_id": USER})
+
+
+async def _happy(db):
+    doc = await db.checkin_daily.find_one({"_id": f"{USER}:{DAY}"})
+    return doc["counts"]["happy"] if doc else 0
+
+
+def test_increment_keeps_a_settled_marker(db):
+    async def run():
+        await checkin_rollups.rebuild_rollups(USER)
+        before = await checkin_rollups.rollup_state(USER)
+        doc = _checkin()
+        await db.mood_checkins.insert_one(doc)
+        await checkin_rollups.apply_checkins(USER, [doc], before)
+        assert await _happy(db) == 1
+        assert (await _state(db)).get("rebuilt_at")
+
+    asyncio.run(run())
+
+
+def test_increment_during_rebuild_is_left_to_the_rebuild(db):
+    async def run():
+        await db.checkin_rollup_state.insert_one({"_id": USER, "generation": 1, "rebuilding": ObjectId()})
+        before = await checkin_rollups.rollup_state(USER)
+        doc = _checkin()
+        await db.mood_checkins.insert_one(doc)
+        await checkin_rollups.apply_checkins(USER, [doc], before)
+        assert await _happy(db) == 0
+        # The running rebuild can no longer mark itself done; the next read rebuilds.
+        assert await _state(db) is None
+
+    asyncio.run(run())
+
+
+def test_rebuild_between_insert_and_increment_counts_once(db):
+    async def run():
+        await checkin_rollups.rebuild_rollups(USER)
+        before = await checkin_rollups.rollup_state(USER)
+        doc = _checkin()
+        await db.mood_checkins.insert_one(doc)
+        # A dashboard read rebuilds completely before the writer increments.
+        await checkin_rollups.rebuild_rollups(USER)
+        assert await _happy(db) == 1
+        await checkin_rollups.apply_checkins(USER, [doc], before)
+
+        counts = await checkin_rollups.daily_mood_counts(USER)
+        assert counts[DAY] == {"happy": 1}
+
+    asyncio.run(run())
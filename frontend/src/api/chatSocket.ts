@@ -0,0 +1,73 @@
+// src/api/chatSocket.ts
+// WebSocket chat transport (backend: /api/chat/ws). Authenticates once with the
+// access token and receives replies, analysis and suggestions as pushed events.
+const BASE_URL = import.meta.env.VITE_BACKEND_URL || "http://127.0.0.1:8001";
+const RECONNECT_MS = 3000;
+const CLOSE_UNAUTHORIZED = 4401;
+
+export type ChatSocketEvent =
+  | { type: "ready"; user_id: string }
+  | {
+      type: "analysis";
+      sentiment_label: string;
+      stress_label: string;
+      stress_score: number;
+      risk_flag: boolean;
+      analysis_source: string;
+    }
+  | { type: "crisis"; crisis_resources: { name: string; contact: string }[] }
+  | { type: "reply"; reply: string; reply_id: string | null; pending: boolean }
+  | { type: "suggestions"; game: { suggested_game: string; reason: string }; exercises: unknown[] }
+  | { type: "rate_limited"; retry_after: number }
+  | { type: "error"; detail: string }
+  | { type: "pong" }
+  // Emitted locally when the connection drops; a reply in flight will not arrive.
+  | { type: "disconnected" };
+
+export type ChatSocket = {
+  isOpen: () => boolean;
+  send: (message: string) => boolean;
+  close: () => void;
+};
+
+export function openChatSocket(onEvent: (event: ChatSocketEvent) => void): ChatSocket | null {
+  const token = localStorage.getItem("access_token") || localStorage.getItem("token");
+  if (!token || typeof WebSocket === "undefined") return null;
+
+  const url = `${BASE_URL.replace(/^http/, "ws")}/api/chat/ws?token=${encodeURIComponent(token)}`;
+  let socket: WebSocket | null = null;
+  let closed = false;
+
+  const connect = () => {
+    socket = new WebSocket(url);
+    socket.onmessage = (msg) => {
+      try {
+        onEvent(JSON.parse(msg.data) as ChatSocketEvent);
+      } catch (err) {
+        console.error(err);
+      }
+    };
+    socket.onclose = (evt) => {
+      socket = null;
+      if (closed) return;
+      onEvent({ type: "disconnected" });
+      if (evt.code !== CLOSE_UNAUTHORIZED) {
+        setTimeout(connect, RECONNECT_MS);
+      }
+    };
+  };
+  connect();
+
+  return {
+    isOpen: () => socket?.readyState === WebSocket.OPEN,
+    send: (message: string) => {
+      if (socket?.readyState !== WebSocket.OPEN) return false;
+      socket.send(JSON.stringify({ type: "message", message }));
+      return true;
+    },
+    close: () => {
+      closed = true;
+      socket?.close();
+    },
+  };
+}
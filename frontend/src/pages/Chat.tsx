@@ -1,5 +1,7 @@
 import { useEffect, useRef, useState } from "react";
 import { apiFetch } from "../api/client";
+import { openChatSocket, type ChatSocket, type ChatSocketEvent } from "../api/chatSocket";
+import CrisisBanner from "../components/CrisisBanner";
 import { EmotionBot, type BotMood } from "../components/EmotionBot";
 import { moodFromSignals } from "../utils/botMood";
 
@@ -23,8 +25,26 @@ type ChatResponse = {
   stress_label: string;
   stress_score: number | null;
   risk_flag: boolean;
+  crisis?: boolean;
+  crisis_resources?: CrisisResource[] | null;
+  reply_pending?: boolean;
+  reply_id?: string | null;
 };
 
+type CrisisResource = {
+  name: string;
+  contact: string;
+};
+
+type ReplyStatus = {
+  reply_id: string;
+  ready: boolean;
+  reply?: string | null;
+};
+
+const REPLY_POLL_MS = 1500;
+const REPLY_POLL_ATTEMPTS = 40;
+
 type RecognitionType = any;
 
 export default function Chat() {
@@ -40,9 +60,22 @@ export default function Chat() {
   const [isListening, setIsListening] = useState(false);
   const [voiceError, setVoiceError] = useState<string | null>(null);
   const [botMood, setBotMood] = useState<BotMood>("neutral");
+  const [crisisResources, setCrisisResources] = useState<CrisisResource[] | null>(null);
+  const [replyPending, setReplyPending] = useState(false);
 
   const recognitionRef = useRef<RecognitionType>(null);
   const messagesEndRef = useRef<HTMLDivElement | null>(null);
+  // Latest messages/setter, for replies that arrive after later renders.
+  const messagesRef = useRef<ChatMessage[]>([]);
+  const setMessagesRef = useRef<(next: ChatMessage[]) => void>(() => {});
+  const socketRef = useRef<ChatSocket | null>(null);
+  const socketEventRef = useRef<(event: ChatSocketEvent) => void>(() => {});
+
+  useEffect(() => {
+    const socket = openChatSocket((event) => socketEventRef.current(event));
+    socketRef.current = socket;
+    return () => socket?.close();
+  }, []);
 
   useEffect(() => {
     const anyWindow = window as any;
@@ -164,6 +197,72 @@ export default function Chat() {
     setBotMood("neutral");
   };
 
+  messagesRef.current = messages;
+  setMessagesRef.current = (next) => setMessagesForCurrent(next);
+
+  const pollPendingReply = async (replyId: string) => {
+    setReplyPending(true);
+    try {
+      for (let attempt = 0; attempt < REPLY_POLL_ATTEMPTS; attempt++) {
+        await new Promise((resolve) => setTimeout(resolve, REPLY_POLL_MS));
+        const status = await apiFetch<ReplyStatus>(`/api/chat/reply/${replyId}`);
+        if (status.ready) {
+          setMessagesRef.current([
+            ...messagesRef.current,
+            { id: replyId, sender: "assistant", text: status.reply || "" },
+          ]);
+          return;
+        }
+      }
+    } catch (err) {
+      console.error(err);
+    } finally {
+      setReplyPending(false);
+    }
+  };
+
+  const appendAssistant = (text: string, id: string = crypto.randomUUID()) => {
+    const next = [...messagesRef.current, { id, sender: "assistant" as const, text }];
+    messagesRef.current = next;
+    setMessagesRef.current(next);
+  };
+
+  socketEventRef.current = (event) => {
+    switch (event.type) {
+      case "analysis":
+        setBotMood(
+          moodFromSignals({
+            sentiment_label: event.sentiment_label,
+            stress_label: event.stress_label,
+            risk_flag: event.risk_flag,
+          })
+        );
+        break;
+      case "crisis":
+        setCrisisResources(event.crisis_resources);
+        break;
+      case "reply":
+        appendAssistant(event.reply, event.reply_id || undefined);
+        setReplyPending(event.pending);
+        setLoading(false);
+        break;
+      case "rate_limited":
+        appendAssistant(`You're sending messages quickly. Please wait about ${Math.ceil(event.retry_after)}s.`);
+        setLoading(false);
+        break;
+      case "error":
+        console.error(event.detail);
+        setLoading(false);
+        break;
+      case "disconnected":
+        if (loading) {
+          appendAssistant("The connection dropped before a reply arrived. Please send your message again.");
+          setLoading(false);
+        }
+        break;
+    }
+  };
+
   const sendMessage = async () => {
     const trimmed = input.trim();
     if (!trimmed || loading) return;
@@ -185,9 +284,13 @@ export default function Chat() {
 
     const nextUserMessages = [...messages, userMessage];
     setMessagesForCurrent(nextUserMessages, trimmed);
+    messagesRef.current = nextUserMessages;
     setInput("");
     setLoading(true);
 
+    // Prefer the open WebSocket; replies then arrive through socketEventRef.
+    if (socketRef.current?.send(trimmed)) return;
+
     try {
       const res = await apiFetch<ChatResponse>("/api/chat/message", {
         method: "POST",
@@ -202,6 +305,13 @@ export default function Chat() {
 
       const withAssistant = [...nextUserMessages, assistantMessage];
       setMessagesForCurrent(withAssistant);
+      messagesRef.current = withAssistant;
+      if (res.crisis) {
+        setCrisisResources(res.crisis_resources || []);
+      }
+      if (res.reply_pending && res.reply_id) {
+        void pollPendingReply(res.reply_id);
+      }
       setBotMood(
         moodFromSignals({
           sentiment_label: res.sentiment_label,
@@ -428,6 +538,21 @@ export default function Chat() {
           </div>
         </div>
 
+        {crisisResources && (
+          <div>
+            <CrisisBanner onClose={() => setCrisisResources(null)} />
+            {crisisResources.length > 0 && (
+              <ul className="mb-3 -mt-2 rounded-b-lg border border-t-0 border-red-200 bg-red-50 px-3 py-2 text-xs text-red-800">
+                {crisisResources.map((r) => (
+                  <li key={r.name}>
+                    <span className="font-semibold">{r.name}:</span> {r.contact}
+                  </li>
+                ))}
+              </ul>
+            )}
+          </div>
+        )}
+
         <div className="flex-1 overflow-y-auto bg-slate-50 rounded-xl p-3 space-y-2">
           {messages.length === 0 && (
             <p className="text-xs text-slate-400 text-center mt-10">
@@ -450,6 +575,7 @@ export default function Chat() {
             </div>
           ))}
 
+          {replyPending && <p className="text-xs text-slate-400">Assistant is writing…</p>}
           <div ref={messagesEndRef} />
         </div>
 
@@ -10,6 +10,10 @@ type DaySummary = {
   date: string;
   avg_sentiment: number;
   avg_stress: number;
+  face_distribution?: Record<string, number> | null;
+  dominant_emotion?: string | null;
+  face_captures?: number;
+  fused_stress?: number | null;
 };
 
 type DashboardSummary = {
@@ -289,6 +293,7 @@ export default function Dashboard() {
                       <th className="text-left px-2 py-1 text-xs text-slate-500">Date</th>
                       <th className="text-left px-2 py-1 text-xs text-slate-500">Avg sentiment</th>
                       <th className="text-left px-2 py-1 text-xs text-slate-500">Avg stress</th>
+                      <th className="text-left px-2 py-1 text-xs text-slate-500">Face</th>
                     </tr>
                   </thead>
                   <tbody>
@@ -301,6 +306,9 @@ export default function Dashboard() {
                         <td className="px-2 py-1">
                           {stressLabel(d.avg_stress)} ({d.avg_stress.toFixed(2)})
                         </td>
+                        <td className="px-2 py-1">
+                          {d.dominant_emotion ? `${d.dominant_emotion} (${d.face_captures})` : "—"}
+                        </td>
                       </tr>
                     ))}
                   </tbody>
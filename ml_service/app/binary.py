@@ -0,0 +1,108 @@
+"""
+Optional msgpack wire format for the backend <-> ml_service hop.
+
+Content negotiation, so JSON clients see no difference:
+
+- a request body sent as `Content-Type: application/x-msgpack` is decoded
+  with msgpack, anything else as JSON;
+- a response is msgpack only when the caller sends
+  `Accept: application/x-msgpack` and msgpack is installed.
+
+Msgpack responses drop the label names. Probabilities are positional lists
+in the order announced once by GET /schema, and labels are indices into
+those lists. Every msgpack response carries the schema id in X-ML-Schema,
+so a client holding a stale schema (say, after a model swap) knows to
+fetch it again. Floats go out as float32.
+
+Row layouts (see pack_analysis / pack_face):
+
+    analysis  [sentiment_idx, sentiment_probs, stress_idx, stress_probs,
+               stress_score, risk_flag, cascade]   cascade: null | [sent_fast, stress_fast]
+    face      [label_idx, scores]
+"""
+import json
+import zlib
+
+from fastapi import HTTPException, Request, Response
+from pydantic import ValidationError
+
+try:
+    import msgpack
+except ImportError:  # optional; JSON keeps working without it
+    msgpack = None
+
+MSGPACK_TYPE = "application/x-msgpack"
+SCHEMA_HEADER = "X-ML-Schema"
+
+# Label order per model, filled in by the modules that load the models.
+LABELS: dict[str, list[str]] = {}
+_schema_id = None
+
+
+def register_labels(name: str, labels: list[str]):
+    global _schema_id
+    LABELS[name] = list(labels)
+    _schema_id = None
+
+
+def schema_id() -> str:
+    global _schema_id
+    if _schema_id is None:
+        _schema_id = format(zlib.crc32(json.dumps(LABELS, sort_keys=True).encode()), "08x")
+    return _schema_id
+
+
+def schema() -> dict:
+    return {"id": schema_id(), "labels": LABELS, "msgpack": msgpack is not None}
+
+
+def wants_msgpack(request: Request) -> bool:
+    return msgpack is not None and MSGPACK_TYPE in request.headers.get("accept", "")
+
+
+async def read_payload(request: Request, model):
+    """Validate a JSON or msgpack request body against a pydantic model."""
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith(MSGPACK_TYPE):
+            if msgpack is None:
+                raise HTTPException(status_code=415, detail="msgpack is not installed on this replica")
+            data = msgpack.unpackb(body)
+        else:
+            data = json.loads(body)
+    except ValueError as e:  # also covers msgpack's unpack errors
+        raise HTTPException(status_code=400, detail=f"Malformed body: {e}")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Body must be an object")
+    try:
+        return model(**data)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
+
+def msgpack_response(payload) -> Response:
+    return Response(
+        content=msgpack.packb(payload, use_single_float=True),
+        media_type=MSGPACK_TYPE,
+        headers={SCHEMA_HEADER: schema_id()},
+    )
+
+
+def pack_analysis(result: dict) -> list:
+    sentiment_classes, stress_classes = LABELS["sentiment"], LABELS["stress"]
+    sent_probs, stress_probs = result["sentiment_probs"], result["stress_probs"]
+    cascade = result.get("cascade")
+    return [
+        sentiment_classes.index(result["sentiment_label"]),
+        [sent_probs[c] for c in sentiment_classes],
+        stress_classes.index(result["stress_label"]),
+        [stress_probs[c] for c in stress_classes],
+        result["stress_score"],
+        result["risk_flag"],
+        [cascade["sentiment"] == "fast", cascade["stress"] == "fast"] if cascade else None,
+    ]
+
+
+def pack_face(label: str, scores: dict) -> list:
+    labels = LABELS["face"]
+    return [labels.index(label), [scores[name] for name in labels]]
@@ -0,0 +1,247 @@
+"""
+Two-stage cascade in front of the BERT text models.
+
+The first stage is a hashed n-gram linear classifier (signed crc32 hashing of
+unigrams and bigrams, like the backend's fallback classifier) distilled from
+logged BERT probabilities by scripts/train_cascade.py. Scoring it is a
+sparse dot product over a few dozen rows of a NumPy weight matrix, so it
+runs in microseconds. The full model runs only where the first stage is
+unsure, decided per model:
+
+- sentiment escalates when the top first-stage probability is below
+  CASCADE_SENTIMENT_CONFIDENCE;
+- stress escalates inside the uncertainty band (CASCADE_STRESS_LOW,
+  CASCADE_STRESS_HIGH), and at or above CASCADE_RISK_CONFIRM. A
+  `risk_flag` therefore always comes from `model_stress`, never from the
+  first stage.
+
+That only holds if every risk case escalates. An artifact carries the
+first-stage stress scores of the held-out BERT risk cases (stress > 0.8)
+it was checked against; it is not loaded unless all of them escalate under
+the configured thresholds, so a band tightened later cannot slip past it.
+
+A CASCADE_SHADOW_RATE share of the messages the first stage handled also
+runs the full models, which measures how often the fast path agrees with
+BERT. GET /cascade reports escalation rates and agreement.
+Without an artifact at CASCADE_MODEL_PATH, or with CASCADE_ENABLED=0,
+every message takes the full path.
+
+With CASCADE_LOG_PATH set, messages scored by both full models are appended
+to a JSONL file as distillation data (collect with CASCADE_ENABLED=0 so the
+sample is not skewed towards hard cases). The file holds raw message text;
+leave it unset outside of data collection.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.metrics import CASCADE_AGREEMENT, CASCADE_DECISIONS
+
+N_FEATURES = 2 ** 18
+# Same order as app.main.sentiment_classes.
+SENTIMENT_CLASSES = ("very_negative", "negative", "neutral", "positive")
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent.parent / "models" / "cascade.npz"
+CASCADE_MODEL_PATH = Path(os.getenv("CASCADE_MODEL_PATH", str(DEFAULT_MODEL_PATH)))
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "1") == "1"
+CASCADE_SENTIMENT_CONFIDENCE = float(os.getenv("CASCADE_SENTIMENT_CONFIDENCE", "0.8"))
+CASCADE_STRESS_LOW = float(os.getenv("CASCADE_STRESS_LOW", "0.2"))
+CASCADE_STRESS_HIGH = float(os.getenv("CASCADE_STRESS_HIGH", "0.6"))
+# Below the 0.8 risk threshold on purpose, leaving room for first-stage error.
+CASCADE_RISK_CONFIRM = float(os.getenv("CASCADE_RISK_CONFIRM", "0.7"))
+CASCADE_SHADOW_RATE = float(os.getenv("CASCADE_SHADOW_RATE", "0.02"))
+CASCADE_LOG_PATH = os.getenv("CASCADE_LOG_PATH")
+CASCADE_LOG_SAMPLE_RATE = float(os.getenv("CASCADE_LOG_SAMPLE_RATE", "1.0"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower().replace("'", "").replace("’", ""))
+
+
+def features(text: str, n_features: int = N_FEATURES) -> tuple[np.ndarray, np.ndarray]:
+    """Signed hashed unigram + bigram counts as (indices, values), L2-normalised."""
+    tokens = tokenize(text)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vec: dict[int, float] = {}
+    for g in grams:
+        h = zlib.crc32(g.encode("utf-8"))
+        idx = h % n_features
+        vec[idx] = vec.get(idx, 0.0) + (1.0 if (h >> 31) & 1 == 0 else -1.0)
+    indices = np.fromiter(vec.keys(), dtype=np.int64, count=len(vec))
+    values = np.fromiter(vec.values(), dtype=np.float32, count=len(vec))
+    norm = float(np.sqrt(values @ values)) or 1.0
+    return indices, values / norm
+
+
+def softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+
+class FirstStage:
+    """Linear heads over hashed features: softmax for sentiment, sigmoid for stress."""
+
+    def __init__(
+        self,
+        sent_w: np.ndarray,
+        sent_b: np.ndarray,
+        stress_w: np.ndarray,
+        stress_b: float,
+        risk_scores: Optional[np.ndarray] = None,
+    ):
+        self.n_features = sent_w.shape[0]
+        self.sent_w = sent_w.astype(np.float32)
+        self.sent_b = sent_b.astype(np.float32)
+        self.stress_w = stress_w.astype(np.float32)
+        self.stress_b = float(stress_b)
+        # First-stage stress scores of the held-out BERT risk cases.
+        self.risk_scores = None if risk_scores is None else risk_scores.astype(np.float32)
+
+    @classmethod
+    def load(cls, path: Path = CASCADE_MODEL_PATH) -> Optional["FirstStage"]:
+        """The artifact at `path`, or None if it is missing or lets a risk case through."""
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            risk_scores = data["risk_scores"] if "risk_scores" in data.files else None
+            model = cls(data["sent_w"], data["sent_b"], data["stress_w"], float(data["stress_b"]), risk_scores)
+        coverage = risk_coverage(model.risk_scores) if model.risk_scores is not None else None
+        if coverage != 1.0:
+            logger.error(
+                "Not loading cascade first stage %s: held-out risk coverage is %s, not 1.0; "
+                "retrain it with scripts/train_cascade.py",
+                path,
+                "unknown" if coverage is None else f"{coverage:.3f}",
+            )
+            return None
+        return model
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        extra = {} if self.risk_scores is None else {"risk_scores": self.risk_scores}
+        np.savez_compressed(
+            path, sent_w=self.sent_w, sent_b=self.sent_b, stress_w=self.stress_w, stress_b=self.stress_b, **extra
+        )
+
+    def predict_features(self, indices: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, float]:
+        sent = softmax(self.sent_b + values @ self.sent_w[indices])
+        stress = float(sigmoid(self.stress_b + values @ self.stress_w[indices]))
+        return sent, stress
+
+    def predict(self, text: str) -> tuple[np.ndarray, float]:
+        """(sentiment probabilities, stress score) for one text."""
+        return self.predict_features(*features(text, self.n_features))
+
+
+def sentiment_needs_full(probs: np.ndarray) -> bool:
+    return float(probs.max()) < CASCADE_SENTIMENT_CONFIDENCE
+
+
+def stress_needs_full(score: float) -> bool:
+    return CASCADE_STRESS_LOW < score < CASCADE_STRESS_HIGH or score >= CASCADE_RISK_CONFIRM
+
+
+def risk_coverage(risk_scores: np.ndarray) -> Optional[float]:
+    """Share of risk cases (by first-stage score) that escalate; None without any."""
+    if not len(risk_scores):
+        return None
+    return sum(stress_needs_full(float(s)) for s in risk_scores) / len(risk_scores)
+
+
+class CascadeStats:
+    """Per-process counters behind GET /cascade (the same numbers go to /metrics)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+
+    def decision(self, model: str, path: str):
+        CASCADE_DECISIONS.labels(model, path).inc()
+        with self._lock:
+            self._counts[(model, path)] += 1
+
+    def agreement(self, model: str, path: str, agree: bool):
+        """path: "fast" for shadowed fast-path answers, "escalated" for band/risk cases."""
+        outcome = "agree" if agree else "disagree"
+        CASCADE_AGREEMENT.labels(model, path, outcome).inc()
+        with self._lock:
+            self._counts[(model, path, outcome)] += 1
+
+    def report(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        models = {}
+        for model in ("sentiment", "stress"):
+            fast = counts.get((model, "fast"), 0)
+            full = counts.get((model, "full"), 0)
+            entry = {
+                "fast": fast,
+                "full": full,
+                "escalation_rate": full / (fast + full) if fast + full else None,
+            }
+            for path in ("fast", "escalated"):
+                agree = counts.get((model, path, "agree"), 0)
+                compared = agree + counts.get((model, path, "disagree"), 0)
+                entry[f"agreement_{path}"] = agree / compared if compared else None
+                entry[f"compared_{path}"] = compared
+            models[model] = entry
+        return models
+
+
+class DistillationLog:
+    """Appends full-model outputs to CASCADE_LOG_PATH as training data for the first stage."""
+
+    def __init__(self, path: Optional[str] = CASCADE_LOG_PATH, sample_rate: float = CASCADE_LOG_SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def write(self, text: str, sentiment_probs: dict, stress_probs: dict):
+        if not self.path or random.random() >= self.sample_rate:
+            return
+        line = json.dumps(
+            {"text": text, "sentiment_probs": sentiment_probs, "stress_probs": stress_probs},
+            ensure_ascii=False,
+        )
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+first_stage = FirstStage.load() if CASCADE_ENABLED else None
+stats = CascadeStats()
+distillation_log = DistillationLog()
+
+if first_stage is not None:
+    logger.info("Cascade first stage loaded from %s", CASCADE_MODEL_PATH)
+
+
+def shadow_sample() -> bool:
+    return random.random() < CASCADE_SHADOW_RATE
+
+
+def config() -> dict:
+    return {
+        "enabled": first_stage is not None,
+        "model_path": str(CASCADE_MODEL_PATH),
+        "sentiment_confidence": CASCADE_SENTIMENT_CONFIDENCE,
+        "stress_band": [CASCADE_STRESS_LOW, CASCADE_STRESS_HIGH],
+        "risk_confirm": CASCADE_RISK_CONFIRM,
+        "shadow_rate": CASCADE_SHADOW_RATE,
+    }
@@ -1,36 +1,82 @@
+import os
 from io import BytesIO
 
 import torch
-from fastapi import APIRouter, File, HTTPException, UploadFile
-from PIL import Image
+from typing import Optional
+
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
 from transformers import AutoImageProcessor, AutoModelForImageClassification
 
+from app.binary import msgpack_response, pack_face, register_labels, wants_msgpack
+from app.metrics import BATCH_SIZE, INFERENCE_SECONDS, TOKENIZE_SECONDS, stage
+
 router = APIRouter()
 
 MODEL_ID = "dima806/facial_emotions_image_detection"
 processor = AutoImageProcessor.from_pretrained(MODEL_ID)
 model = AutoModelForImageClassification.from_pretrained(MODEL_ID)
+register_labels("face", [model.config.id2label[i] for i in range(len(model.config.id2label))])
+
+FACE_MAX_BYTES = int(os.getenv("FACE_MAX_BYTES", str(10 * 1024 * 1024)))
+FACE_MAX_PIXELS = int(os.getenv("FACE_MAX_PIXELS", str(50_000_000)))
+# Shorter side of the model input; the processor resizes to this anyway.
+_size = processor.size
+INPUT_SIDE = _size.get("shortest_edge") or min(_size.get("height", 224), _size.get("width", 224))
+
+
+def decode_image(content: bytes) -> Image.Image:
+    """
+    Decode an upload to RGB at no more than about twice the model's input size.
+
+    JPEGs use draft mode: libjpeg scales by 1/2, 1/4 or 1/8 while decoding,
+    so a 12 MP photo never becomes a full-size bitmap. The processor does
+    the final resize either way. EXIF orientation is applied.
+    """
+    with stage("face_decode"):
+        image = Image.open(BytesIO(content))
+        if image.width * image.height > FACE_MAX_PIXELS:
+            raise ValueError(f"{image.width}x{image.height} exceeds {FACE_MAX_PIXELS} pixels")
+        scale = INPUT_SIDE / min(image.size)
+        if scale < 1:
+            image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+        return ImageOps.exif_transpose(image).convert("RGB")
+
+
+def predict_face_emotion(image: Image.Image):
+    """Run the face model on a decoded RGB image; returns (label, scores)."""
+    with stage("face_preprocess", TOKENIZE_SECONDS.labels("face")):
+        inputs = processor(images=image, return_tensors="pt")
+    BATCH_SIZE.labels("face").observe(1)
+    with stage("face_inference", INFERENCE_SECONDS.labels("face")):
+        with torch.no_grad():
+            outputs = model(**inputs)
+            logits = outputs.logits
+            probs = torch.softmax(logits, dim=-1)[0]
+
+    with stage("face_postprocess"):
+        pred_idx = int(torch.argmax(probs).item())
+        label = model.config.id2label[pred_idx]
+        scores = {model.config.id2label[i]: float(probs[i].item()) for i in range(probs.shape[0])}
+    return label, scores
 
 
 @router.post("/emotion/face")
-async def detect_face_emotion(file: UploadFile = File(...)):
+async def detect_face_emotion(request: Request, file: Optional[UploadFile] = File(None)):
     """
-    Estimate facial emotion from an uploaded image.
+    Estimate facial emotion from an uploaded image: a multipart `file`
+    field, or the raw image as the request body (`Content-Type: image/...`).
     """
+    content = await file.read() if file is not None else await request.body()
+    if len(content) > FACE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {FACE_MAX_BYTES} bytes")
     try:
-        content = await file.read()
-        image = Image.open(BytesIO(content)).convert("RGB")
+        image = await run_in_threadpool(decode_image, content)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid image file")
 
-    inputs = processor(images=image, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**inputs)
-        logits = outputs.logits
-        probs = torch.softmax(logits, dim=-1)[0]
-
-    pred_idx = int(torch.argmax(probs).item())
-    label = model.config.id2label[pred_idx]
-    scores = {model.config.id2label[i]: float(probs[i].item()) for i in range(probs.shape[0])}
-
+    label, scores = await run_in_threadpool(predict_face_emotion, image)
+    if wants_msgpack(request):
+        return msgpack_response(pack_face(label, scores))
     return {"emotion": label, "scores": scores}
@@ -1,13 +1,38 @@
+import logging
 import os
+import time
 from pathlib import Path
-from fastapi import FastAPI
-from app.schemas import AnalyzeRequest, AnalyzeResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from app.schemas import AnalyzeBatchRequest, AnalyzeBatchResponse, AnalyzeRequest, AnalyzeResponse
 import torch
 import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from app.emotion_face import router as emotion_face_router
+from app import binary, cascade
+from app.memory import router as memory_router
+from app.metrics import (
+    BATCH_SIZE,
+    INFERENCE_SECONDS,
+    REQUEST_ID_HEADER,
+    REQUEST_LATENCY,
+    TOKENIZE_SECONDS,
+    render_latest,
+    server_timing_header,
+    stage,
+    start_request,
+)
+from app.windowing import (
+    LONG_INPUT_MODE,
+    MAX_WINDOWS,
+    WINDOW_STRIDE,
+    WindowBatcher,
+    aggregate,
+    fits_single_pass,
+    split_windows,
+)
 
 app = FastAPI(title="ML Service - With Real BERT Models")
+logger = logging.getLogger("app.requests")
 
 # Build absolute paths (as POSIX) to keep huggingface_hub happy on Windows
 BASE_DIR = Path(__file__).resolve().parent            # /ml_service/app
@@ -21,6 +46,14 @@ STRESS_MODEL_PATH = (MODELS_DIR / "bert_stress").as_posix()
 sentiment_classes = ["very_negative", "negative", "neutral", "positive"]
 stress_classes = ["not_stressed", "stressed"]
 
+# Text-only replicas can skip the face model (the backend routes image calls elsewhere).
+LOAD_FACE_MODEL = os.getenv("ML_LOAD_FACE_MODEL", "1") == "1"
+if LOAD_FACE_MODEL:
+    from app.emotion_face import model as emotion_face_model
+    from app.emotion_face import router as emotion_face_router
+else:
+    emotion_face_model = emotion_face_router = None
+
 # Device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -31,46 +64,257 @@ model_sent = AutoModelForSequenceClassification.from_pretrained(SENT_MODEL_PATH)
 tokenizer_stress = AutoTokenizer.from_pretrained(STRESS_MODEL_PATH)
 model_stress = AutoModelForSequenceClassification.from_pretrained(STRESS_MODEL_PATH).to(device)
 
+binary.register_labels("sentiment", sentiment_classes)
+binary.register_labels("stress", stress_classes)
+
+MAX_LENGTH = 128
+ANALYZE_BATCH_MAX = int(os.getenv("ANALYZE_BATCH_MAX", "64"))
+
+def classify_batch(name: str, tokenizer, model, texts: list[str]):
+    """Tokenize and run one padded forward pass; returns an (n, classes) probability array."""
+    with stage(f"{name}_tokenize", TOKENIZE_SECONDS.labels(name)):
+        inputs = tokenizer(
+            texts, return_tensors="pt", truncation=True, max_length=MAX_LENGTH, padding=True
+        ).to(device)
+    BATCH_SIZE.labels(name).observe(len(texts))
+    with stage(f"{name}_inference", INFERENCE_SECONDS.labels(name)):
+        with torch.no_grad():
+            outputs = model(**inputs)
+        probs = F.softmax(outputs.logits, dim=-1).cpu().numpy()
+    return probs
+
+# Long-input mode: how window probabilities are combined per model
+SENTIMENT_WINDOW_AGG = os.getenv("SENTIMENT_WINDOW_AGG", "mean")
+STRESS_WINDOW_AGG = os.getenv("STRESS_WINDOW_AGG", "max")
+
+# The window path tokenizes without truncation or padding. A fast tokenizer
+# keeps those settings in its Rust backend and resets them whenever a call
+# asks for different ones, which fails with "Already borrowed" while another
+# thread is encoding. So each batcher gets its own instance, used only with
+# the window settings, and classify_batch keeps the shared ones to itself.
+sent_batcher = WindowBatcher("sentiment", AutoTokenizer.from_pretrained(SENT_MODEL_PATH), model_sent, device)
+stress_batcher = WindowBatcher("stress", AutoTokenizer.from_pretrained(STRESS_MODEL_PATH), model_stress, device)
+
+def classify_text(name: str, tokenizer, model, batcher, text: str, aggregation: str, risk_index=None):
+    """Probabilities for one text; texts longer than MAX_LENGTH are scored with sliding windows."""
+    if not LONG_INPUT_MODE or fits_single_pass(text, MAX_LENGTH):
+        return classify_batch(name, tokenizer, model, [text])[0]
+
+    with stage(f"{name}_tokenize", TOKENIZE_SECONDS.labels(name)):
+        ids = batcher.tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"]
+    body_len = MAX_LENGTH - batcher.tokenizer.num_special_tokens_to_add()
+    if len(ids) <= body_len:
+        # Fits after all; reuse the ids instead of tokenizing again.
+        with stage(f"{name}_inference"):
+            return batcher.infer([ids])[0]
+
+    windows = split_windows(ids, body_len, WINDOW_STRIDE, MAX_WINDOWS)
+    with stage(f"{name}_inference"):
+        probs = batcher.submit(windows).result()
+    return aggregate(probs, aggregation, risk_index)
+
+def classify_texts(name: str, tokenizer, model, batcher, texts: list[str], aggregation: str, risk_index=None):
+    """classify_text for several texts; the ones that fit in one pass share a padded forward pass."""
+    out = [None] * len(texts)
+    short = [i for i, t in enumerate(texts) if not LONG_INPUT_MODE or fits_single_pass(t, MAX_LENGTH)]
+    if short:
+        for i, probs in zip(short, classify_batch(name, tokenizer, model, [texts[i] for i in short])):
+            out[i] = probs
+    for i, text in enumerate(texts):
+        if out[i] is None:
+            out[i] = classify_text(name, tokenizer, model, batcher, text, aggregation, risk_index)
+    return out
+
+def sentiment_result(probs):
+    with stage("sentiment_postprocess"):
+        idx = int(probs.argmax())
+        return sentiment_classes[idx], {sentiment_classes[i]: float(probs[i]) for i in range(len(probs))}
+
+def stress_result(probs):
+    with stage("stress_postprocess"):
+        idx = int(probs.argmax())
+        stress_score = float(probs[stress_classes.index("stressed")])
+        return (
+            stress_classes[idx],
+            {stress_classes[i]: float(probs[i]) for i in range(len(probs))},
+            stress_score,
+            stress_score > 0.8,
+        )
+
+def predict_sentiments(texts: list[str]):
+    probs = classify_texts(
+        "sentiment", tokenizer_sent, model_sent, sent_batcher, texts, SENTIMENT_WINDOW_AGG,
+        risk_index=sentiment_classes.index("very_negative"),
+    )
+    return [sentiment_result(p) for p in probs]
+
+def predict_stresses(texts: list[str]):
+    probs = classify_texts(
+        "stress", tokenizer_stress, model_stress, stress_batcher, texts, STRESS_WINDOW_AGG,
+        risk_index=stress_classes.index("stressed"),
+    )
+    return [stress_result(p) for p in probs]
+
 def predict_sentiment(text: str):
-    inputs = tokenizer_sent(text, return_tensors="pt", truncation=True, max_length=128).to(device)
-    with torch.no_grad():
-        outputs = model_sent(**inputs)
-    probs = F.softmax(outputs.logits, dim=-1).cpu().numpy().flatten()
-    idx = int(probs.argmax())
-    return sentiment_classes[idx], {sentiment_classes[i]: float(probs[i]) for i in range(len(probs))}
+    return predict_sentiments([text])[0]
 
 def predict_stress(text: str):
-    inputs = tokenizer_stress(text, return_tensors="pt", truncation=True, max_length=128).to(device)
-    with torch.no_grad():
-        outputs = model_stress(**inputs)
-    probs = F.softmax(outputs.logits, dim=-1).cpu().numpy().flatten()
-    idx = int(probs.argmax())
-    stress_score = float(probs[stress_classes.index("stressed")])
-    return (
-        stress_classes[idx],
-        {stress_classes[i]: float(probs[i]) for i in range(len(probs))},
-        stress_score,
-        stress_score > 0.8,
-    )
+    return predict_stresses([text])[0]
+
+def analyze_texts(texts: list[str]) -> list[dict]:
+    """
+    AnalyzeResponse fields per text, going through the cascade (see
+    app/cascade.py): each model's answer comes from the first stage unless it
+    is unsure, and risk is always decided by the full stress model. Texts
+    that escalate to the same full model share its forward passes.
+    """
+    n = len(texts)
+    sentiment, stress = [None] * n, [None] * n
+    fast = [None] * n
+    shadow = [False] * n
+    if cascade.first_stage is not None:
+        with stage("cascade_first_stage"):
+            fast = [cascade.first_stage.predict(t) for t in texts]
+        for i, (fast_sent, fast_stress) in enumerate(fast):
+            shadow[i] = cascade.shadow_sample()
+            if not cascade.sentiment_needs_full(fast_sent):
+                idx = int(fast_sent.argmax())
+                sentiment[i] = (
+                    sentiment_classes[idx],
+                    {c: float(fast_sent[j]) for j, c in enumerate(sentiment_classes)},
+                )
+            if not cascade.stress_needs_full(fast_stress):
+                stress[i] = (
+                    "stressed" if fast_stress >= 0.5 else "not_stressed",
+                    {"not_stressed": 1.0 - fast_stress, "stressed": fast_stress},
+                    fast_stress,
+                    False,
+                )
+
+    # Shadowed messages run the full models too, to measure fast-path agreement.
+    full_sent, full_stress = [None] * n, [None] * n
+    todo = [i for i in range(n) if sentiment[i] is None or shadow[i]]
+    for i, result in zip(todo, predict_sentiments([texts[i] for i in todo]) if todo else []):
+        full_sent[i] = result
+    todo = [i for i in range(n) if stress[i] is None or shadow[i]]
+    for i, result in zip(todo, predict_stresses([texts[i] for i in todo]) if todo else []):
+        full_stress[i] = result
+
+    results = []
+    for i in range(n):
+        if fast[i] is not None:
+            fast_sent, fast_stress = fast[i]
+            accepted = {"sentiment": sentiment[i] is not None, "stress": stress[i] is not None}
+            for model, ok in accepted.items():
+                cascade.stats.decision(model, "fast" if ok else "full")
+            if full_sent[i] is not None:
+                fast_label = sentiment_classes[int(fast_sent.argmax())]
+                cascade.stats.agreement(
+                    "sentiment", "fast" if accepted["sentiment"] else "escalated", fast_label == full_sent[i][0]
+                )
+            if full_stress[i] is not None:
+                fast_label = "stressed" if fast_stress >= 0.5 else "not_stressed"
+                cascade.stats.agreement(
+                    "stress", "fast" if accepted["stress"] else "escalated", fast_label == full_stress[i][0]
+                )
+        if full_sent[i] is not None and full_stress[i] is not None:
+            cascade.distillation_log.write(texts[i], full_sent[i][1], full_stress[i][1])
+
+        sent_label, sent_probs = full_sent[i] or sentiment[i]
+        stress_label, stress_probs, stress_score, risk_flag = full_stress[i] or stress[i]
+        results.append({
+            "sentiment_label": sent_label,
+            "sentiment_probs": sent_probs,
+            "stress_label": stress_label,
+            "stress_probs": stress_probs,
+            "stress_score": stress_score,
+            "risk_flag": risk_flag,
+            "cascade": {
+                "sentiment": "full" if full_sent[i] else "fast",
+                "stress": "full" if full_stress[i] else "fast",
+            } if fast[i] is not None else None,
+        })
+    return results
+
+def analyze_text(text: str) -> dict:
+    return analyze_texts([text])[0]
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    start_request()
+    request_id = request.headers.get(REQUEST_ID_HEADER)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_LATENCY.labels(request.method, route, str(status_code)).observe(
+            time.perf_counter() - start
+        )
+
+    timing = server_timing_header()
+    if timing:
+        response.headers["Server-Timing"] = timing
+        logger.debug("request %s %s: %s", request_id, route, timing)
+    if request_id:
+        response.headers[REQUEST_ID_HEADER] = request_id
+    return response
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
-
-@app.post("/analyze", response_model=AnalyzeResponse)
-def analyze(req: AnalyzeRequest):
-    sent_label, sent_probs = predict_sentiment(req.text)
-    stress_label, stress_probs, stress_score, risk_flag = predict_stress(req.text)
-
-    return AnalyzeResponse(
-        sentiment_label=sent_label,
-        sentiment_probs=sent_probs,
-        stress_label=stress_label,
-        stress_probs=stress_probs,
-        stress_score=stress_score,
-        risk_flag=risk_flag,
-    )
+    # The backend's replica pool reads "models" to route image calls.
+    return {"status": "ok", "models": {"sentiment": True, "stress": True, "face": LOAD_FACE_MODEL}}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/schema")
+def schema():
+    """Label order used by msgpack responses (see app/binary.py)."""
+    return binary.schema()
+
+# The analyze routes read the body themselves so it can be JSON or msgpack;
+# the pydantic models still validate it and document the JSON shape.
+@app.post(
+    "/analyze",
+    response_model=AnalyzeResponse,
+    openapi_extra={"requestBody": {"content": {"application/json": {"schema": AnalyzeRequest.model_json_schema()}}}},
+)
+async def analyze(request: Request):
+    req = await binary.read_payload(request, AnalyzeRequest)
+    result = await run_in_threadpool(analyze_text, req.text)
+    if binary.wants_msgpack(request):
+        return binary.msgpack_response(binary.pack_analysis(result))
+    return result
+
+@app.post(
+    "/analyze/batch",
+    response_model=AnalyzeBatchResponse,
+    openapi_extra={"requestBody": {"content": {"application/json": {"schema": AnalyzeBatchRequest.model_json_schema()}}}},
+)
+async def analyze_batch(request: Request):
+    """Analyze up to ANALYZE_BATCH_MAX texts; escalated texts share forward passes."""
+    req = await binary.read_payload(request, AnalyzeBatchRequest)
+    if len(req.texts) > ANALYZE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {ANALYZE_BATCH_MAX} texts per batch")
+    results = await run_in_threadpool(analyze_texts, req.texts) if req.texts else []
+    if binary.wants_msgpack(request):
+        return binary.msgpack_response([binary.pack_analysis(r) for r in results])
+    return {"results": results}
+
+@app.get("/cascade")
+def cascade_report():
+    """Cascade thresholds plus this process's escalation and agreement counters."""
+    return {"config": cascade.config(), "models": cascade.stats.report()}
 
 
 # Image emotion endpoint
-app.include_router(emotion_face_router, prefix="/api")
+if emotion_face_router is not None:
+    app.include_router(emotion_face_router, prefix="/api")
+
+# Per-process unique vs shared memory (see serve.py)
+app.include_router(memory_router)
@@ -0,0 +1,73 @@
+"""
+Per-process memory report for multi-worker deployments (`serve.py`).
+
+Reads /proc/<pid>/smaps_rollup for this worker, its parent (the preloading
+launcher) and its sibling workers. With preload-then-fork, model weights
+show up as Shared_Clean in every worker, and Private_* is the memory each
+extra worker really costs. Pss splits shared pages evenly between the
+processes that map them, so summing Pss gives the node's real footprint.
+Linux only.
+"""
+import os
+from pathlib import Path
+
+from fastapi import APIRouter
+
+router = APIRouter()
+
+ROLLUP_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_rollup(pid: int) -> dict | None:
+    """smaps_rollup fields in MiB, or None if the process is gone or unreadable."""
+    try:
+        text = Path(f"/proc/{pid}/smaps_rollup").read_text()
+    except OSError:
+        return None
+    values = {}
+    for line in text.splitlines():
+        key, _, rest = line.partition(":")
+        if key in ROLLUP_FIELDS:
+            values[key] = round(int(rest.split()[0]) / 1024, 1)  # kB -> MiB
+    shared = values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0)
+    private = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return {"pid": pid, "rss_mib": values.get("Rss"), "pss_mib": values.get("Pss"),
+            "shared_mib": round(shared, 1), "unique_mib": round(private, 1)}
+
+
+def child_pids(pid: int) -> list[int]:
+    pids: list[int] = []
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            pids += [int(p) for p in (task / "children").read_text().split()]
+        except OSError:
+            continue
+    return sorted(set(pids))
+
+
+def memory_report() -> dict:
+    pid = os.getpid()
+    if read_rollup(pid) is None:
+        return {"available": False, "detail": "/proc/<pid>/smaps_rollup is not readable on this platform"}
+    preloaded = os.environ.get("ML_PRELOADED") == "1"
+    launcher = workers = None
+    if preloaded:
+        parent = os.getppid()
+        launcher = read_rollup(parent)
+        workers = [r for r in (read_rollup(p) for p in child_pids(parent)) if r]
+    workers = workers or [read_rollup(pid)]
+    processes = workers + ([launcher] if launcher else [])
+    return {
+        "available": True,
+        "pid": pid,
+        "preloaded": preloaded,
+        "launcher": launcher,
+        "workers": workers,
+        "total_pss_mib": round(sum(p["pss_mib"] or 0 for p in processes), 1),
+        "total_rss_mib": round(sum(p["rss_mib"] or 0 for p in processes), 1),
+    }
+
+
+@router.get("/memory")
+def memory():
+    return memory_report()
@@ -0,0 +1,97 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+REQUEST_LATENCY = Histogram(
+    "ml_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+TOKENIZE_SECONDS = Histogram(
+    "ml_tokenize_duration_seconds",
+    "Tokenizer time per call",
+    ["model"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+INFERENCE_SECONDS = Histogram(
+    "ml_inference_duration_seconds",
+    "Model forward pass (including softmax) per call",
+    ["model"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+BATCH_SIZE = Histogram(
+    "ml_batch_size",
+    "Number of sequences or images per forward pass",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+CASCADE_DECISIONS = Counter(
+    "ml_cascade_decisions_total",
+    "Text analyses answered by the first stage (fast) or the full model (full)",
+    ["model", "path"],
+)
+
+CASCADE_AGREEMENT = Counter(
+    "ml_cascade_agreement_total",
+    "First-stage vs full-model label agreement where both ran",
+    ["model", "path", "outcome"],
+)
+
+# Stage timings for the current request, returned to callers as Server-Timing.
+_stages: ContextVar[Optional[list]] = ContextVar("stages", default=None)
+
+# Set by enable_profiler_labels() so stages show up in torch.profiler traces.
+_record_function = None
+
+
+def enable_profiler_labels():
+    global _record_function
+    from torch.profiler import record_function
+
+    _record_function = record_function
+
+
+def start_request():
+    _stages.set([])
+
+
+@contextmanager
+def stage(name: str, histogram=None):
+    label = _record_function(name) if _record_function is not None else None
+    if label is not None:
+        label.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if label is not None:
+            label.__exit__(None, None, None)
+        if histogram is not None:
+            histogram.observe(elapsed)
+        stages = _stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def server_timing_header() -> str:
+    return ", ".join(f"{name};dur={s * 1000:.2f}" for name, s in (_stages.get() or []))
+
+
+def render_latest() -> tuple[bytes, str]:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Forked workers (serve.py): merge every worker's samples.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,9 +1,12 @@
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, List, Optional
 
 class AnalyzeRequest(BaseModel):
     text: str
 
+class AnalyzeBatchRequest(BaseModel):
+    texts: List[str]
+
 class AnalyzeResponse(BaseModel):
     sentiment_label: str
     sentiment_probs: Dict[str, float]
@@ -11,3 +14,8 @@ class AnalyzeResponse(BaseModel):
     stress_probs: Dict[str, float]
     stress_score: float
     risk_flag: bool
+    # "fast" (first stage) or "full" (BERT) per model; None without a cascade model
+    cascade: Optional[Dict[str, str]] = None
+
+class AnalyzeBatchResponse(BaseModel):
+    results: List[AnalyzeResponse]
@@ -0,0 +1,143 @@
+"""
+Sliding-window inference for messages longer than the models' max_length.
+
+Long texts are tokenized once without truncation, split into overlapping
+windows and sent to a per-model `WindowBatcher`. The batcher collects
+windows from concurrent requests for a few milliseconds, sorts them by
+length and runs length-bucketed padded forward passes, so a burst of long
+messages costs a handful of batched calls with little padding. Window
+probabilities are then aggregated per request (mean for sentiment, max of
+the risk class for stress).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from app.metrics import BATCH_SIZE, INFERENCE_SECONDS
+
+LONG_INPUT_MODE = os.getenv("LONG_INPUT_MODE", "1") == "1"
+WINDOW_STRIDE = int(os.getenv("WINDOW_STRIDE", "96"))
+MAX_WINDOWS = int(os.getenv("MAX_WINDOWS", "16"))
+WINDOW_BATCH_WAIT_MS = float(os.getenv("WINDOW_BATCH_WAIT_MS", "3"))
+WINDOW_MAX_BATCH = int(os.getenv("WINDOW_MAX_BATCH", "32"))
+
+
+def fits_single_pass(text: str, max_length: int) -> bool:
+    """
+    Cheap upper bound: every WordPiece token covers at least one character,
+    so a text with at most max_length - 2 characters can never be truncated.
+    """
+    return len(text) <= max_length - 2
+
+
+def split_windows(ids: list[int], body_len: int, stride: int, max_windows: int) -> list[list[int]]:
+    """Overlapping windows of at most body_len ids; the last one always ends on the final token."""
+    if len(ids) <= body_len:
+        return [ids]
+    stride = max(1, min(stride, body_len))
+    starts = list(range(0, len(ids) - body_len, stride))
+    starts.append(len(ids) - body_len)
+    if len(starts) > max_windows:
+        # Keep the head and an evenly spaced selection that still reaches the end.
+        picks = np.linspace(0, len(starts) - 1, max_windows).round().astype(int)
+        starts = [starts[i] for i in sorted(set(picks.tolist()))]
+    return [ids[s:s + body_len] for s in starts]
+
+
+def aggregate(probs: np.ndarray, mode: str, risk_index: int | None = None) -> np.ndarray:
+    """Combine per-window probabilities into one distribution."""
+    if probs.shape[0] == 1:
+        return probs[0]
+    if mode == "max":
+        # The most alarming window decides, keeping a proper distribution.
+        return probs[int(probs[:, risk_index].argmax())]
+    return probs.mean(axis=0)
+
+
+class WindowBatcher:
+    """Background micro-batcher that runs windows from many requests together."""
+
+    def __init__(self, name: str, tokenizer, model, device):
+        self.name = name
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, windows: list[list[int]]) -> Future:
+        """Queue token-id windows (without special tokens); resolves to an (n, classes) array."""
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((windows, fut))
+        return fut
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-window-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> list:
+        pending = [self._queue.get()]
+        total = len(pending[0][0])
+        deadline = time.monotonic() + WINDOW_BATCH_WAIT_MS / 1000.0
+        while total < WINDOW_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            total += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            try:
+                results = self.infer([w for windows, _ in pending for w in windows])
+            except Exception as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            offset = 0
+            for windows, fut in pending:
+                fut.set_result(results[offset:offset + len(windows)])
+                offset += len(windows)
+
+    def infer(self, windows: list[list[int]]) -> np.ndarray:
+        """Run windows immediately in the calling thread, bucketed by length."""
+        order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+        out: np.ndarray | None = None
+        for b in range(0, len(order), WINDOW_MAX_BATCH):
+            bucket = order[b:b + WINDOW_MAX_BATCH]
+            encoded = [
+                self.tokenizer.build_inputs_with_special_tokens(windows[i]) for i in bucket
+            ]
+            inputs = self.tokenizer.pad(
+                {"input_ids": encoded}, padding=True, return_tensors="pt"
+            ).to(self.device)
+            BATCH_SIZE.labels(self.name).observe(len(bucket))
+            start = time.perf_counter()
+            with torch.no_grad():
+                logits = self.model(**inputs).logits
+            probs = F.softmax(logits, dim=-1).cpu().numpy()
+            INFERENCE_SECONDS.labels(self.name).observe(time.perf_counter() - start)
+            if out is None:
+                out = np.empty((len(windows), probs.shape[1]), dtype=probs.dtype)
+            out[bucket] = probs
+        return out
@@ -0,0 +1,257 @@
+"""
+Inference microbenchmark for the ml_service models.
+
+Sweeps the text models over sequence length (up to MAX_LENGTH tokens),
+batch size and torch thread count, and the face model over input image
+resolution. Reports latency, throughput, the tokenize / forward /
+postprocess split and peak RSS, and writes everything to a JSON file so
+runs can be compared across model or engine changes.
+
+Run from the `ml_service` directory:
+
+    python -m benchmarks.inference_bench --out bench.json
+    python -m benchmarks.inference_bench --threads 1,4 --profile traces/
+
+`--profile DIR` additionally captures one torch.profiler trace per text
+model and face resolution (Chrome trace format) with the service's stages
+labelled, and stores the per-stage profiler totals in the results.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+
+import torch
+from PIL import Image
+
+from app import metrics
+from app.emotion_face import decode_image, predict_face_emotion
+from app.main import (
+    MAX_LENGTH,
+    classify_batch,
+    model_sent,
+    model_stress,
+    predict_sentiment,
+    predict_stress,
+    tokenizer_sent,
+    tokenizer_stress,
+)
+
+TEXT_MODELS = {
+    "sentiment": (tokenizer_sent, model_sent, predict_sentiment),
+    "stress": (tokenizer_stress, model_stress, predict_stress),
+}
+
+WORDS = (
+    "today i feel tired and a little anxious about work but the walk this "
+    "morning helped me calm down and i want to sleep better tonight"
+).split()
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def text_with_tokens(tokenizer, n_tokens: int, seed: int) -> str:
+    """Build a text that encodes to exactly `n_tokens` tokens including specials."""
+    rng = random.Random(seed)
+    words = [rng.choice(WORDS) for _ in range(n_tokens * 2)]
+    ids = tokenizer(" ".join(words), add_special_tokens=False)["input_ids"]
+    body = max(n_tokens - tokenizer.num_special_tokens_to_add(), 1)
+    return tokenizer.decode(ids[:body])
+
+
+def _collect_stages(fn) -> dict[str, float]:
+    """Run fn once and return the stage durations it recorded."""
+    metrics.start_request()
+    fn()
+    out: dict[str, float] = defaultdict(float)
+    for name, seconds in metrics._stages.get() or []:
+        out[name.split("_", 1)[-1]] += seconds
+    return out
+
+
+def _measure(fn, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    stage_totals: dict[str, float] = defaultdict(float)
+    for _ in range(iterations):
+        start = time.perf_counter()
+        stages = _collect_stages(fn)
+        latencies.append(time.perf_counter() - start)
+        for name, seconds in stages.items():
+            stage_totals[name] += seconds
+    latencies.sort()
+    return {
+        "latency_ms": {
+            "mean": 1000 * statistics.fmean(latencies),
+            "p50": 1000 * latencies[len(latencies) // 2],
+            "p95": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "min": 1000 * latencies[0],
+        },
+        "stages_ms": {k: 1000 * v / iterations for k, v in stage_totals.items()},
+    }
+
+
+def bench_text(args) -> list[dict]:
+    results = []
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for name, (tokenizer, model, predict) in TEXT_MODELS.items():
+            for seq_len in args.seq_lens:
+                seq_len = min(seq_len, MAX_LENGTH)
+                for batch in args.batch_sizes:
+                    texts = [text_with_tokens(tokenizer, seq_len, seed=i) for i in range(batch)]
+                    if batch == 1:
+                        # Single-message path exactly as /analyze runs it.
+                        fn = lambda: predict(texts[0])  # noqa: E731
+                    else:
+                        fn = lambda: classify_batch(name, tokenizer, model, texts)  # noqa: E731
+                    row = _measure(fn, args.iterations, args.warmup)
+                    row.update(
+                        {
+                            "model": name,
+                            "threads": threads,
+                            "seq_len": seq_len,
+                            "batch_size": batch,
+                            "throughput_seq_per_s": batch * 1000 / row["latency_ms"]["mean"],
+                            "peak_rss_mb": peak_rss_mb(),
+                        }
+                    )
+                    results.append(row)
+                    print(
+                        f"{name:<10} threads={threads:<3} len={seq_len:<4} batch={batch:<4} "
+                        f"p50={row['latency_ms']['p50']:8.2f}ms "
+                        f"{row['throughput_seq_per_s']:8.1f} seq/s"
+                    )
+    return results
+
+
+def _jpeg_of_size(width: int, height: int) -> bytes:
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def bench_face(args) -> list[dict]:
+    results = []
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for side in args.resolutions:
+            payload = _jpeg_of_size(side * 4 // 3, side)
+
+            def fn():
+                predict_face_emotion(decode_image(payload))
+
+            row = _measure(fn, args.iterations, args.warmup)
+            row.update(
+                {
+                    "model": "face",
+                    "threads": threads,
+                    "resolution": f"{side * 4 // 3}x{side}",
+                    "jpeg_bytes": len(payload),
+                    "throughput_img_per_s": 1000 / row["latency_ms"]["mean"],
+                    "peak_rss_mb": peak_rss_mb(),
+                }
+            )
+            results.append(row)
+            print(
+                f"{'face':<10} threads={threads:<3} res={row['resolution']:<10} "
+                f"p50={row['latency_ms']['p50']:8.2f}ms decode={row['stages_ms'].get('decode', 0):.2f}ms"
+            )
+    return results
+
+
+def profile(args) -> dict:
+    """Capture torch.profiler traces with the service's stage labels."""
+    from torch.profiler import ProfilerActivity, profile as torch_profile
+
+    metrics.enable_profiler_labels()
+    out_dir = Path(args.profile)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+
+    def capture(label: str, fn) -> dict:
+        for _ in range(args.warmup):
+            fn()
+        with torch_profile(activities=activities, record_shapes=True) as prof:
+            for _ in range(args.iterations):
+                fn()
+        prof.export_chrome_trace(str(out_dir / f"{label}.json"))
+        totals = {}
+        for evt in prof.key_averages():
+            if evt.key.endswith(("_tokenize", "_preprocess", "_inference", "_postprocess", "_decode")):
+                totals[evt.key] = evt.cpu_time_total / 1000 / args.iterations
+        return totals
+
+    traces = {}
+    for name, (tokenizer, _model, predict) in TEXT_MODELS.items():
+        text = text_with_tokens(tokenizer, MAX_LENGTH, seed=0)
+        traces[name] = capture(name, lambda: predict(text))
+    for side in args.resolutions:
+        payload = _jpeg_of_size(side * 4 // 3, side)
+
+        def face_fn():
+            predict_face_emotion(decode_image(payload))
+
+        traces[f"face_{side}p"] = capture(f"face_{side}p", face_fn)
+    return {"trace_dir": str(out_dir), "stage_cpu_ms_per_call": traces}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seq-lens", type=_int_list, default=[8, 16, 32, 64, 128])
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 4, 16, 32])
+    parser.add_argument("--threads", type=_int_list, default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--resolutions", type=_int_list, default=[224, 480, 720, 1080, 2160])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--skip-text", action="store_true")
+    parser.add_argument("--skip-face", action="store_true")
+    parser.add_argument("--profile", metavar="DIR", help="Also capture torch.profiler traces into DIR")
+    parser.add_argument("--out", default="inference_bench.json")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": str(model_sent.device),
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "config": {k: v for k, v in vars(args).items()},
+        },
+        "text": [] if args.skip_text else bench_text(args),
+        "face": [] if args.skip_face else bench_face(args),
+    }
+    if args.profile:
+        results["profile"] = profile(args)
+    results["meta"]["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
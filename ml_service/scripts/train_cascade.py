@@ -0,0 +1,178 @@
+"""
+Distill the cascade's first stage from logged BERT outputs and report thresholds.
+
+Collect data by running ml_service with CASCADE_LOG_PATH=bert_outputs.jsonl
+and CASCADE_ENABLED=0, then, from the `ml_service` directory:
+
+    python -m scripts.train_cascade train bert_outputs.jsonl --out models/cascade.npz
+    python -m scripts.train_cascade report bert_outputs.jsonl
+
+`train` fits both heads on BERT's probabilities (soft targets), holds out a
+fraction of the lines and prints the threshold report on them. `report`
+runs the current artifact over a log. The report lists the escalation rate
+and the agreement with BERT of the final answers for a grid of thresholds.
+It also lists risk coverage: the share of BERT risk cases (stress > 0.8)
+that reach the full stress model, which must stay at 1.0.
+
+`train` refuses to write an artifact unless every held-out risk case
+escalates under the configured CASCADE_* thresholds. The first-stage scores
+of those cases are stored with it, and ml_service re-checks them on load.
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app import cascade
+from app.cascade import N_FEATURES, SENTIMENT_CLASSES, FirstStage, features, sigmoid, softmax
+
+RISK_THRESHOLD = 0.8
+
+
+def load_log(path: Path, limit: int | None = None) -> list[dict]:
+    rows = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+                if limit and len(rows) >= limit:
+                    break
+    return rows
+
+
+def targets(row: dict) -> tuple[np.ndarray, float]:
+    sent = np.array([row["sentiment_probs"].get(c, 0.0) for c in SENTIMENT_CLASSES], dtype=np.float32)
+    return sent, float(row["stress_probs"]["stressed"])
+
+
+def train(rows: list[dict], epochs: int, lr: float, l2: float, n_features: int) -> FirstStage:
+    """Plain SGD on cross-entropy against BERT's probabilities, touching only active rows."""
+    data = [(*features(r["text"], n_features), *targets(r)) for r in rows]
+    sent_w = np.zeros((n_features, len(SENTIMENT_CLASSES)), dtype=np.float32)
+    sent_b = np.zeros(len(SENTIMENT_CLASSES), dtype=np.float32)
+    stress_w = np.zeros(n_features, dtype=np.float32)
+    stress_b = 0.0
+
+    rng = random.Random(0)
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        step = lr / (1 + epoch)
+        for idx, val, t_sent, t_stress in data:
+            rows_w = sent_w[idx]
+            g_sent = softmax(sent_b + val @ rows_w) - t_sent
+            sent_b -= step * g_sent
+            sent_w[idx] = rows_w - step * (np.outer(val, g_sent) + l2 * rows_w)
+
+            w = stress_w[idx]
+            g_stress = float(sigmoid(stress_b + val @ w)) - t_stress
+            stress_b -= step * g_stress
+            stress_w[idx] = w - step * (g_stress * val + l2 * w)
+
+    return FirstStage(sent_w, sent_b, stress_w, stress_b)
+
+
+def threshold_report(model: FirstStage, rows: list[dict]) -> list[dict]:
+    start = time.perf_counter()
+    preds = [model.predict(r["text"]) for r in rows]
+    per_text_us = 1e6 * (time.perf_counter() - start) / max(1, len(rows))
+    teacher = [targets(r) for r in rows]
+
+    fast_sent = np.array([p[0] for p in preds])
+    fast_stress = np.array([p[1] for p in preds])
+    bert_sent = np.array([t[0] for t in teacher])
+    bert_stress = np.array([t[1] for t in teacher])
+    sent_match = fast_sent.argmax(axis=1) == bert_sent.argmax(axis=1)
+    stress_match = (fast_stress >= 0.5) == (bert_stress >= 0.5)
+    bert_risk = bert_stress > RISK_THRESHOLD
+
+    report = []
+    grid = itertools.product((0.6, 0.7, 0.8, 0.9), ((0.1, 0.7), (0.2, 0.6), (0.3, 0.5)), (0.6, 0.7))
+    for confidence, (low, high), risk_confirm in grid:
+        sent_full = fast_sent.max(axis=1) < confidence
+        stress_full = ((fast_stress > low) & (fast_stress < high)) | (fast_stress >= risk_confirm)
+        report.append({
+            "sentiment_confidence": confidence,
+            "stress_band": (low, high),
+            "risk_confirm": risk_confirm,
+            "sentiment_escalation": float(sent_full.mean()),
+            "stress_escalation": float(stress_full.mean()),
+            # Escalated answers come from BERT itself, so they always agree.
+            "sentiment_agreement": float((sent_full | sent_match).mean()),
+            "stress_agreement": float((stress_full | stress_match).mean()),
+            "risk_coverage": float(stress_full[bert_risk].mean()) if bert_risk.any() else None,
+            "first_stage_us": per_text_us,
+        })
+    return report
+
+
+def print_report(title: str, report: list[dict]):
+    print(f"\n{title}")
+    print(f"  {'conf':>5} {'band':>11} {'risk':>5} {'sent esc':>9} {'sent agr':>9} "
+          f"{'str esc':>8} {'str agr':>8} {'risk cov':>9}")
+    for r in report:
+        coverage = "n/a" if r["risk_coverage"] is None else f"{r['risk_coverage']:.3f}"
+        print(
+            f"  {r['sentiment_confidence']:>5.2f} {str(r['stress_band']):>11} {r['risk_confirm']:>5.2f} "
+            f"{r['sentiment_escalation']:>9.3f} {r['sentiment_agreement']:>9.3f} "
+            f"{r['stress_escalation']:>8.3f} {r['stress_agreement']:>8.3f} {coverage:>9}"
+        )
+    if report:
+        print(f"  first stage: {report[0]['first_stage_us']:.1f} µs per text")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("log", type=Path, help="JSONL written via CASCADE_LOG_PATH")
+    parser.add_argument("--out", type=Path, default=cascade.CASCADE_MODEL_PATH)
+    parser.add_argument("--limit", type=int, help="Use at most this many lines")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-6)
+    parser.add_argument("--features", type=int, default=N_FEATURES)
+    args = parser.parse_args()
+
+    rows = load_log(args.log, args.limit)
+    print(f"Loaded {len(rows)} logged BERT outputs")
+    if not rows:
+        return
+
+    if args.command == "report":
+        model = FirstStage.load(args.out)
+        if model is None:
+            raise SystemExit(f"No usable cascade model at {args.out}")
+        print_report(f"Thresholds for {args.out}", threshold_report(model, rows))
+        return
+
+    random.Random(42).shuffle(rows)
+    cut = int(len(rows) * (1 - args.holdout))
+    model = train(rows[:cut], args.epochs, args.lr, args.l2, args.features)
+    held_out = rows[cut:]
+    if held_out:
+        print_report("Held-out thresholds", threshold_report(model, held_out))
+
+    model.risk_scores = np.array(
+        [model.predict(r["text"])[1] for r in held_out if targets(r)[1] > RISK_THRESHOLD], dtype=np.float32
+    )
+    coverage = cascade.risk_coverage(model.risk_scores)
+    if coverage is None:
+        raise SystemExit("No held-out risk cases to check risk coverage against; log more data or raise --holdout")
+    if coverage < 1.0:
+        missed = len(model.risk_scores) - round(coverage * len(model.risk_scores))
+        raise SystemExit(
+            f"Held-out risk coverage is {coverage:.3f} ({missed} of {len(model.risk_scores)} risk cases "
+            f"would skip the full stress model) with band ({cascade.CASCADE_STRESS_LOW}, "
+            f"{cascade.CASCADE_STRESS_HIGH}) and risk_confirm {cascade.CASCADE_RISK_CONFIRM}; not writing {args.out}"
+        )
+    model.save(args.out)
+    print(f"Wrote {args.out} ({args.out.stat().st_size / 1024:.1f} KiB), "
+          f"risk coverage 1.0 over {len(model.risk_scores)} held-out risk cases")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Multi-worker launcher that loads the models once and shares them.
+
+    python serve.py --workers 4 --port 8002
+
+Plain `uvicorn --workers N` imports app.main in every worker, so each one
+holds its own copy of both BERT models and the ViT face model. Here the
+parent imports the app (loading all weights), freezes the garbage
+collector so the preloaded objects are never written to again, binds the
+socket and then forks the workers. Tensor storage stays in copy-on-write
+pages that every worker shares read-only, so an extra worker costs its
+private heap rather than another set of weights. GET /memory shows the
+unique vs shared split per worker.
+
+Nothing runs inference before the fork (the window batchers start their
+threads lazily), which keeps torch's thread pools out of the parent.
+Each worker gets cores/workers intra-op threads unless ML_TORCH_THREADS
+is set. Crashed workers are restarted; SIGINT/SIGTERM stop everything.
+Linux/macOS only (needs os.fork).
+
+Metrics run in prometheus_client's multiprocess mode: every worker writes
+its samples to PROMETHEUS_MULTIPROC_DIR (a fresh temporary directory unless
+set), and /metrics merges all workers, whichever one answers.
+"""
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger("serve")
+
+
+def metrics_dir() -> str:
+    """Point prometheus_client at a clean multiprocess directory; must run before it is imported."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)  # samples of a previous run
+        os.makedirs(path)
+    else:
+        path = tempfile.mkdtemp(prefix="ml_service_metrics_")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def preload():
+    os.environ["ML_PRELOADED"] = "1"
+    import torch
+
+    from app import main
+
+    for model in (main.model_sent, main.model_stress, main.emotion_face_model):
+        if model is None:
+            continue
+        model.eval()
+        model.requires_grad_(False)
+    gc.collect()
+    gc.freeze()  # keep the collector from touching (and un-sharing) preloaded objects
+    return main.app, torch
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, torch, sock: socket.socket, threads: int):
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    torch.set_num_threads(threads)
+    config = uvicorn.Config(app, log_level="info", access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+    os._exit(0)
+
+
+def spawn(app, torch, sock, threads) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, torch, sock, threads)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ml_service with preloaded, shared model weights.")
+    parser.add_argument("--host", default=os.getenv("ML_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("ML_PORT", "8002")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("ML_WORKERS", str(os.cpu_count() or 1))))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    threads = int(os.getenv("ML_TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 1) // args.workers)
+    logger.info("Multiprocess metrics in %s", metrics_dir())
+    start = time.perf_counter()
+    app, torch = preload()
+    logger.info("Models loaded in %.1fs; starting %d workers x %d threads", time.perf_counter() - start,
+                args.workers, threads)
+    sock = bind(args.host, args.port)
+    # Imported only now: prometheus_client picks its value backend at import
+    # time, which has to happen after metrics_dir().
+    from prometheus_client import multiprocess
+
+    workers = {spawn(app, torch, sock, threads) for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        multiprocess.mark_process_dead(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with status %d, restarting", pid, status)
+            time.sleep(1)
+            workers.add(spawn(app, torch, sock, threads))
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())